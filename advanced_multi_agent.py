@@ -1,12 +1,8 @@
 import os
-import time
 import logging
-from crewai import Agent, Task, Crew, Process
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 
-# 配置日志
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# crewai、langchain等较重的依赖在首次使用时才导入，导入本模块不会创建模型、智能体或团队
 logger = logging.getLogger(__name__)
 
 # 加载环境变量
@@ -15,36 +11,52 @@ load_dotenv()
 # 设置API密钥和代理配置
 moonshot_api_key = os.getenv("MOONSHOT_API_KEY")
 moonshot_model_name = os.getenv("MOONSHOT_MODEL_NAME", "moonshot-v1-8k")
+# OpenAI兼容接口地址，可指向本地的mock_moonshot_server.py做离线运行和压测
+moonshot_base_url = os.getenv("MOONSHOT_BASE_URL", "https://api.moonshot.cn/v1")
+
+# 配置代理支持（在创建共享HTTP客户端之前调用，httpx在创建时读取代理环境变量）
+def configure_proxy():
+    proxy_url = os.getenv("HTTP_PROXY")
+    if proxy_url:
+        logger.info(f"已配置代理: {proxy_url}")
+        os.environ["HTTP_PROXY"] = proxy_url
+        os.environ["HTTPS_PROXY"] = proxy_url
+        os.environ["http_proxy"] = proxy_url
+        os.environ["https_proxy"] = proxy_url
 
-if not moonshot_api_key or moonshot_api_key == "sk-your-actual-api-key-here":
-    logger.warning("警告: 未设置有效的Kimi API密钥，请在.env文件中配置您的实际MOONSHOT_API_KEY")
-    logger.warning("示例: MOONSHOT_API_KEY=sk-abcdef1234567890abcdef1234567890abcdef1234567890")
+# 初始化Kimi模型
+def get_kimi_llm(role=None):
+    """初始化Kimi大语言模型（使用OpenAI兼容接口）
 
-# 配置代理支持
-proxy_url = os.getenv("HTTP_PROXY")
-if proxy_url:
-    logger.info(f"已配置代理: {proxy_url}")
-    os.environ["HTTP_PROXY"] = proxy_url
-    os.environ["HTTPS_PROXY"] = proxy_url
-    os.environ["http_proxy"] = proxy_url
-    os.environ["https_proxy"] = proxy_url
+    每个请求按提示词大小路由到合适的模型，role用于按角色覆盖路由（MODEL_ROUTING_OVERRIDES）。
+    """
+    from kimi_llm import KimiChatOpenAI
+    from llm_cache import enable_llm_cache_from_env
+    from http_pool import get_shared_http_client, get_shared_async_http_client
+    from model_router import get_shared_model_router
 
-# 初始化Kimi模型
-def get_kimi_llm():
-    """初始化Kimi大语言模型（使用OpenAI兼容接口）"""
     try:
+        configure_proxy()
         logger.info(f"正在初始化Kimi模型: {moonshot_model_name}")
         # 设置环境变量以便crewai能够正确使用Kimi API
         os.environ["OPENAI_API_KEY"] = moonshot_api_key
-        os.environ["OPENAI_BASE_URL"] = "https://api.moonshot.cn/v1"
+        os.environ["OPENAI_BASE_URL"] = moonshot_base_url
         os.environ["OPENAI_MODEL_NAME"] = moonshot_model_name
         
-        # 使用OpenAI兼容接口调用Kimi模型
-        kimi_llm = ChatOpenAI(
+        # 按配置启用LLM响应缓存（LLM_CACHE_ENABLED=true）
+        enable_llm_cache_from_env()
+        
+        # 使用OpenAI兼容接口调用Kimi模型，真正发出的请求会经过共享限流器
+        kimi_llm = KimiChatOpenAI(
             model_name=moonshot_model_name,
             api_key=moonshot_api_key,
-            base_url="https://api.moonshot.cn/v1",
-            temperature=0.7
+            base_url=moonshot_base_url,
+            temperature=0.7,
+            http_client=get_shared_http_client(),
+            # 在事件循环中创建时（例如batch_runner --async），异步请求复用该事件循环的共享连接池
+            http_async_client=get_shared_async_http_client(),
+            model_router=get_shared_model_router(),
+            agent_role=role
         )
         logger.info("Kimi模型初始化成功")
         return kimi_llm
@@ -52,85 +64,115 @@ def get_kimi_llm():
         logger.error(f"初始化Kimi模型失败: {str(e)}")
         raise
 
-# 初始化模型
-kimi_llm = get_kimi_llm()
-
-# 创建专业领域专家智能体
-researcher = Agent(
-    role="AI研究员",
-    goal="深入研究前沿AI技术并提供创新解决方案",
-    backstory="你是一位在人工智能领域拥有10年经验的资深研究员，发表过20+篇学术论文。",
-    verbose=True,
-    allow_delegation=True,
-    llm=kimi_llm
-)
-
-content_strategist = Agent(
-    role="内容策略专家",
-    goal="创建有影响力的AI产品内容策略",
-    backstory="你曾在多家科技公司担任内容总监，擅长将复杂技术转化为吸引人的内容。",
-    verbose=True,
-    allow_delegation=True,
-    llm=kimi_llm
-)
-
-marketing_expert = Agent(
-    role="市场营销专家",
-    goal="制定有效的产品推广策略",
-    backstory="你是一位屡获殊荣的营销专家，擅长AI产品的市场定位和用户获取。",
-    verbose=True,
-    allow_delegation=True,
-    llm=kimi_llm
-)
-
-data_analyst = Agent(
-    role="数据分析师",
-    goal="通过数据分析驱动产品决策",
-    backstory="你是一位精通数据科学的分析师，善于从复杂数据中提取有价值的洞见。",
-    verbose=True,
-    allow_delegation=True,
-    llm=kimi_llm
-)
-
-# 定义高级任务
-task_research = Task(
-    description="研究2024年AI领域的最新趋势和技术突破，重点关注多模态AI、自主AI代理和行业应用。",
-    expected_output="一份详细的研究报告，包含关键技术趋势、主要研究机构进展和商业应用机会。",
-    agent=researcher
-)
-
-task_content = Task(
-    description="基于研究报告，设计一个全面的内容策略，包括目标受众、内容形式和分发渠道。",
-    expected_output="内容策略文档，包含内容日历、关键信息点和内容创作指南。",
-    agent=content_strategist,
-    context=[task_research]
-)
-
-task_marketing = Task(
-    description="制定针对不同市场的AI产品推广策略，包括定价模型、合作伙伴计划和用户增长策略。",
-    expected_output="市场营销计划，包含市场细分分析、竞争对手分析和推广活动时间表。",
-    agent=marketing_expert,
-    context=[task_research, task_content]
-)
-
-task_analytics = Task(
-    description="设计数据分析框架，用于跟踪产品性能、用户行为和市场反馈。",
-    expected_output="数据分析方案，包含关键绩效指标、数据收集方法和报告模板。",
-    agent=data_analyst,
-    context=[task_marketing]
-)
+# 默认的研究简报；批量执行时每条简报的字段填入智能体目标和任务描述（见batch_runner.py）
+DEFAULT_BRIEF = {"topic": "AI", "year": "2024", "focus": "多模态AI、自主AI代理和行业应用", "requirements": ""}
 
 # 创建高级团队
-advanced_crew = Crew(
-    agents=[researcher, content_strategist, marketing_expert, data_analyst],
-    tasks=[task_research, task_content, task_marketing, task_analytics],
-    process=Process.hierarchical,
-    manager_llm=kimi_llm,
-    verbose=2
-)
+def create_advanced_crew(llm=None, brief=None):
+    """创建层级模式的高级团队：四个可相互委派的专家智能体和四个任务，每次调用都返回新的实例
+
+    未指定llm时为每个智能体和管理者创建Kimi模型，指定时全部共用。brief中的字段覆盖DEFAULT_BRIEF，
+    requirements（非空时）作为补充要求附在研究任务之后。
+    """
+    from crewai import Agent, Task, Crew, Process
+    from crew_tracing import instrument_crew
+    from crew_manager import set_manager_llm
+    from context_budget import ContextBudget, apply_context_budget, llm_summarizer
+
+    # 未指定llm时每个角色使用各自的模型实例，以便按角色路由和统计
+    llm_for = (lambda role: llm) if llm is not None else get_kimi_llm
+    fields = {**DEFAULT_BRIEF, **(brief or {})}
+    requirements = f"\n补充要求：{fields['requirements']}" if fields["requirements"] else ""
+    
+    # 创建专业领域专家智能体
+    researcher = Agent(
+        role="AI研究员",
+        goal="深入研究前沿{topic}技术并提供创新解决方案".format_map(fields),
+        backstory="你是一位在人工智能领域拥有10年经验的资深研究员，发表过20+篇学术论文。",
+        verbose=True,
+        allow_delegation=True,
+        llm=llm_for("AI研究员")
+    )
+
+    content_strategist = Agent(
+        role="内容策略专家",
+        goal="创建有影响力的{topic}产品内容策略".format_map(fields),
+        backstory="你曾在多家科技公司担任内容总监，擅长将复杂技术转化为吸引人的内容。",
+        verbose=True,
+        allow_delegation=True,
+        llm=llm_for("内容策略专家")
+    )
+
+    marketing_expert = Agent(
+        role="市场营销专家",
+        goal="制定有效的产品推广策略",
+        backstory="你是一位屡获殊荣的营销专家，擅长AI产品的市场定位和用户获取。",
+        verbose=True,
+        allow_delegation=True,
+        llm=llm_for("市场营销专家")
+    )
+
+    data_analyst = Agent(
+        role="数据分析师",
+        goal="通过数据分析驱动产品决策",
+        backstory="你是一位精通数据科学的分析师，善于从复杂数据中提取有价值的洞见。",
+        verbose=True,
+        allow_delegation=True,
+        llm=llm_for("数据分析师")
+    )
+
+    # 定义高级任务
+    task_research = Task(
+        description="研究{year}年{topic}领域的最新趋势和技术突破，重点关注{focus}。".format_map(fields) + requirements,
+        expected_output="一份详细的研究报告，包含关键技术趋势、主要研究机构进展和商业应用机会。",
+        agent=researcher
+    )
+
+    task_content = Task(
+        description="基于研究报告，设计一个全面的内容策略，包括目标受众、内容形式和分发渠道。",
+        expected_output="内容策略文档，包含内容日历、关键信息点和内容创作指南。",
+        agent=content_strategist,
+        context=[task_research]
+    )
+
+    task_marketing = Task(
+        description="制定针对不同市场的{topic}产品推广策略，包括定价模型、合作伙伴计划和用户增长策略。".format_map(fields),
+        expected_output="市场营销计划，包含市场细分分析、竞争对手分析和推广活动时间表。",
+        agent=marketing_expert,
+        context=[task_research, task_content]
+    )
+
+    task_analytics = Task(
+        description="设计数据分析框架，用于跟踪产品性能、用户行为和市场反馈。",
+        expected_output="数据分析方案，包含关键绩效指标、数据收集方法和报告模板。",
+        agent=data_analyst,
+        context=[task_marketing]
+    )
+
+    advanced_crew = Crew(
+        agents=[researcher, content_strategist, marketing_expert, data_analyst],
+        tasks=[task_research, task_content, task_marketing, task_analytics],
+        process=Process.hierarchical,
+        verbose=2
+    )
+    # CrewAI 0.5.0的Crew不接受manager_llm，管理者的模型在这里单独指定
+    set_manager_llm(advanced_crew, llm_for("manager"))
+    # 链路追踪：kickoff、任务、智能体步骤、委派和LLM调用的span写入TRACE_EXPORT_PATH
+    instrument_crew(advanced_crew)
+    # 上游任务的输出按CONTEXT_BUDGET_TOKENS压缩后再注入下游任务，摘要按上游输出缓存
+    apply_context_budget(advanced_crew, ContextBudget.from_env(moonshot_model_name, llm_summarizer(llm_for("context_budget"))))
+    return advanced_crew
 
 # 运行高级团队
-if __name__ == "__main__":
+def main():
+    from checkpoint_store import TaskCheckpointer
+    from llm_retry import classify_error, retry_budget
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not moonshot_api_key or moonshot_api_key == "sk-your-actual-api-key-here":
+        logger.warning("警告: 未设置有效的Kimi API密钥，请在.env文件中配置您的实际MOONSHOT_API_KEY")
+        logger.warning("示例: MOONSHOT_API_KEY=sk-abcdef1234567890abcdef1234567890abcdef1234567890")
+    
     print("启动高级多智能体协作系统 (使用Kimi大模型)...")
     print(f"当前使用模型: {moonshot_model_name}")
     print("提示: 如果遇到连接问题，请检查：")
@@ -138,35 +180,38 @@ if __name__ == "__main__":
     print("2. 是否需要配置代理环境变量：HTTP_PROXY和HTTPS_PROXY")
     print("3. 网络连接是否稳定\n")
     
-    max_retries = 3
-    retry_count = 0
     result = None
+    # 失败的LLM请求在调用内按错误类型重试（本次运行的所有调用共用LLM_RETRY_BUDGET次重试）；
+    # 仍然失败时，已完成任务的输出保存在检查点中，重新运行时只执行未完成的任务
+    checkpointer = TaskCheckpointer(os.getenv("CREW_EXECUTION_ID", "advanced_multi_agent"))
+    advanced_crew = create_advanced_crew()
+    all_tasks = list(advanced_crew.tasks)
     
-    while retry_count < max_retries:
-        try:
-            result = advanced_crew.kickoff()
-            break  # 成功执行，退出重试循环
-        except Exception as e:
-            retry_count += 1
-            error_msg = str(e)
-            logger.error(f"执行出错 (第{retry_count}/{max_retries}次尝试): {error_msg}")
-            
-            # 提供更友好的错误提示
-            if "timeout" in error_msg.lower():
-                print(f"\n错误: 连接超时，请检查网络连接或API密钥是否正确")
-                print("提示: 如果您在需要代理的环境中，可以在.env文件中添加代理配置：")
-                print("HTTP_PROXY=http://your-proxy-server:port")
-                print("HTTPS_PROXY=http://your-proxy-server:port")
-            elif "authentication" in error_msg.lower() or "api_key" in error_msg.lower():
-                print(f"\n错误: API密钥认证失败，请检查.env文件中的API密钥是否正确")
-            
-            if retry_count < max_retries:
-                wait_time = 2 ** retry_count  # 指数退避
-                print(f"\n{wait_time}秒后重试...")
-                time.sleep(wait_time)
-            else:
-                print("\n已达到最大重试次数，请解决上述问题后重试")
+    try:
+        with retry_budget():
+            result = checkpointer.kickoff(advanced_crew, all_tasks)
+    except Exception as e:
+        kind = classify_error(e)
+        logger.error(f"执行出错（{kind}）: {str(e)}")
+        
+        # 按错误类型给出提示
+        if kind in ("timeout", "connection"):
+            print(f"\n错误: 连接超时或失败，请检查网络连接或API密钥是否正确")
+            print("提示: 如果您在需要代理的环境中，可以在.env文件中添加代理配置：")
+            print("HTTP_PROXY=http://your-proxy-server:port")
+            print("HTTPS_PROXY=http://your-proxy-server:port")
+        elif kind == "auth":
+            print(f"\n错误: API密钥认证失败，请检查.env文件中的API密钥是否正确")
+        elif kind == "quota":
+            print(f"\n错误: 账户额度不足或已被暂停，请检查Moonshot账户")
+        elif kind in ("rate_limit", "overloaded"):
+            print(f"\n错误: 接口持续限流，请调低MOONSHOT_RPM_LIMIT后重试")
+        print("\n已完成任务的输出已保存为检查点，解决上述问题后重新运行会从未完成的任务继续")
     
     if result:
         print("\n高级协作任务完成！")
-        print(result)
\ No newline at end of file
+        print(result)
+
+
+if __name__ == "__main__":
+    main()
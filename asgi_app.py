@@ -0,0 +1,167 @@
+"""AI智能体协作系统的ASGI入口
+
+实时相关的接口（/api/events、/api/executions/<id>/events、/api/execution-data、/api/start-execution）
+由事件循环直接处理：
+SSE连接在等待事件时不占用线程，单个进程即可维持数千个空闲的监控页面。
+其余页面交给Flask应用处理。
+
+团队执行同样在服务的事件循环中运行（应用启动时关联到执行注册表），等待LLM响应时不占用线程；
+应用关闭时取消仍在运行的执行，并关闭该事件循环的共享异步连接池。
+
+运行方式（执行状态保存在进程内存中，只能使用单个worker；需要更多执行能力时设置EXECUTION_BACKEND=queue，
+由worker.py启动的工作进程运行执行）：
+    uvicorn asgi_app:application --host 0.0.0.0 --port 5003 --workers 1
+"""
+import json
+import asyncio
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+import crewai_web_app
+from http_pool import aclose_shared_async_http_client
+from response_utils import gzip_body
+
+flask_application = WsgiToAsgi(crewai_web_app.app)
+
+
+def _query_param(scope, name):
+    values = parse_qs(scope.get("query_string", b"").decode("utf-8")).get(name)
+    return values[0] if values else None
+
+
+def _header(scope, name):
+    name = name.lower().encode("latin-1")
+    for key, value in scope.get("headers", []):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _send_json(send, data, status=200):
+    await _send_json_body(send, json.dumps(data, ensure_ascii=False).encode("utf-8"), status)
+
+
+async def _send_json_body(send, body, status=200, etag=None, accept_encoding=None):
+    """发送已序列化的JSON；body为None时只发送状态和ETag（304），较大的内容按Accept-Encoding压缩"""
+    body = body or b""
+    headers = [(b"content-type", b"application/json; charset=utf-8"), (b"vary", b"Accept-Encoding")]
+    if etag:
+        headers.append((b"etag", etag.encode("latin-1")))
+    compressed = gzip_body(body, accept_encoding) if status == 200 else None
+    if compressed is not None:
+        body = compressed
+        headers.append((b"content-encoding", b"gzip"))
+    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+def _execution_events_id(path):
+    """从 /api/executions/<id>/events 中取出执行ID，其他路径返回None"""
+    prefix, suffix = "/api/executions/", "/events"
+    if path and path.startswith(prefix) and path.endswith(suffix):
+        execution_id = path[len(prefix):-len(suffix)]
+        if execution_id and "/" not in execution_id:
+            return execution_id
+    return None
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def stream_events(scope, receive, send, broadcaster):
+    """SSE端点：阻塞等待事件到达而不是轮询，空闲时按间隔发送心跳"""
+    event_types = _query_param(scope, "types")
+    last_event_id = _header(scope, "last-event-id") or _query_param(scope, "last_event_id")
+    subscription = broadcaster.subscribe_async(
+        event_types=event_types.split(",") if event_types else None,
+        agent=_query_param(scope, "agent"),
+        last_event_id=int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    )
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [
+            (b"content-type", b"text/event-stream; charset=utf-8"),
+            (b"cache-control", b"no-cache"),
+            # 关闭nginx等反向代理的响应缓冲
+            (b"x-accel-buffering", b"no")
+        ]
+    })
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    try:
+        while True:
+            next_event = asyncio.ensure_future(subscription.aget(timeout=crewai_web_app.sse_heartbeat_seconds))
+            await asyncio.wait({next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+            if disconnected.done():
+                next_event.cancel()
+                break
+            payload = next_event.result()
+            await send({
+                "type": "http.response.body",
+                "body": (payload if payload is not None else ": keep-alive\n\n").encode("utf-8"),
+                "more_body": True
+            })
+    except OSError:
+        # 客户端已断开
+        pass
+    finally:
+        disconnected.cancel()
+        subscription.close()
+
+
+async def shutdown_executions(registry, timeout=5):
+    """取消排队中和运行中的执行，等待它们在timeout秒内退出；执行在工作进程中运行时不取消"""
+    if getattr(registry, "remote", False):
+        return
+    tasks = []
+    for execution in registry.list():
+        if registry.cancel(execution.execution_id) and execution.task is not None:
+            tasks.append(execution.task)
+    if tasks:
+        await asyncio.wait(tasks, timeout=timeout)
+
+
+async def application(scope, receive, send):
+    """ASGI应用入口"""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                crewai_web_app.execution_registry.attach_loop(asyncio.get_running_loop())
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await shutdown_executions(crewai_web_app.execution_registry)
+                await aclose_shared_async_http_client()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    path = scope.get("path")
+    method = scope.get("method")
+    if scope["type"] == "http" and path == "/api/events" and method == "GET":
+        await stream_events(scope, receive, send, crewai_web_app.event_broadcaster)
+    elif scope["type"] == "http" and _execution_events_id(path) and method == "GET":
+        execution = crewai_web_app.execution_registry.get(_execution_events_id(path))
+        if execution is None:
+            await _send_json(send, {"status": "error", "message": "执行不存在"}, status=404)
+        else:
+            await stream_events(scope, receive, send, execution.broadcaster)
+    elif scope["type"] == "http" and path == "/api/execution-data" and method == "GET":
+        since = _query_param(scope, "since")
+        # 历史执行需要读取SQLite存储，放到线程中执行以免阻塞事件循环
+        status, body, etag = await asyncio.to_thread(
+            crewai_web_app.execution_data_response,
+            _query_param(scope, "execution_id"),
+            int(since) if since and since.isdigit() else None,
+            _header(scope, "if-none-match")
+        )
+        await _send_json_body(send, body, status, etag, _header(scope, "accept-encoding"))
+    elif scope["type"] == "http" and path == "/api/start-execution" and method == "POST":
+        await _send_json(send, crewai_web_app.start_execution_in_background())
+    else:
+        await flask_application(scope, receive, send)
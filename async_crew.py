@@ -0,0 +1,324 @@
+"""异步执行团队：kickoff_async在事件循环中执行团队，智能体通过LLM的异步接口发出请求
+
+CrewAI 0.5.0只提供阻塞的kickoff，每个进行中的执行都要占用一个线程等待HTTP响应。这里按CrewAI的执行流程
+（顺序/层级模式、任务上下文、委派工具、异步任务、任务回调）实现异步版本：等待LLM响应和限流配额时只挂起协程，
+一个事件循环可以同时维持数百个进行中的LLM调用。没有异步实现的工具在线程池中执行。
+
+取消：取消执行kickoff_async的任务（asyncio.Task.cancel或asyncio.wait_for超时）时，进行中的LLM请求、
+限流排队和并行执行的其他任务随之取消；已在线程池中执行的同步工具会运行到结束，结果被丢弃。
+
+运行方式：
+    result = await kickoff_async(create_crew())
+    result = asyncio.run(kickoff_async(crew, max_parallel=2))
+"""
+import time
+import asyncio
+import logging
+
+from langchain.agents.agent import ExceptionTool
+from langchain.agents.tools import InvalidTool
+from langchain.tools.render import render_text_description
+from langchain_core.agents import AgentAction, AgentFinish, AgentStep
+from langchain_core.exceptions import OutputParserException
+from langchain_core.runnables.config import RunnableConfig
+from langchain_core.utils.input import get_color_mapping
+from crewai import Process
+from crewai.agents import CrewAgentExecutor
+from crewai.agents.cache.cache_hit import CacheHit
+from crewai.tasks.task_output import TaskOutput
+from crewai.tools.agent_tools import AgentTools
+from crewai.tools.cache_tools import CacheTools
+from crewai.utilities import I18N
+
+from context_budget import budgeted_context, task_output_text
+from crew_manager import create_manager_agent
+from crew_tracing import kickoff_scope, task_span_attributes
+from task_scheduler import DagTaskScheduler, add_delegation_tools, parse_delegation
+from tracing import get_shared_tracer
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncCrewAgentExecutor(CrewAgentExecutor):
+    """CrewAgentExecutor的异步推理循环：与CrewAI的_call/_iter_next_step相同，LLM调用改为await agent.aplan，
+    工具调用改为await tool.arun"""
+
+    async def _acall(self, inputs, run_manager=None):
+        name_to_tool_map = {tool.name: tool for tool in self.tools}
+        color_mapping = get_color_mapping([tool.name for tool in self.tools], excluded_colors=["green", "red"])
+        intermediate_steps = []
+        self.iterations = 0
+        time_elapsed = 0.0
+        start_time = time.time()
+        while self._should_continue(self.iterations, time_elapsed):
+            # 智能体设置了max_rpm时，CrewAI的RPM控制器以阻塞方式等待，放到线程中执行
+            if not self.request_within_rpm_limit or await asyncio.to_thread(self.request_within_rpm_limit):
+                next_step_output = await self._atake_next_step(
+                    name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=run_manager
+                )
+                if isinstance(next_step_output, AgentFinish):
+                    return await self._areturn(next_step_output, intermediate_steps, run_manager=run_manager)
+
+                intermediate_steps.extend(next_step_output)
+                if len(next_step_output) == 1:
+                    tool_return = self._get_tool_return(next_step_output[0])
+                    if tool_return is not None:
+                        return await self._areturn(tool_return, intermediate_steps, run_manager=run_manager)
+                self.iterations += 1
+                time_elapsed = time.time() - start_time
+        output = self.agent.return_stopped_response(self.early_stopping_method, intermediate_steps, **inputs)
+        return await self._areturn(output, intermediate_steps, run_manager=run_manager)
+
+    def _parsing_error_observation(self, error):
+        if isinstance(self.handle_parsing_errors, bool):
+            if not self.handle_parsing_errors:
+                raise ValueError(f"An output parsing error occurred: {error}")
+            return (str(error.observation), str(error.llm_output)) if error.send_to_llm else ("Invalid or incomplete response", str(error))
+        if isinstance(self.handle_parsing_errors, str):
+            return self.handle_parsing_errors, str(error)
+        if callable(self.handle_parsing_errors):
+            return self.handle_parsing_errors(error), str(error)
+        raise ValueError("Got unexpected type of `handle_parsing_errors`")
+
+    async def _aiter_next_step(self, name_to_tool_map, color_mapping, inputs, intermediate_steps, run_manager=None):
+        callbacks = run_manager.get_child() if run_manager else None
+        try:
+            intermediate_steps = self._prepare_intermediate_steps(intermediate_steps)
+            output = await self.agent.aplan(intermediate_steps, callbacks=callbacks, **inputs)
+            if self._should_force_answer() and not isinstance(output, AgentFinish):
+                if isinstance(output, CacheHit):
+                    output = output.action
+                elif not isinstance(output, AgentAction):
+                    raise ValueError(f"Unexpected output type from agent: {type(output)}")
+                yield self._force_answer(output)
+                return
+        except OutputParserException as e:
+            observation, text = self._parsing_error_observation(e)
+            output = AgentAction("_Exception", observation, text)
+            if run_manager:
+                await run_manager.on_agent_action(output, color="green")
+            observation = await ExceptionTool().arun(
+                output.tool_input, verbose=self.verbose, color=None,
+                callbacks=run_manager.get_child() if run_manager else None,
+                **self.agent.tool_run_logging_kwargs()
+            )
+            if self._should_force_answer():
+                yield self._force_answer(output)
+                return
+            yield AgentStep(action=output, observation=observation)
+            return
+
+        if isinstance(output, AgentFinish):
+            yield output
+            return
+
+        # 工具结果命中缓存时改用CacheTools读取
+        if isinstance(output, CacheHit):
+            action = output.action
+            tool = CacheTools(cache_handler=output.cache).tool()
+            output = action.copy()
+            output.tool_input = f"tool:{action.tool}|input:{action.tool_input}"
+            output.tool = tool.name
+            name_to_tool_map[tool.name] = tool
+            color_mapping[tool.name] = color_mapping[action.tool]
+
+        actions = [output] if isinstance(output, AgentAction) else output
+        for agent_action in actions:
+            yield agent_action
+        for agent_action in actions:
+            if run_manager:
+                await run_manager.on_agent_action(agent_action, color="green")
+            tool_run_kwargs = self.agent.tool_run_logging_kwargs()
+            if agent_action.tool in name_to_tool_map:
+                tool = name_to_tool_map[agent_action.tool]
+                if tool.return_direct:
+                    tool_run_kwargs["llm_prefix"] = ""
+                observation = await tool.arun(
+                    agent_action.tool_input, verbose=self.verbose, color=color_mapping[agent_action.tool],
+                    callbacks=run_manager.get_child() if run_manager else None, **tool_run_kwargs
+                )
+            else:
+                observation = await InvalidTool().arun(
+                    {"requested_tool_name": agent_action.tool, "available_tool_names": list(name_to_tool_map)},
+                    verbose=self.verbose, color=None,
+                    callbacks=run_manager.get_child() if run_manager else None, **tool_run_kwargs
+                )
+            yield AgentStep(action=agent_action, observation=observation)
+
+
+def _async_executor(agent, tools):
+    """为单次执行创建异步执行器：与智能体的执行器共用agent等配置，iterations和tools只属于本次执行，
+    因此同一个智能体可以同时执行多个任务或委派
+
+    不带memory：Chain在ainvoke结束时同步调用memory.save_context，对话摘要的LLM调用会在事件循环中阻塞地
+    等待限流配额，而排在它前面的协程要由这个事件循环唤醒，多个执行同时进行时整个循环死锁。
+    记忆由aexecute_agent_task读取和保存。
+    """
+    executor = agent.agent_executor
+    fields = {name: getattr(executor, name) for name in executor.__fields__}
+    fields["tools"] = tools
+    fields["memory"] = None
+    return AsyncCrewAgentExecutor.construct(**fields)
+
+
+def _delegate_async(agent_tools):
+    """AgentTools._execute的异步版本：被委派的智能体同样通过异步接口执行"""
+    async def delegate(command):
+        parsed = parse_delegation(agent_tools, command)
+        return await aexecute_agent_task(*parsed) if isinstance(parsed, tuple) else parsed
+
+    return delegate
+
+
+def _with_async_delegation(tools):
+    for tool in tools:
+        owner = getattr(getattr(tool, "func", None), "__self__", None)
+        if isinstance(owner, AgentTools) and getattr(tool, "coroutine", None) is None:
+            # 同步执行仍调用func，只有arun使用coroutine
+            tool.coroutine = _delegate_async(owner)
+    return tools
+
+
+async def aexecute_agent_task(agent, task, context=None, tools=None):
+    """Agent.execute_task的异步版本，返回智能体的最终回答"""
+    if context:
+        task = agent.i18n.slice("task_with_context").format(task=task, context=context)
+    tools = _with_async_delegation(tools or agent.tools)
+    executor = _async_executor(agent, tools)
+    memory = agent.agent_executor.memory
+    inputs = {"input": task, "tool_names": ", ".join(tool.name for tool in tools), "tools": render_text_description(tools)}
+    if memory is not None:
+        # 与Chain.prep_inputs相同，提示词中的chat_history来自记忆
+        inputs.update(memory.load_memory_variables(inputs))
+    outputs = await executor.ainvoke(inputs, RunnableConfig(callbacks=[agent.tools_handler]))
+    result = outputs["output"]
+    if memory is not None:
+        # 生成对话摘要要通过同步接口调用LLM，放到线程中执行，不阻塞事件循环
+        await asyncio.to_thread(memory.save_context, inputs, {"output": result})
+    if agent.max_rpm:
+        agent._rpm_controller.stop_rpm_counter()
+    return result
+
+
+async def aexecute_task(task, agent=None, context=None, tools=None, tracer=None):
+    """Task.execute的异步版本：拼接上游任务的输出（按任务安装的上下文预算压缩），执行后保存输出并调用任务回调"""
+    tracer = tracer or get_shared_tracer()
+    agent = agent or task.agent
+    if agent is None:
+        raise ValueError(f"任务没有指定智能体，只能在层级模式的团队中执行: {task.description}")
+    with tracer.span("task", **task_span_attributes(task, agent)) as span:
+        if task.context:
+            context = "\n".join(task_output_text(upstream) for upstream in task.context)
+        budget = task.__dict__.get("context_budget")
+        if budget is not None:
+            # 摘要器通过同步接口调用LLM，放到线程中执行
+            context = await asyncio.to_thread(budgeted_context, task, agent, context, budget)
+        result = await aexecute_agent_task(agent, task._prompt(), context, tools or task.tools)
+        task.output = TaskOutput(description=task.description, result=result)
+        if task.callback:
+            task.callback(task.output)
+        if span is not None:
+            span.set_attribute("output_chars", len(str(result)))
+        return result
+
+
+async def _cancel_all(pending):
+    """取消尚未结束的任务并等待它们退出"""
+    for future in pending:
+        future.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def _run_sequential(crew, tracer):
+    task_output = ""
+    # async_execution的任务在后台执行，引用它的下游任务开始前等待其结束
+    background = {}
+    try:
+        for task in crew.tasks:
+            add_delegation_tools(crew, task)
+            role = task.agent.role if task.agent is not None else "None"
+            crew._logger.log("debug", f"Working Agent: {role}")
+            crew._logger.log("info", f"Starting Task: {task.description}")
+
+            for upstream in task.context or []:
+                if upstream in background:
+                    await background[upstream]
+            if task.async_execution:
+                background[task] = asyncio.ensure_future(aexecute_task(task, context=task_output, tracer=tracer))
+            else:
+                task_output = await aexecute_task(task, context=task_output, tracer=tracer)
+            crew._logger.log("debug", f"[{role}] Task output: {task_output}\n\n")
+        # 与CrewAI不同，kickoff返回前等待所有后台任务结束，返回后不再有进行中的请求
+        await asyncio.gather(*background.values())
+    except BaseException:
+        await _cancel_all(background.values())
+        raise
+    return task_output
+
+
+async def _run_hierarchical(crew, tracer):
+    manager = create_manager_agent(crew)
+    task_output = ""
+    for task in crew.tasks:
+        crew._logger.log("debug", f"Working Agent: {manager.role}")
+        crew._logger.log("info", f"Starting Task: {task.description}")
+        task_output = await aexecute_task(task, agent=manager, context=task_output, tools=manager.tools, tracer=tracer)
+        crew._logger.log("debug", f"[{manager.role}] Task output: {task_output}\n\n")
+    return task_output
+
+
+async def _run_parallel(crew, max_parallel, tracer):
+    """按任务的context依赖并发执行互不依赖的任务（依赖关系与DagTaskScheduler相同），最多max_parallel个同时进行"""
+    tasks = list(crew.tasks)
+    if not tasks:
+        return None
+    dependencies = DagTaskScheduler(crew, max_workers=max_parallel).dependencies
+    # 与顺序模式相同的委派工具；每次执行使用各自的执行器，同一个智能体可以同时执行任务和被委派
+    for task in tasks:
+        add_delegation_tools(crew, task)
+    semaphore = asyncio.Semaphore(max_parallel)
+    runs = {}
+
+    async def run(index):
+        for upstream in dependencies[index]:
+            await runs[upstream]
+        # 与Process.sequential保持一致：未声明context的任务接收上一个任务的输出
+        context = runs[index - 1].result() if index - 1 in dependencies[index] else None
+        async with semaphore:
+            logger.info(f"开始执行任务 {index + 1}/{len(tasks)} (智能体: {getattr(tasks[index].agent, 'role', 'None')})")
+            output = await aexecute_task(tasks[index], context=context, tracer=tracer)
+        logger.info(f"任务 {index + 1}/{len(tasks)} 执行完成")
+        return output
+
+    for index in range(len(tasks)):
+        runs[index] = asyncio.ensure_future(run(index))
+    try:
+        await asyncio.gather(*runs.values())
+    except BaseException:
+        # 一个任务失败或整个执行被取消时，取消其余任务
+        await _cancel_all(runs.values())
+        raise
+    return runs[len(tasks) - 1].result()
+
+
+async def kickoff_async(crew, max_parallel=None, tracer=None, trace_id=None):
+    """crew.kickoff()的异步版本，返回最后一个任务的输出
+
+    max_parallel为None时按团队的process顺序或层级执行；指定时按任务的context依赖并行执行（同DAG并行模式）。
+    整个执行记录在crew.kickoff的span下，trace_id为None时加入当前trace。
+    """
+    tracer = tracer or get_shared_tracer()
+    for agent in crew.agents:
+        agent.i18n = I18N(language=crew.language)
+    with kickoff_scope(crew, tracer, trace_id):
+        if max_parallel is not None:
+            result = await _run_parallel(crew, max_parallel, tracer)
+        elif crew.process == Process.sequential:
+            result = await _run_sequential(crew, tracer)
+        elif crew.process == Process.hierarchical:
+            result = await _run_hierarchical(crew, tracer)
+        else:
+            raise NotImplementedError(f"The process '{crew.process}' is not implemented yet.")
+    if crew.max_rpm:
+        crew._rpm_controller.stop_rpm_counter()
+    return result
@@ -0,0 +1,290 @@
+"""批量执行：从JSONL读取简报，对每条简报创建团队并执行，结果逐条追加写入输出JSONL
+
+输入每行一个JSON对象，字段填入团队的智能体目标和任务描述（sequential团队使用product、requirements，
+hierarchical团队使用topic、year、focus、requirements，缺少的字段使用脚本中DEFAULT_BRIEF的值），
+可选的id字段作为简报标识（默认取简报内容的哈希）。
+
+所有执行共用进程内的限流器（MOONSHOT_RPM_LIMIT/MOONSHOT_TPM_LIMIT，或--rpm/--tpm）和HTTP连接池，
+--concurrency限制同时进行的执行数。每条简报执行结束后立即写入一行结果；重新运行时跳过已成功的简报，
+失败的简报会重新执行。
+
+默认每个执行占用一个线程；--async时所有执行在同一个事件循环中通过LLM的异步接口运行，等待响应时
+不占用线程，适合较大的--concurrency。
+
+运行方式：
+    python batch_runner.py --input briefs.jsonl --output results.jsonl --concurrency 4
+    python batch_runner.py --crew hierarchical --input topics.jsonl --output results.jsonl --rpm 60
+    python batch_runner.py --async --input briefs.jsonl --output results.jsonl --concurrency 100
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import hashlib
+import argparse
+import threading
+import contextlib
+import importlib
+from concurrent.futures import ThreadPoolExecutor
+
+CREWS = {
+    "sequential": ("multi_agent_system", "create_crew"),
+    "hierarchical": ("advanced_multi_agent", "create_advanced_crew")
+}
+
+
+def brief_id(brief):
+    if brief.get("id") is not None:
+        return str(brief["id"])
+    canonical = json.dumps(brief, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:12]
+
+
+def read_briefs(path):
+    """读取简报，返回[(简报ID, 简报)]；同一ID出现多次时只保留第一条"""
+    briefs = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                brief = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ValueError(f"{path}第{line_number}行不是合法的JSON: {e}") from None
+            key = brief_id(brief)
+            if key not in seen:
+                seen.add(key)
+                briefs.append((key, brief))
+    return briefs
+
+
+def completed_ids(path):
+    """读取已有的输出文件，返回已成功执行的简报ID（进程中断时可能留下不完整的最后一行，忽略即可）"""
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if record.get("status") == "ok":
+                done.add(record.get("id"))
+    return done
+
+
+class ResultWriter:
+    """按完成顺序追加写入结果，每行写完立即刷新到磁盘"""
+
+    def __init__(self, path):
+        self._file = open(path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class Progress:
+    """统计完成数、失败数和吞吐量，每条简报完成时向标准错误输出一行进度"""
+
+    def __init__(self, total, skipped):
+        self.total = total
+        self.skipped = skipped
+        self.succeeded = 0
+        self.failed = 0
+        self.durations = []
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def record(self, key, status, duration):
+        with self._lock:
+            if status == "ok":
+                self.succeeded += 1
+                self.durations.append(duration)
+            else:
+                self.failed += 1
+            finished = self.succeeded + self.failed
+            elapsed = time.perf_counter() - self.started
+            per_minute = finished / elapsed * 60 if elapsed else 0
+            remaining = self.total - finished
+            eta = remaining / per_minute * 60 if per_minute else 0
+            print(
+                f"[{finished}/{self.total}] {key} {status} {duration:.1f}s | "
+                f"{per_minute:.2f} 条/分钟 | 预计剩余 {eta:.0f}s",
+                file=sys.stderr, flush=True
+            )
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        durations = sorted(self.durations)
+
+        def percentile(p):
+            return round(durations[min(len(durations) - 1, int(len(durations) * p))], 3) if durations else None
+
+        return {
+            "total": self.total + self.skipped,
+            "skipped": self.skipped,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "wall_seconds": round(elapsed, 3),
+            "briefs_per_minute": round(self.succeeded / elapsed * 60, 2) if elapsed else None,
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95)
+        }
+
+
+def brief_fields(brief):
+    return {name: value for name, value in brief.items() if name != "id"}
+
+
+def crew_result(crew, result):
+    from context_budget import task_output_text
+
+    return {
+        "status": "ok",
+        "result": str(result),
+        "task_outputs": [
+            {"agent": task.agent.role if task.agent is not None else None, "output": task_output_text(task)}
+            for task in crew.tasks if task.output is not None
+        ]
+    }
+
+
+def finish_record(record, started):
+    record["duration_seconds"] = round(time.perf_counter() - started, 3)
+    record["finished_at"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    return record
+
+
+def run_brief(factory, key, brief):
+    from llm_retry import classify_error, retry_budget
+
+    started = time.perf_counter()
+    record = {"id": key, "brief": brief_fields(brief)}
+    try:
+        crew = factory(brief=record["brief"])
+        # 每条简报的LLM调用共用一份重试预算
+        with retry_budget():
+            record.update(crew_result(crew, crew.kickoff()))
+    except Exception as e:
+        record.update({"status": "error", "error": f"{type(e).__name__}: {e}", "error_kind": classify_error(e)})
+    return finish_record(record, started)
+
+
+async def run_brief_async(factory, key, brief):
+    from async_crew import kickoff_async
+    from llm_retry import classify_error, retry_budget
+
+    started = time.perf_counter()
+    record = {"id": key, "brief": brief_fields(brief)}
+    try:
+        # 在事件循环中创建团队，模型复用该事件循环的共享异步连接池
+        crew = factory(brief=record["brief"])
+        with retry_budget():
+            record.update(crew_result(crew, await kickoff_async(crew)))
+    except Exception as e:
+        record.update({"status": "error", "error": f"{type(e).__name__}: {e}", "error_kind": classify_error(e)})
+    return finish_record(record, started)
+
+
+async def run_all_async(factory, pending, concurrency, on_record):
+    """在当前事件循环中执行所有简报，最多concurrency个同时进行；中断时取消进行中的执行（不写入结果）"""
+    from http_pool import aclose_shared_async_http_client
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_one(key, brief):
+        async with semaphore:
+            record = await run_brief_async(factory, key, brief)
+        # 写入结果时会同步刷新到磁盘，放到线程中执行
+        await asyncio.to_thread(on_record, record)
+
+    try:
+        await asyncio.gather(*(run_one(key, brief) for key, brief in pending))
+    finally:
+        await aclose_shared_async_http_client()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--input", required=True, help="简报JSONL文件")
+    parser.add_argument("--output", required=True, help="结果JSONL文件（追加写入）")
+    parser.add_argument("--crew", choices=sorted(CREWS), default="sequential")
+    parser.add_argument("--concurrency", type=int, default=2, help="同时进行的执行数")
+    parser.add_argument("--rpm", type=int, help="覆盖MOONSHOT_RPM_LIMIT（所有执行共享）")
+    parser.add_argument("--tpm", type=int, help="覆盖MOONSHOT_TPM_LIMIT（所有执行共享）")
+    parser.add_argument("--limit", type=int, help="最多执行的简报数")
+    parser.add_argument("--async", dest="use_async", action="store_true", help="在同一个事件循环中异步执行所有简报")
+    parser.add_argument("--verbose", action="store_true", help="显示智能体的输出")
+    args = parser.parse_args()
+    if args.concurrency < 1:
+        parser.error("--concurrency必须大于等于1")
+
+    # 共享限流器在第一次创建模型时按环境变量初始化，必须在此之前设置
+    if args.rpm:
+        os.environ["MOONSHOT_RPM_LIMIT"] = str(args.rpm)
+    if args.tpm is not None:
+        os.environ["MOONSHOT_TPM_LIMIT"] = str(args.tpm)
+
+    briefs = read_briefs(args.input)
+    done = completed_ids(args.output)
+    pending = [(key, brief) for key, brief in briefs if key not in done]
+    skipped = len(briefs) - len(pending)
+    if args.limit is not None:
+        pending = pending[:args.limit]
+    print(f"共 {len(briefs)} 条简报，已完成 {skipped} 条，本次执行 {len(pending)} 条（并发 {args.concurrency}）",
+          file=sys.stderr, flush=True)
+
+    module_name, factory_name = CREWS[args.crew]
+    factory = getattr(importlib.import_module(module_name), factory_name)
+    progress = Progress(len(pending), skipped)
+    writer = ResultWriter(args.output)
+
+    def on_record(record):
+        writer.write(record)
+        progress.record(record["id"], record["status"], record["duration_seconds"])
+
+    def on_done(future):
+        # 在工作线程中按完成顺序写入，中断时进行中的执行结束后也会写入结果
+        if future.cancelled():
+            return
+        on_record(future.result())
+
+    output = sys.stdout if args.verbose else open(os.devnull, "w")
+    try:
+        with contextlib.redirect_stdout(output):
+            if args.use_async:
+                asyncio.run(run_all_async(factory, pending, args.concurrency, on_record))
+            else:
+                executor = ThreadPoolExecutor(max_workers=args.concurrency)
+                for key, brief in pending:
+                    executor.submit(run_brief, factory, key, brief).add_done_callback(on_done)
+                try:
+                    executor.shutdown(wait=True)
+                except KeyboardInterrupt:
+                    # 取消尚未开始的简报，重新运行时从未完成的简报继续
+                    print("已中断，正在等待进行中的执行结束...", file=sys.stderr, flush=True)
+                    executor.shutdown(wait=True, cancel_futures=True)
+                    raise
+    finally:
+        writer.close()
+
+    summary = progress.summary()
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    if summary["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
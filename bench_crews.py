@@ -0,0 +1,374 @@
+"""智能体团队的端到端基准：统计单次执行和各任务的延迟分位数、LLM调用次数、token用量、吞吐量和峰值内存
+
+场景：
+    sequential    multi_agent_system.py的顺序执行团队
+    hierarchical  advanced_multi_agent.py的层级执行团队
+    web           crewai_web_app.py的run_multi_agent_system()
+
+运行方式：
+    # 使用进程内启动的本地替身服务，不需要API密钥和网络
+    python bench_crews.py --mock --runs 10 --concurrency 2 --output bench.json
+    # 指定后端（例如真实接口或单独启动的mock_moonshot_server.py）
+    python bench_crews.py --base-url http://127.0.0.1:8900/v1 --scenarios sequential
+    # 与保存的基线对比，有指标变差超过阈值时以非零状态码退出
+    python bench_crews.py --mock --compare bench_baseline.json --threshold 0.1
+    python bench_crews.py --input bench.json --compare bench_baseline.json
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import asyncio
+import argparse
+import tempfile
+import platform
+import threading
+import contextlib
+import importlib
+from contextvars import ContextVar
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ("sequential", "hierarchical", "web")
+
+# 越大越差的指标；runs_per_minute越小越差
+_HIGHER_IS_WORSE = ("run_latency.p50", "run_latency.p95", "run_latency.p99",
+                    "llm_calls_per_run", "tokens_per_run", "peak_rss_mb")
+_LOWER_IS_WORSE = ("runs_per_minute",)
+
+
+def percentile(values, p):
+    """线性插值的百分位数，values为空时返回None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * p / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def latency_summary(values):
+    return {
+        "count": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "max": max(values) if values else None
+    }
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class RunStats:
+    """单次执行期间的LLM调用统计：接口返回用量时使用实际值，否则按文本估算"""
+
+    def __init__(self):
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.task_latencies = {}
+        self.models = {}
+        self._lock = threading.Lock()
+
+    def record_task(self, name, seconds):
+        with self._lock:
+            self.task_latencies[name] = seconds
+
+
+def install_llm_hook():
+    """注册LangChain的全局回调：当前线程设置了RunStats时，统计该线程发出的所有LLM调用"""
+    from langchain_core.callbacks import BaseCallbackHandler
+    from langchain_core.tracers.context import register_configure_hook
+
+    from rate_limiter import estimate_tokens
+
+    class LLMStatsHandler(BaseCallbackHandler):
+        def __init__(self, stats):
+            self.stats = stats
+            self._prompt_estimates = {}
+
+        def on_chat_model_start(self, serialized, messages, run_id=None, **kwargs):
+            text = "".join(str(m.content) for batch in messages for m in batch)
+            self._prompt_estimates[run_id] = estimate_tokens(text)
+
+        def on_llm_start(self, serialized, prompts, run_id=None, **kwargs):
+            self._prompt_estimates[run_id] = estimate_tokens("".join(prompts))
+
+        def on_llm_end(self, response, run_id=None, **kwargs):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt = usage.get("prompt_tokens") or self._prompt_estimates.get(run_id, 0)
+            completion = usage.get("completion_tokens")
+            if completion is None:
+                completion = sum(estimate_tokens(g.text) for gens in response.generations for g in gens)
+            self._prompt_estimates.pop(run_id, None)
+            with self.stats._lock:
+                self.stats.llm_calls += 1
+                self.stats.prompt_tokens += prompt
+                self.stats.completion_tokens += completion
+                # 模型路由的结果：KimiChatOpenAI在llm_output中记录实际请求的模型
+                model = (response.llm_output or {}).get("model_name") or "unknown"
+                self.stats.models[model] = self.stats.models.get(model, 0) + 1
+
+    handler_var = ContextVar("bench_llm_stats_handler", default=None)
+    register_configure_hook(handler_var, True)
+
+    @contextlib.contextmanager
+    def collect(stats):
+        token = handler_var.set(LLMStatsHandler(stats))
+        try:
+            yield
+        finally:
+            handler_var.reset(token)
+
+    return collect
+
+
+def hook_task_timing(tasks, stats, started):
+    """在任务完成回调中记录每个任务的耗时（距上一个任务完成或执行开始），保留任务原有的callback"""
+    last = [started]
+
+    for task in tasks:
+        original_callback = task.callback
+
+        def record(output, task=task, original_callback=original_callback):
+            now = time.perf_counter()
+            stats.record_task(task.agent.role if task.agent is not None else task.description[:20], now - last[0])
+            last[0] = now
+            if original_callback:
+                original_callback(output)
+
+        task.callback = record
+
+
+def run_crew_scenario(module_name, factory_name, stats):
+    """用脚本的团队工厂函数创建新的智能体、任务和团队并执行"""
+    crew = getattr(importlib.import_module(module_name), factory_name)()
+    hook_task_timing(crew.tasks, stats, time.perf_counter())
+    crew.kickoff()
+
+
+class EventRecorder:
+    """作为执行的汇总事件广播器，按current_task的切换记录Web执行中每个任务的耗时"""
+
+    def __init__(self, stats, started):
+        self.stats = stats
+        self.failed = False
+        self._current = None
+        self._since = started
+
+    def publish(self, event_type, data):
+        if event_type != "status_update":
+            return
+        if data.get("status") == "error":
+            self.failed = True
+        task = data.get("current_task")
+        if task != self._current:
+            now = time.perf_counter()
+            if self._current:
+                self.stats.record_task(self._current, now - self._since)
+            self._current, self._since = task, now
+
+
+def run_web_scenario(stats):
+    import crewai_web_app
+    from execution_registry import Execution
+
+    recorder = EventRecorder(stats, time.perf_counter())
+    execution = Execution(f"bench_{uuid.uuid4().hex[:8]}", crewai_web_app.moonshot_model_name, firehose=recorder)
+    # 每次执行在独立的事件循环中运行，上下文变量（当前执行的统计）随之传入
+    asyncio.run(crewai_web_app.run_multi_agent_system(execution))
+    # run_multi_agent_system自行捕获异常并把状态置为error
+    if recorder.failed:
+        raise RuntimeError(f"执行 {execution.execution_id} 失败")
+
+
+def run_once(scenario, collect):
+    stats = RunStats()
+    started = time.perf_counter()
+    error = None
+    with collect(stats):
+        try:
+            if scenario == "sequential":
+                run_crew_scenario("multi_agent_system", "create_crew", stats)
+            elif scenario == "hierarchical":
+                run_crew_scenario("advanced_multi_agent", "create_advanced_crew", stats)
+            else:
+                run_web_scenario(stats)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    return time.perf_counter() - started, stats, error
+
+
+def merge_counts(counts):
+    merged = {}
+    for item in counts:
+        for key, value in item.items():
+            merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def bench_scenario(scenario, runs, concurrency, collect):
+    from http_pool import http_pool_stats
+
+    connections_before = http_pool_stats()["connections_opened"]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: run_once(scenario, collect), range(runs)))
+    wall_seconds = time.perf_counter() - started
+    connections_opened = http_pool_stats()["connections_opened"] - connections_before
+
+    succeeded = [(latency, stats) for latency, stats, error in results if error is None]
+    task_latencies = {}
+    for _, stats in succeeded:
+        for name, seconds in stats.task_latencies.items():
+            task_latencies.setdefault(name, []).append(seconds)
+    all_stats = [stats for _, stats, _ in results]
+    prompt_tokens = sum(s.prompt_tokens for s in all_stats)
+    completion_tokens = sum(s.completion_tokens for s in all_stats)
+    return {
+        "runs": runs,
+        "concurrency": concurrency,
+        "failed": runs - len(succeeded),
+        "errors": sorted({error for _, _, error in results if error})[:5],
+        "wall_seconds": round(wall_seconds, 3),
+        "runs_per_minute": round(len(succeeded) / wall_seconds * 60, 2) if wall_seconds else None,
+        "run_latency": latency_summary([latency for latency, _ in succeeded]),
+        "task_latency": {name: latency_summary(values) for name, values in task_latencies.items()},
+        "llm_calls_per_run": sum(s.llm_calls for s in all_stats) / runs,
+        "llm_calls_by_model": merge_counts(s.models for s in all_stats),
+        "tokens": {"prompt": prompt_tokens, "completion": completion_tokens, "total": prompt_tokens + completion_tokens},
+        "tokens_per_run": (prompt_tokens + completion_tokens) / runs,
+        # 共享连接池新建的连接数，远小于LLM调用次数说明连接被复用
+        "connections_opened": connections_opened,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+
+def metric(result, path):
+    for part in path.split("."):
+        result = result.get(part) if isinstance(result, dict) else None
+    return result
+
+
+def compare(current, baseline, threshold):
+    """逐项对比各场景的指标，返回变差超过阈值（相对比例）的条目列表"""
+    regressions = []
+    for scenario, result in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(scenario)
+        if base is None:
+            continue
+        checks = [(path, metric(result, path), metric(base, path), 1) for path in _HIGHER_IS_WORSE]
+        checks += [(path, metric(result, path), metric(base, path), -1) for path in _LOWER_IS_WORSE]
+        for name, summary in result.get("task_latency", {}).items():
+            base_summary = base.get("task_latency", {}).get(name) or {}
+            checks.append((f"task_latency[{name}].p95", summary["p95"], base_summary.get("p95"), 1))
+        for label, value, base_value, direction in checks:
+            if value is None or not base_value:
+                continue
+            change = (value - base_value) / base_value
+            if change * direction > threshold:
+                regressions.append({
+                    "scenario": scenario, "metric": label,
+                    "baseline": base_value, "current": value, "change": round(change, 4)
+                })
+    return regressions
+
+
+def start_mock_backend(args):
+    from mock_moonshot_server import MockBehavior, create_server
+
+    behavior = MockBehavior(latency=args.mock_latency, tokens_per_second=args.mock_tps, seed=args.seed)
+    server = create_server(behavior, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="逗号分隔：" + ",".join(SCENARIOS))
+    parser.add_argument("--runs", type=int, default=5, help="每个场景的执行次数")
+    parser.add_argument("--concurrency", type=int, default=1, help="同时进行的执行数")
+    parser.add_argument("--base-url", help="OpenAI兼容接口地址，默认使用MOONSHOT_BASE_URL")
+    parser.add_argument("--mock", action="store_true", help="在进程内启动本地替身服务作为后端")
+    parser.add_argument("--mock-latency", default="fixed:0.05", help="替身服务的首token延迟分布")
+    parser.add_argument("--mock-tps", type=float, default=0, help="替身服务的输出速度，0表示不限速")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="结果JSON的保存路径，默认输出到标准输出")
+    parser.add_argument("--input", help="不运行基准，直接读取已保存的结果（配合--compare使用）")
+    parser.add_argument("--compare", help="基线结果JSON，有指标变差超过阈值时以状态码1退出")
+    parser.add_argument("--threshold", type=float, default=0.1, help="判定为变差的相对比例")
+    parser.add_argument("--verbose", action="store_true", help="显示智能体的输出")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, encoding="utf-8") as f:
+            report = json.load(f)
+    else:
+        scenarios = [s for s in args.scenarios.split(",") if s]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            parser.error(f"未知的场景: {', '.join(sorted(unknown))}")
+        base_url = start_mock_backend(args) if args.mock else args.base_url
+        if base_url:
+            os.environ["MOONSHOT_BASE_URL"] = base_url
+        if args.mock:
+            os.environ.setdefault("MOONSHOT_API_KEY", "sk-local")
+            os.environ.setdefault("MOONSHOT_RPM_LIMIT", "100000")
+        # 基准测量真实的调用开销，不使用LLM响应缓存；执行存储写入临时文件
+        os.environ["LLM_CACHE_ENABLED"] = "false"
+        # web场景测量真实的团队执行，不使用演示模式
+        os.environ["CREW_SIMULATE"] = "false"
+        os.environ.setdefault("EXECUTION_STORE_PATH", os.path.join(tempfile.mkdtemp(), "bench.sqlite3"))
+        sys.path.insert(0, ROOT)
+        collect = install_llm_hook()
+
+        report = {
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "environment": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "backend": os.getenv("MOONSHOT_BASE_URL", "https://api.moonshot.cn/v1"),
+                "mock": args.mock,
+                "model": os.getenv("MOONSHOT_MODEL_NAME", "moonshot-v1-8k")
+            },
+            "scenarios": {}
+        }
+        output = sys.stdout if args.verbose else open(os.devnull, "w")
+        with contextlib.redirect_stdout(output):
+            for scenario in scenarios:
+                report["scenarios"][scenario] = bench_scenario(scenario, args.runs, args.concurrency, collect)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    elif not args.input:
+        print(text)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold)
+        for item in regressions:
+            print(f"变差: {item['scenario']} {item['metric']} {item['baseline']} -> {item['current']} "
+                  f"({item['change']:+.1%})", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"与基线相比没有超过{args.threshold:.0%}的变差", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""控制台页面渲染的微基准：对比每次请求render_template_string与预编译+按版本缓存的吞吐量
+
+运行方式：
+    python bench_page_render.py [--agents 30] [--tasks 10] [--logs 500] [--seconds 3]
+"""
+import os
+import time
+import argparse
+import tempfile
+import threading
+
+# 使用临时的执行存储，避免污染本地数据
+os.environ.setdefault("EXECUTION_STORE_PATH", os.path.join(tempfile.mkdtemp(), "bench.sqlite3"))
+
+from flask import render_template_string
+
+import crewai_web_app
+
+
+def build_execution(agents, tasks, logs):
+    """用Web应用的辅助函数填充一次执行，不调用LLM"""
+    done = threading.Event()
+
+    def populate(execution):
+        for i in range(agents):
+            for j in range(tasks):
+                crewai_web_app.update_agent(execution, f"智能体{i}", f"角色{i}", f"任务{i}-{j}的描述" * 5, "任务输出内容" * 50)
+        for i in range(logs):
+            crewai_web_app.add_system_log(execution, f"第{i}条日志")
+        for i in range(agents):
+            crewai_web_app.add_agent_interaction(execution, f"智能体{i}", f"智能体{(i + 1) % agents}", "协作内容" * 10)
+        crewai_web_app.update_task_status(execution, "所有任务完成", "completed", 100)
+        done.set()
+
+    crewai_web_app.execution_registry.target = populate
+    execution = crewai_web_app.execution_registry.submit()
+    done.wait()
+    return execution
+
+
+def requests_per_second(func, seconds):
+    func()  # 预热
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        func()
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--agents", type=int, default=30)
+    parser.add_argument("--tasks", type=int, default=10)
+    parser.add_argument("--logs", type=int, default=500)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    app = crewai_web_app.app
+    execution = build_execution(args.agents, args.tasks, args.logs)
+
+    # 改造前的做法：每次请求重新解析模板并渲染执行数据（日志条数与快照页相同，两者输出同样的页面）
+    @app.route('/bench/legacy')
+    def legacy_index():
+        return render_template_string(
+            crewai_web_app.DASHBOARD_TEMPLATE,
+            execution_data=execution.snapshot(crewai_web_app.log_tail_size),
+            shell=False
+        )
+
+    # 预编译的模板但不使用页面缓存：执行运行中、每次请求时版本都已变化的情况
+    @app.route('/bench/uncached')
+    def uncached_snapshot():
+        return crewai_web_app.dashboard_page.render(
+            None, lambda: {"execution_data": execution.snapshot(crewai_web_app.log_tail_size), "shell": False}
+        )
+
+    client = app.test_client()
+    cases = [
+        ("render_template_string（改造前）", "/bench/legacy"),
+        ("预编译模板，缓存未命中", "/bench/uncached"),
+        ("预编译+按版本缓存的快照页", f"/snapshot?execution_id={execution.execution_id}"),
+        ("页面外壳", "/"),
+    ]
+    print(f"智能体: {args.agents}，每个智能体任务: {args.tasks}，日志: {args.logs}")
+    baseline = None
+    for name, url in cases:
+        size = len(client.get(url).data)
+        rps = requests_per_second(lambda: client.get(url), args.seconds)
+        baseline = baseline or rps
+        print(f"{name:<32} {rps:>10.1f} req/s  {rps / baseline:>6.1f}x  页面 {size / 1024:.1f} KB")
+    print(f"页面缓存命中: {crewai_web_app.dashboard_page.hits}，未命中: {crewai_web_app.dashboard_page.misses}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""启动耗时基准：在新的解释器进程中测量模块的导入耗时，以及Web应用从启动到响应第一个请求的耗时
+
+目标：
+    multi_agent_system    导入耗时，以及首次调用create_crew()的耗时（crewai等依赖在此时导入）
+    advanced_multi_agent  同上，工厂函数为create_advanced_crew()
+    crewai_web_app        导入耗时，以及用测试客户端请求首页的耗时
+
+运行方式：
+    python bench_startup.py --repeat 5
+    python bench_startup.py --targets crewai_web_app --path /api/execution-data --output startup.json
+    # 列出导入最慢的模块（python -X importtime）
+    python bench_startup.py --importtime crewai_web_app
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+TARGETS = {
+    "multi_agent_system": "create_crew",
+    "advanced_multi_agent": "create_advanced_crew",
+    "crewai_web_app": None
+}
+
+# 在子进程中执行：先导入模块，再创建团队或请求首页，以JSON输出各阶段耗时
+_CHILD = """
+import sys, json, time
+started = time.perf_counter()
+import {module} as target
+result = {{"import_seconds": time.perf_counter() - started}}
+factory = {factory!r}
+if factory:
+    began = time.perf_counter()
+    getattr(target, factory)()
+    result["first_crew_seconds"] = time.perf_counter() - began
+else:
+    began = time.perf_counter()
+    response = target.app.test_client().get({path!r})
+    result["first_request_seconds"] = time.perf_counter() - began
+    result["status_code"] = response.status_code
+print(json.dumps(result))
+"""
+
+
+def child_env():
+    env = dict(os.environ)
+    # 不产生本地文件，也不需要真实的API密钥（只创建模型，不发出请求）
+    workdir = tempfile.mkdtemp()
+    env.setdefault("MOONSHOT_API_KEY", "sk-local")
+    env["EXECUTION_STORE_PATH"] = os.path.join(workdir, "startup.sqlite3")
+    env["TRACE_EXPORT_PATH"] = ""
+    env["LLM_CACHE_ENABLED"] = "false"
+    return env
+
+
+def measure_once(module, factory, path):
+    code = _CHILD.format(module=module, factory=factory, path=path)
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=child_env(), capture_output=True, text=True
+    )
+    wall_seconds = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(f"{module}: {completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else completed.returncode}")
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    # 包含解释器启动的进程总耗时：对Web应用即从启动到响应第一个请求
+    result["process_seconds"] = wall_seconds
+    return result
+
+
+def summarize(samples):
+    keys = [key for key in samples[0] if key != "status_code"]
+    summary = {}
+    for key in keys:
+        values = [sample[key] for sample in samples]
+        summary[key] = {"median": round(statistics.median(values), 4), "min": round(min(values), 4)}
+    if "status_code" in samples[0]:
+        summary["status_code"] = samples[-1]["status_code"]
+    return summary
+
+
+def slowest_imports(module, top):
+    """用python -X importtime列出累计耗时最长的导入"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=child_env(), capture_output=True, text=True
+    )
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = (part.strip() for part in line[len("import time:"):].split("|"))
+        rows.append((int(cumulative), name))
+    return sorted(rows, reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--targets", default=",".join(TARGETS), help="逗号分隔：" + ",".join(TARGETS))
+    parser.add_argument("--repeat", type=int, default=5, help="每个目标启动的进程数")
+    parser.add_argument("--path", default="/", help="Web应用第一个请求的路径")
+    parser.add_argument("--output", help="结果JSON的保存路径，默认输出到标准输出")
+    parser.add_argument("--importtime", metavar="MODULE", help="列出导入该模块时最慢的导入并退出")
+    parser.add_argument("--top", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.importtime:
+        for cumulative, name in slowest_imports(args.importtime, args.top):
+            print(f"{cumulative / 1000:10.1f} ms  {name}")
+        return
+
+    targets = [target for target in args.targets.split(",") if target]
+    unknown = set(targets) - set(TARGETS)
+    if unknown:
+        parser.error(f"未知的目标: {', '.join(sorted(unknown))}")
+
+    report = {"python": sys.version.split()[0], "repeat": args.repeat, "targets": {}}
+    for target in targets:
+        try:
+            samples = [measure_once(target, TARGETS[target], args.path) for _ in range(args.repeat)]
+            report["targets"][target] = summarize(samples)
+        except RuntimeError as e:
+            report["targets"][target] = {"error": str(e)}
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+from crewai.tasks.task_output import TaskOutput
+
+logger = logging.getLogger(__name__)
+
+
+class TaskCheckpointer:
+    """按执行ID和任务标识持久化已完成任务的输出，重试或重启时跳过已完成的任务"""
+
+    def __init__(self, execution_id, directory=None):
+        self.execution_id = execution_id
+        self.directory = directory or os.getenv("CREW_CHECKPOINT_DIR", ".checkpoints")
+        self.path = os.path.join(self.directory, f"{execution_id}.json")
+        self._lock = threading.Lock()
+        self._hooked_tasks = set()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def task_key(index, task):
+        """任务标识：任务在crew中的位置 + 智能体角色、描述和期望输出的哈希"""
+        role = task.agent.role if task.agent is not None else ""
+        digest = hashlib.sha256(f"{role}\n{task.description}\n{task.expected_output}".encode("utf-8"))
+        return f"{index}-{digest.hexdigest()[:16]}"
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def save(self, key, task, output_text):
+        with self._lock:
+            checkpoints = self.load()
+            checkpoints[key] = {
+                "description": task.description,
+                "output": output_text,
+                "saved_at": time.strftime("%Y-%m-%d %H:%M:%S")
+            }
+            # 先写临时文件再替换，避免进程中断留下半个文件
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(checkpoints, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        logger.info(f"已保存任务检查点: {key}")
+
+    def clear(self):
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _hook_task(self, key, task):
+        """在任务完成回调中保存检查点，保留任务原有的callback"""
+        if id(task) in self._hooked_tasks:
+            return
+        original_callback = task.callback
+
+        def save_checkpoint(output):
+            self.save(key, task, output.result)
+            if original_callback:
+                original_callback(output)
+
+        task.callback = save_checkpoint
+        self._hooked_tasks.add(id(task))
+
+    def restore(self, tasks):
+        """恢复已完成任务的输出，返回仍需执行的任务列表"""
+        checkpoints = self.load()
+        remaining = []
+        previous = None
+        for index, task in enumerate(tasks):
+            key = self.task_key(index, task)
+            if key in checkpoints:
+                output_text = checkpoints[key]["output"]
+                # 下游任务通过context读取task.output，因此直接填回已保存的输出
+                task.output = TaskOutput(description=task.description, result=output_text)
+            else:
+                if not remaining and not task.context and previous is not None:
+                    # 顺序执行时未声明context的任务会接收上一个任务的输出，这里显式补上
+                    task.context = [previous]
+                self._hook_task(key, task)
+                remaining.append(task)
+            previous = task
+        skipped = len(tasks) - len(remaining)
+        if skipped:
+            logger.info(f"从检查点恢复了 {skipped}/{len(tasks)} 个已完成任务 (执行ID: {self.execution_id})")
+        return remaining
+
+    def kickoff(self, crew, tasks, run=None):
+        """只执行尚未完成的任务；全部完成后清除检查点并返回最后一个任务的输出"""
+        remaining = self.restore(tasks)
+        if remaining:
+            crew.tasks = remaining
+            result = run(crew) if run else crew.kickoff()
+        else:
+            result = tasks[-1].output.result
+        self.clear()
+        return result
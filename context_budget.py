@@ -0,0 +1,222 @@
+"""任务上下文预算：上游任务的输出注入下游任务之前，按token预算压缩
+
+例如测试计划任务的context同时包含前三个任务的完整输出，在8k窗口的模型上拼接后的提示词既慢又贵，
+还可能超出上下文窗口。超出预算时，各上游输出按公平份额分配预算：较短的输出保留原文，
+较长的输出用LLM生成摘要（没有摘要器或摘要仍超出份额时按行抽取要点截断）。
+摘要按（输出内容, 份额）缓存，同一个上游输出被多个下游任务引用时只压缩一次。
+"""
+import os
+import re
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+from metrics import CONTEXT_TOKENS_SAVED, CONTEXT_COMPRESSIONS
+from rate_limiter import estimate_tokens
+from model_router import MODEL_CONTEXT_WINDOWS
+
+logger = logging.getLogger(__name__)
+
+# 份额按该粒度向下取整，不同下游任务分到的份额相近时可以复用同一份摘要
+_SHARE_GRANULARITY = 128
+_HEADING_PATTERN = re.compile(r"^\s*(#+\s|\*\*|[一二三四五六七八九十]+[、.])")
+_LIST_PATTERN = re.compile(r"^\s*([-*+]\s|\d+[.、)])")
+_DIGIT_PATTERN = re.compile(r"\d")
+
+SUMMARY_PROMPT = (
+    "请把下面的内容压缩为不超过{max_tokens}个token的摘要。保留所有结论、决策、关键事实、数字、名称、"
+    "接口和约束，删除重复、铺垫和修饰性的内容，不要添加原文没有的信息，直接输出摘要：\n\n{text}"
+)
+
+
+def default_context_budget(model_name):
+    """默认预算为模型上下文窗口的四分之一，其余留给任务描述、智能体提示词和推理过程"""
+    return MODEL_CONTEXT_WINDOWS.get(model_name, 8192) // 4
+
+
+def fair_shares(sizes, budget):
+    """按公平份额分配预算：不超过平均份额的部分保留原长，剩余预算在较长的部分之间平分"""
+    shares = [0] * len(sizes)
+    remaining = sorted(range(len(sizes)), key=lambda i: sizes[i])
+    left = budget
+    while remaining:
+        share = left // len(remaining)
+        index = remaining[0]
+        if sizes[index] > share:
+            for index in remaining:
+                shares[index] = share
+            break
+        shares[index] = sizes[index]
+        left -= sizes[index]
+        remaining.pop(0)
+    return shares
+
+
+def extract_key_lines(text, max_tokens):
+    """按行抽取要点：标题、列表项和含数字的行优先，其次是靠前的行，保持原文顺序，省略处用…标出"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    lines = text.splitlines()
+    ranked = sorted(
+        range(len(lines)),
+        key=lambda i: (
+            not lines[i].strip(),
+            -(2 * bool(_HEADING_PATTERN.match(lines[i])) + bool(_LIST_PATTERN.match(lines[i]))
+              + bool(_DIGIT_PATTERN.search(lines[i]))),
+            i
+        )
+    )
+    chosen = set()
+    used = 0
+    for i in ranked:
+        if not lines[i].strip():
+            break
+        cost = estimate_tokens(lines[i]) + 1
+        if used + cost > max_tokens:
+            continue
+        chosen.add(i)
+        used += cost
+    if not chosen:
+        # 单行就超出份额时按字符截断
+        keep = max(max_tokens, 1)
+        return text[:keep] + "…"
+
+    result = []
+    previous = -1
+    for i in sorted(chosen):
+        if i != previous + 1:
+            result.append("…")
+        result.append(lines[i])
+        previous = i
+    if previous != len(lines) - 1:
+        result.append("…")
+    return "\n".join(result)
+
+
+def llm_summarizer(llm):
+    """用LLM生成摘要的摘要器；启用LLM响应缓存时，相同输入的摘要在进程之间也会复用"""
+    def summarize(text, max_tokens):
+        response = llm.invoke(SUMMARY_PROMPT.format(max_tokens=max_tokens, text=text))
+        return getattr(response, "content", response)
+
+    return summarize
+
+
+def task_output_text(task):
+    # crewai的TaskOutput在不同版本中分别以result或raw_output保存输出
+    output = task.output
+    text = getattr(output, "result", None)
+    return text if text is not None else getattr(output, "raw_output", str(output))
+
+
+class ContextBudget:
+    """把上游任务的输出压缩到max_tokens以内；summarizer为None时只按行抽取要点"""
+
+    def __init__(self, max_tokens, summarizer=None, max_cached=256):
+        if max_tokens <= 0:
+            raise ValueError("max_tokens必须大于0")
+        self.max_tokens = max_tokens
+        self.summarizer = summarizer
+        self.max_cached = max_cached
+        self._cache = OrderedDict()
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, model_name, summarizer=None):
+        """按环境变量配置：CONTEXT_BUDGET_TOKENS（默认为模型窗口的四分之一）、CONTEXT_COMPRESSION（summary或trim）"""
+        max_tokens = int(os.getenv("CONTEXT_BUDGET_TOKENS", "0")) or default_context_budget(model_name)
+        if os.getenv("CONTEXT_COMPRESSION", "summary").lower() == "trim":
+            summarizer = None
+        return cls(max_tokens, summarizer)
+
+    def _compress(self, text, max_tokens):
+        key = (hashlib.sha256(text.encode("utf-8")).hexdigest(), max_tokens)
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # 并行执行的下游任务同时引用同一个上游输出时，只有一个线程生成摘要，其余等待后复用
+        with key_lock:
+            with self._lock:
+                cached = self._cache.get(key)
+                if cached is not None:
+                    self._cache.move_to_end(key)
+            if cached is not None:
+                CONTEXT_COMPRESSIONS.inc(method="cached")
+                return cached
+
+            compressed = None
+            method = "trim"
+            if self.summarizer is not None:
+                try:
+                    compressed = self.summarizer(text, max_tokens)
+                    method = "summary"
+                except Exception as e:
+                    logger.warning(f"生成上下文摘要失败，改为按行截断: {str(e)}")
+            if compressed is None or estimate_tokens(compressed) > max_tokens:
+                compressed = extract_key_lines(compressed or text, max_tokens)
+            CONTEXT_COMPRESSIONS.inc(method=method)
+
+            with self._lock:
+                self._cache[key] = compressed
+                while len(self._cache) > self.max_cached:
+                    self._cache.popitem(last=False)
+                self._key_locks.pop(key, None)
+            return compressed
+
+    def fit(self, parts, role="default"):
+        """返回拼接后不超过预算的上下文（与crewai一致，各部分以换行拼接）"""
+        parts = [part for part in parts if part]
+        sizes = [estimate_tokens(part) for part in parts]
+        original_tokens = sum(sizes)
+        if original_tokens <= self.max_tokens:
+            return "\n".join(parts)
+
+        shares = fair_shares(sizes, self.max_tokens)
+        fitted = []
+        for part, size, share in zip(parts, sizes, shares):
+            if size <= share:
+                fitted.append(part)
+            else:
+                # 份额不足一个粒度时不取整：向上取到粒度会超出预算，摘要可能比原文还长
+                share = share // _SHARE_GRANULARITY * _SHARE_GRANULARITY or share
+                fitted.append(self._compress(part, share))
+        context = "\n".join(fitted)
+        saved = original_tokens - estimate_tokens(context)
+        if saved > 0:
+            CONTEXT_TOKENS_SAVED.inc(saved, role=role)
+        logger.info(f"任务上下文已压缩 ({role}): {original_tokens} -> {original_tokens - saved} tokens")
+        return context
+
+
+def budgeted_context(task, agent, context, budget):
+    """按预算压缩注入任务的上下文：声明了context时逐个压缩上游输出，否则压缩传入的上一个任务的输出"""
+    if task.context:
+        parts = [task_output_text(upstream) for upstream in task.context]
+    else:
+        parts = [context] if context else []
+    if parts:
+        context = budget.fit(parts, role=getattr(agent, "role", "default"))
+    return context
+
+
+def install_context_budget(task, budget):
+    """在任务执行前按预算压缩注入的上下文；预算同时记录在task.context_budget上，供异步执行读取"""
+    if "_execute" in task.__dict__:
+        return task
+    original_execute = task._execute
+
+    def _execute(agent, task_prompt, context, tools):
+        return original_execute(agent, task_prompt, budgeted_context(task, agent, context, budget), tools)
+
+    # CrewAI的Task是pydantic模型，不允许直接给非字段属性赋值
+    object.__setattr__(task, "_execute", _execute)
+    object.__setattr__(task, "context_budget", budget)
+    return task
+
+
+def apply_context_budget(crew, budget):
+    """为团队中的每个任务安装上下文预算，重复调用不会重复包装"""
+    for task in crew.tasks:
+        install_context_budget(task, budget)
+    return crew
@@ -0,0 +1,48 @@
+"""层级模式的管理者智能体：为团队指定管理者使用的模型
+
+CrewAI 0.5.0的Crew没有manager_llm字段（传入的值被忽略），_run_hierarchical_process总是用默认的
+ChatOpenAI(model="gpt-4")创建管理者，管理者的请求不经过共享连接池、限流器、模型路由和重试。
+set_manager_llm把模型记录在团队上，并让同步（crew.kickoff）和异步（kickoff_async）执行都用它创建管理者。
+"""
+from crewai import Agent
+from crewai.tools.agent_tools import AgentTools
+from crewai.utilities import I18N
+
+
+def create_manager_agent(crew):
+    """与Crew._run_hierarchical_process相同的管理者智能体；团队设置了manager_llm时使用该模型"""
+    i18n = I18N(language=crew.language)
+    options = {}
+    llm = getattr(crew, "manager_llm", None)
+    if llm is not None:
+        options["llm"] = llm
+    return Agent(
+        role=i18n.retrieve("hierarchical_manager_agent", "role"),
+        goal=i18n.retrieve("hierarchical_manager_agent", "goal"),
+        backstory=i18n.retrieve("hierarchical_manager_agent", "backstory"),
+        tools=AgentTools(agents=crew.agents).tools(),
+        verbose=True,
+        **options
+    )
+
+
+def run_hierarchical_process(crew):
+    """Crew._run_hierarchical_process，管理者由create_manager_agent创建"""
+    manager = create_manager_agent(crew)
+    task_output = ""
+    for task in crew.tasks:
+        crew._logger.log("debug", f"Working Agent: {manager.role}")
+        crew._logger.log("info", f"Starting Task: {task.description}")
+        task_output = task.execute(agent=manager, context=task_output, tools=manager.tools)
+        crew._logger.log("debug", f"[{manager.role}] Task output: {task_output}\n\n")
+    if crew.max_rpm:
+        crew._rpm_controller.stop_rpm_counter()
+    return task_output
+
+
+def set_manager_llm(crew, llm):
+    """指定层级模式的管理者使用的模型"""
+    # CrewAI的Crew是pydantic模型，不允许直接给非字段属性赋值
+    object.__setattr__(crew, "manager_llm", llm)
+    object.__setattr__(crew, "_run_hierarchical_process", lambda: run_hierarchical_process(crew))
+    return crew
@@ -0,0 +1,191 @@
+import threading
+import contextlib
+from contextvars import ContextVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.tracers.context import register_configure_hook
+
+from rate_limiter import estimate_tokens
+from tracing import get_shared_tracer
+
+# kickoff期间设置的回调会自动加入该上下文中所有LangChain调用（包括层级模式的manager_llm）
+_tracing_handler = ContextVar("crew_tracing_handler", default=None)
+register_configure_hook(_tracing_handler, True)
+
+
+def _truncate(text, limit=500):
+    text = str(text)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """把LangChain的回调转换为span：智能体执行、推理步骤中的工具调用与委派、LLM调用
+
+    智能体执行、工具调用和LLM调用期间对应的span被设为当前span，因此委派给其他智能体的执行
+    会嵌套在委派span之下，HTTP请求会嵌套在LLM调用之下。
+    """
+
+    def __init__(self, tracer):
+        self.tracer = tracer
+        # run_id -> (span, 是否由本run创建)；中间的链只沿用父run的span，不单独创建
+        self._spans = {}
+        self._actions = {}
+        self._lock = threading.Lock()
+
+    def _open(self, run_id, parent_run_id, name, **attributes):
+        with self._lock:
+            parent = self._spans.get(parent_run_id, (None, False))[0]
+        span = self.tracer.start_span(name, parent=parent, **attributes)
+        self.tracer.activate(span)
+        with self._lock:
+            self._spans[run_id] = (span, True)
+        return span
+
+    def _close(self, run_id, error=None, **attributes):
+        with self._lock:
+            span, owned = self._spans.pop(run_id, (None, False))
+        if span is None or not owned:
+            return
+        for key, value in attributes.items():
+            span.set_attribute(key, value)
+        self.tracer.deactivate(span)
+        self.tracer.end_span(span, error=error)
+
+    def run_context(self, run_id):
+        """模型发出请求期间进入：把该次LLM调用的span设为当前span，HTTP请求的span嵌套在其下
+
+        异步调用时回调在线程池或单独的任务中执行，回调中激活的span不会传回发出请求的协程。
+        """
+        with self._lock:
+            span = self._spans.get(run_id, (None, False))[0]
+        return self.tracer.use_span(span)
+
+    def on_chain_start(self, serialized, inputs, run_id=None, parent_run_id=None, **kwargs):
+        if parent_run_id is None:
+            self._open(run_id, None, "agent.execute")
+        else:
+            with self._lock:
+                if parent_run_id in self._spans:
+                    self._spans[run_id] = (self._spans[parent_run_id][0], False)
+
+    def on_chain_end(self, outputs, run_id=None, **kwargs):
+        self._close(run_id)
+
+    def on_chain_error(self, error, run_id=None, **kwargs):
+        self._close(run_id, error=error)
+
+    def on_agent_action(self, action, run_id=None, **kwargs):
+        # 推理步骤的思考过程记录到随后的工具调用span上
+        with self._lock:
+            self._actions[run_id] = _truncate(action.log)
+
+    def on_agent_finish(self, finish, run_id=None, **kwargs):
+        with self._lock:
+            span = self._spans.get(run_id, (None, False))[0]
+        if span is not None:
+            span.set_attribute("output_chars", len(str(finish.return_values.get("output", ""))))
+
+    def on_tool_start(self, serialized, input_str, run_id=None, parent_run_id=None, **kwargs):
+        tool = (serialized or {}).get("name", "")
+        with self._lock:
+            thought = self._actions.pop(parent_run_id, None)
+        attributes = {"tool": tool, "input": _truncate(input_str)}
+        if thought:
+            attributes["thought"] = thought
+        # CrewAI的委派工具为Delegate work to co-worker / Ask question to co-worker
+        self._open(run_id, parent_run_id, "agent.delegation" if "co-worker" in tool.lower() else "agent.tool", **attributes)
+
+    def on_tool_end(self, output, run_id=None, **kwargs):
+        self._close(run_id, output_chars=len(str(output)))
+
+    def on_tool_error(self, error, run_id=None, **kwargs):
+        self._close(run_id, error=error)
+
+    def _llm_attributes(self, serialized, kwargs, prompt_text):
+        params = kwargs.get("invocation_params") or {}
+        return {
+            "model": params.get("model_name") or params.get("model") or "",
+            "prompt_tokens_estimate": estimate_tokens(prompt_text)
+        }
+
+    def on_chat_model_start(self, serialized, messages, run_id=None, parent_run_id=None, **kwargs):
+        text = "".join(str(m.content) for batch in messages for m in batch)
+        self._open(run_id, parent_run_id, "llm.call", **self._llm_attributes(serialized, kwargs, text))
+
+    def on_llm_start(self, serialized, prompts, run_id=None, parent_run_id=None, **kwargs):
+        self._open(run_id, parent_run_id, "llm.call", **self._llm_attributes(serialized, kwargs, "".join(prompts)))
+
+    def on_llm_end(self, response, run_id=None, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        attributes = {key: usage[key] for key in ("prompt_tokens", "completion_tokens", "total_tokens") if key in usage}
+        if "completion_tokens" not in attributes:
+            attributes["completion_tokens_estimate"] = sum(
+                estimate_tokens(g.text) for gens in response.generations for g in gens
+            )
+        self._close(run_id, **attributes)
+
+    def on_llm_error(self, error, run_id=None, **kwargs):
+        self._close(run_id, error=error)
+
+
+def task_span_attributes(task, agent):
+    """任务span的属性：任务描述、执行任务的智能体"""
+    attributes = {"description": _truncate(task.description, 200), "agent": getattr(agent, "role", "")}
+    if task.agent is not None and task.agent is not agent:
+        # 层级模式下任务由manager执行，再委派给指定的智能体
+        attributes["assigned_agent"] = task.agent.role
+    return attributes
+
+
+def _instrument_task(task, tracer):
+    original_execute = task.execute
+
+    def execute(*args, **kwargs):
+        agent = kwargs.get("agent") or (args[0] if args else None) or task.agent
+        with tracer.span("task", **task_span_attributes(task, agent)) as span:
+            result = original_execute(*args, **kwargs)
+            if span is not None:
+                span.set_attribute("output_chars", len(str(result)))
+            return result
+
+    # CrewAI的Task/Crew是pydantic模型，不允许直接给非字段属性赋值
+    object.__setattr__(task, "execute", execute)
+
+
+@contextlib.contextmanager
+def kickoff_scope(crew, tracer=None, trace_id=None):
+    """crew.kickoff的span，并为块内的LangChain调用启用追踪（同步和异步执行共用）"""
+    tracer = tracer or get_shared_tracer()
+    with tracer.span("crew.kickoff", trace_id=trace_id, process=str(crew.process), tasks=len(crew.tasks)) as span:
+        token = _tracing_handler.set(TracingCallbackHandler(tracer)) if tracer.enabled else None
+        try:
+            yield span
+        finally:
+            if token is not None:
+                _tracing_handler.reset(token)
+
+
+def traced_run(crew, run, tracer=None, trace_id=None):
+    """在crew.kickoff的span内调用run()（例如以DAG并行模式执行任务），并为其中的LangChain调用启用追踪"""
+    with kickoff_scope(crew, tracer, trace_id):
+        return run()
+
+
+def instrument_crew(crew, tracer=None, trace_id=None):
+    """为团队加上链路追踪：kickoff、每个任务、智能体执行、工具调用与委派、LLM调用各自生成span
+
+    trace_id为None时kickoff加入当前trace（没有当前span时开始新的trace）。重复调用不会重复包装。
+    """
+    tracer = tracer or get_shared_tracer()
+    if not tracer.enabled or "kickoff" in crew.__dict__:
+        return crew
+    original_kickoff = crew.kickoff
+
+    def kickoff(*args, **kwargs):
+        return traced_run(crew, lambda: original_kickoff(*args, **kwargs), tracer, trace_id)
+
+    object.__setattr__(crew, "kickoff", kickoff)
+    for task in crew.tasks:
+        if "execute" not in task.__dict__:
+            _instrument_task(task, tracer)
+    return crew
@@ -1,15 +1,21 @@
-from flask import Flask, render_template_string, jsonify
+from flask import Flask, jsonify, request, Response
 import os
 from dotenv import load_dotenv
 import json
 from datetime import datetime
+from execution_store import get_shared_execution_store
+from execution_state import make_task_id
+from response_utils import body_etag, etag_matches, enable_gzip
+from page_cache import CachedTemplate
+from execution_registry import FINISHED_STATUSES
 
 # 加载环境变量
 load_dotenv()
 
 app = Flask(__name__)
+enable_gzip(app)
 
-# 模拟执行结果数据（从terminal输出生成）
+# 模拟执行结果数据（从terminal输出生成），执行存储中没有记录时展示
 execution_data = {
     "execution_id": datetime.now().strftime("%Y%m%d_%H%M%S"),
     "start_time": "2025-11-15 21:37:53",
@@ -90,9 +96,13 @@ execution_data = {
     ]
 }
 
-# 首页 - 显示执行结果
-def index():
-    html_template = '''
+# 模拟数据的任务ID与执行时一样由任务描述生成
+for agent in execution_data["agents"]:
+    for task in agent["tasks"]:
+        task["task_id"] = make_task_id(task["description"])
+
+# 结果页面模板
+RESULT_TEMPLATE = '''
     <!DOCTYPE html>
     <html lang="zh-CN">
     <head>
@@ -218,7 +228,7 @@ def index():
             <div id="agents-tab" class="tab-content">
                 <div class="grid grid-cols-1 lg:grid-cols-2 gap-6 mb-8">
                     {% for agent in execution_data.agents %}
-                    <div class="bg-white rounded-xl shadow-lg overflow-hidden card-hover">
+                    <div class="bg-white rounded-xl shadow-lg overflow-hidden card-hover" data-agent-name="{{ agent.name }}">
                         <div class="bg-primary/10 p-4 border-l-4 border-primary">
                             <h3 class="text-xl font-bold flex items-center">
                                 <i class="fa fa-user-circle text-primary mr-3"></i>
@@ -228,7 +238,7 @@ def index():
                         </div>
                         <div class="p-4">
                             {% for task in agent.tasks %}
-                            <div class="mb-4">
+                            <div class="mb-4" data-task-id="{{ task.task_id }}">
                                 <div class="flex items-start mb-2">
                                     <i class="fa fa-tasks text-secondary mt-1 mr-2"></i>
                                     <h4 class="font-semibold text-sm">{{ task.description }}</h4>
@@ -353,12 +363,43 @@ def index():
         </script>
     </body>
     </html>
-    '''
-    return render_template_string(html_template, execution_data=execution_data)
+'''
+
+# 模板在启动时编译一次；已结束的执行和模拟数据不会再变化，渲染结果按执行ID缓存
+result_page = CachedTemplate(app.jinja_env, RESULT_TEMPLATE, max_entries=int(os.getenv("PAGE_CACHE_SIZE", "32")))
+
+# 首页 - 显示执行结果
+def index():
+    execution_id = request.args.get('execution_id')
+    page = result_page.get(execution_id) if execution_id else None
+    if page is not None:
+        return page
+    data = load_execution_data(execution_id)
+    if data is None:
+        return "执行不存在", 404
+    cache_key = data["execution_id"] if data is execution_data or data["status"] in FINISHED_STATUSES else None
+    return result_page.render(cache_key, lambda: {"execution_data": data})
+
+# 从执行存储读取指定执行或最近一次执行，存储为空时使用模拟数据
+def load_execution_data(execution_id=None):
+    store = get_shared_execution_store()
+    if execution_id:
+        return store.get_execution(execution_id)
+    latest = store.list_executions(limit=1)
+    if latest:
+        return store.get_execution(latest[0]["execution_id"])
+    return execution_data
 
-# API - 获取执行数据
+# API - 获取执行数据（支持ETag/If-None-Match条件请求）
 def get_execution_data():
-    return jsonify(execution_data)
+    data = load_execution_data(request.args.get('execution_id'))
+    if data is None:
+        return jsonify({"status": "error", "message": "执行不存在"}), 404
+    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    etag = body_etag(body)
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return Response(status=304, headers={'ETag': etag})
+    return Response(body, mimetype="application/json", headers={'ETag': etag})
 
 # 配置路由
 app.add_url_rule('/', 'index', index)
@@ -1,13 +1,19 @@
 import os
+import json
 import time
+import asyncio
 import logging
-import json
-from threading import Thread
-from queue import Queue
-from flask import Flask, render_template_string, jsonify, Response
+from flask import Flask, jsonify, Response, request
 from dotenv import load_dotenv
-from crewai import Agent, Task, Crew, Process
-from langchain_openai import ChatOpenAI
+from http_pool import get_shared_http_client, get_shared_async_http_client, http_pool_stats
+from metrics import REGISTRY, Gauge, TASK_DURATION_SECONDS, AGENT_UPDATES
+from tracing import get_shared_tracer, trace_id_for
+from event_broadcaster import EventBroadcaster
+from execution_registry import ExecutionRegistry, ExecutionQueueFull, FINISHED_STATUSES
+from execution_store import get_shared_execution_store
+from log_buffer import format_log_entry
+from response_utils import body_etag, etag_matches, enable_gzip
+from page_cache import CachedTemplate
 
 # 加载环境变量
 load_dotenv()
@@ -18,26 +24,30 @@ logger = logging.getLogger(__name__)
 
 # 创建Flask应用
 app = Flask(__name__)
+# 较大的非流式响应（首页、执行数据）按Accept-Encoding使用gzip压缩
+enable_gzip(app)
 
-# 全局变量存储执行数据和状态
-execution_data = {
-    "execution_id": time.strftime("%Y%m%d_%H%M%S"),
-    "start_time": time.strftime("%Y-%m-%d %H:%M:%S"),
-    "model": os.getenv("MOONSHOT_MODEL_NAME", "moonshot-v1-8k"),
-    "agents": [],
-    "agent_interactions": [],
-    "system_logs": [],
-    "status": "idle",  # idle, running, completed, error
-    "current_task": None,
-    "progress": 0
-}
-
-# 创建队列用于实时通信
-execution_queue = Queue()
+# 事件广播器：汇总所有执行的事件；每个SSE连接拥有独立的有界缓冲区，断线重连时按Last-Event-ID补发
+event_broadcaster = EventBroadcaster(
+    history_size=int(os.getenv("EVENT_HISTORY_SIZE", "1000")),
+    buffer_size=int(os.getenv("EVENT_BUFFER_SIZE", "500"))
+)
+# 持久化存储：执行状态、日志、交互和任务输出，重启后仍可查询历史执行
+execution_store = get_shared_execution_store()
+# 首页和执行数据接口只返回最近的若干条日志，更早的日志通过日志接口分页读取
+log_tail_size = int(os.getenv("LOG_TAIL_SIZE", "100"))
+# SSE心跳间隔（秒）
+sse_heartbeat_seconds = int(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+# LLM流式输出的task_delta事件最短发布间隔（秒）
+task_delta_interval = int(os.getenv("TASK_DELTA_INTERVAL_MS", "100")) / 1000
+# CREW_SIMULATE=1时不调用LLM，只按固定节奏演示任务进度，用于展示控制台界面
+crew_simulate = os.getenv("CREW_SIMULATE", "false").lower() in ("1", "true")
 
 # 设置API密钥和代理配置
 moonshot_api_key = os.getenv("MOONSHOT_API_KEY")
 moonshot_model_name = os.getenv("MOONSHOT_MODEL_NAME", "moonshot-v1-8k")
+# OpenAI兼容接口地址，可指向本地的mock_moonshot_server.py做离线运行和压测
+moonshot_base_url = os.getenv("MOONSHOT_BASE_URL", "https://api.moonshot.cn/v1")
 
 # 配置代理支持
 proxy_url = os.getenv("HTTP_PROXY")
@@ -49,129 +59,171 @@ if proxy_url:
     os.environ["https_proxy"] = proxy_url
 
 # 初始化Kimi模型
-def get_kimi_llm():
-    """初始化Kimi大语言模型（使用OpenAI兼容接口）"""
+def get_kimi_llm(execution, agent_name=None, task_description=None):
+    """初始化Kimi大语言模型（使用OpenAI兼容接口）
+
+    以流式模式调用接口；指定agent_name和task_description时，输出的token会作为该任务的
+    task_delta事件实时推送到控制台。在执行所在的事件循环中调用，异步请求复用该事件循环的共享连接池。
+    """
+    # crewai和langchain在首次执行时才导入，缩短应用启动到可以响应请求的时间
+    from kimi_llm import KimiChatOpenAI
+    from llm_cache import enable_llm_cache_from_env
+    from llm_stream import TaskOutputStreamer
+    from model_router import get_shared_model_router
+
     try:
         logger.info(f"正在初始化Kimi模型: {moonshot_model_name}")
         # 设置环境变量以便crewai能够正确使用Kimi API
         os.environ["OPENAI_API_KEY"] = moonshot_api_key
-        os.environ["OPENAI_BASE_URL"] = "https://api.moonshot.cn/v1"
+        os.environ["OPENAI_BASE_URL"] = moonshot_base_url
         os.environ["OPENAI_MODEL_NAME"] = moonshot_model_name
         
-        # 使用OpenAI兼容接口调用Kimi模型
-        kimi_llm = ChatOpenAI(
+        # 按配置启用LLM响应缓存（LLM_CACHE_ENABLED=true）
+        enable_llm_cache_from_env()
+        
+        # 调用耗时、token用量、429和重试次数由KimiChatOpenAI按角色记录（/metrics）
+        callbacks = []
+        if agent_name:
+            callbacks.append(TaskOutputStreamer(execution.publish, agent_name, task_description, task_delta_interval))
+        
+        # 使用OpenAI兼容接口调用Kimi模型，真正发出的请求会经过共享限流器
+        kimi_llm = KimiChatOpenAI(
             model_name=moonshot_model_name,
             api_key=moonshot_api_key,
-            base_url="https://api.moonshot.cn/v1",
-            temperature=0.7
+            base_url=moonshot_base_url,
+            temperature=0.7,
+            streaming=True,
+            callbacks=callbacks,
+            http_client=get_shared_http_client(),
+            http_async_client=get_shared_async_http_client(),
+            # 每个请求按提示词大小路由到窗口能容纳的最小模型
+            model_router=get_shared_model_router(),
+            agent_role=agent_name
         )
-        logger.info("Kimi模型初始化成功")
-        add_system_log("Kimi模型初始化成功")
+        success_msg = f"Kimi模型初始化成功（{agent_name}）" if agent_name else "Kimi模型初始化成功"
+        logger.info(success_msg)
+        add_system_log(execution, success_msg)
         return kimi_llm
     except Exception as e:
         error_msg = f"初始化Kimi模型失败: {str(e)}"
         logger.error(error_msg)
-        add_system_log(error_msg, "error")
+        add_system_log(execution, error_msg, "error")
         raise
 
 # 添加系统日志
-def add_system_log(message, level="info"):
-    timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
-    log_entry = f"{timestamp} - {level.upper()} - {message}"
-    execution_data["system_logs"].append(log_entry)
-    # 将日志发送到队列以便实时更新
-    execution_queue.put({
-        "type": "log",
-        "data": log_entry
-    })
+def add_system_log(execution, message, level="info"):
+    entry = execution.logs.append(level, message, time.strftime("%Y-%m-%d %H:%M:%S"))
+    execution.state.mark_log(entry["seq"])
+    log_entry = format_log_entry(entry)
+    execution_store.append_log(execution.execution_id, entry)
+    # 广播日志以便实时更新
+    execution.publish("log", log_entry)
 
-# 更新智能体信息
-def update_agent(agent_name, role, task_description=None, task_output=None):
-    # 查找现有智能体
-    agent = next((a for a in execution_data["agents"] if a["name"] == agent_name), None)
-    
-    if not agent:
-        # 创建新智能体
-        agent = {
-            "name": agent_name,
-            "role": role,
-            "tasks": []
-        }
-        execution_data["agents"].append(agent)
-    
-    # 如果有任务信息，添加或更新任务
-    if task_description:
-        task = next((t for t in agent["tasks"] if t["description"] == task_description), None)
-        if not task:
-            task = {
-                "description": task_description,
-                "output": task_output or "正在处理..."
-            }
-            agent["tasks"].append(task)
-        elif task_output:
-            task["output"] = task_output
-    
-    # 将更新发送到队列
-    execution_queue.put({
-        "type": "agent_update",
-        "data": agent
-    })
+# 更新智能体信息：按名称添加或更新智能体，有任务信息时按任务ID添加或更新任务
+def update_agent(execution, agent_name, role, task_description=None, task_output=None):
+    agent = execution.state.upsert_agent(agent_name, role, task_description, task_output).to_dict()
+    AGENT_UPDATES.inc(agent=agent_name)
+    execution_store.save_agent(execution.execution_id, agent)
+    # 广播智能体更新
+    execution.publish("agent_update", agent)
 
 # 添加智能体交互
-def add_agent_interaction(from_agent, to_agent, content):
-    interaction = {
-        "from_agent": from_agent,
-        "to_agent": to_agent,
-        "content": content,
-        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S")
-    }
-    execution_data["agent_interactions"].append(interaction)
+def add_agent_interaction(execution, from_agent, to_agent, content):
+    interaction = execution.state.add_interaction(
+        from_agent, to_agent, content, time.strftime("%Y-%m-%d %H:%M:%S")
+    ).to_dict()
+    execution_store.append_interaction(execution.execution_id, interaction)
     
-    # 将交互发送到队列
-    execution_queue.put({
-        "type": "interaction",
-        "data": interaction
-    })
+    # 广播交互
+    execution.publish("interaction", interaction)
 
 # 更新任务状态
-def update_task_status(task_name, status, progress=None):
-    execution_data["current_task"] = task_name
-    execution_data["status"] = status
+def update_task_status(execution, task_name, status, progress=None):
+    # 当前任务切换时记录上一个任务的耗时
+    previous_task = execution.state.current.current_task
+    if task_name != previous_task:
+        now = time.monotonic()
+        if previous_task and execution.task_started_at is not None:
+            TASK_DURATION_SECONDS.observe(now - execution.task_started_at, task=previous_task)
+        execution.task_started_at = now
+    
+    fields = {"current_task": task_name, "status": status}
     if progress is not None:
-        execution_data["progress"] = progress
+        fields["progress"] = progress
+    state = execution.state.update_status(**fields)
+    execution_store.save_execution(state.header())
     
-    # 将状态更新发送到队列
-    execution_queue.put({
-        "type": "status_update",
-        "data": {
-            "current_task": task_name,
-            "status": status,
-            "progress": progress
-        }
+    # 广播状态更新
+    execution.publish("status_update", {
+        "current_task": task_name,
+        "status": status,
+        "progress": progress
     })
 
-# 运行多智能体系统的函数
-def run_multi_agent_system():
-    global execution_data
-    
-    # 重置执行数据
-    execution_data = {
-        "execution_id": time.strftime("%Y%m%d_%H%M%S"),
-        "start_time": time.strftime("%Y-%m-%d %H:%M:%S"),
-        "model": moonshot_model_name,
-        "agents": [],
-        "agent_interactions": [],
-        "system_logs": [],
-        "status": "running",
-        "current_task": None,
-        "progress": 0
-    }
-    
-    add_system_log(f"启动多智能体协作系统 (使用Kimi大模型: {moonshot_model_name})")
+def start_stage(execution, stages, index):
+    """任务开始执行：创建任务卡片（流式输出的task_delta追加到卡片上）并更新当前任务"""
+    task_name, agent_name, duty, task = stages[index]
+    update_agent(execution, agent_name, duty, task.description)
+    update_task_status(execution, task_name, "running", index * 100 // len(stages))
+
+def task_completed_callback(execution, stages, index):
+    """任务回调：流式推送的只是增量，任务结束时用完整输出校正任务卡片，然后开始下一个任务"""
+    _, agent_name, duty, task = stages[index]
+
+    def callback(output):
+        update_agent(execution, agent_name, duty, task.description, output.result)
+        if index + 1 < len(stages):
+            start_stage(execution, stages, index + 1)
+
+    return callback
+
+async def simulate_crew(execution, stages):
+    """CREW_SIMULATE=1时的演示：不调用LLM，按固定节奏推进任务进度"""
+    progress_outputs = ["正在制定产品需求...", "正在设计技术架构...", "正在创建UI设计稿...", "正在编写测试用例..."]
+    final_outputs = [
+        "完成了产品需求文档，包含AI助手的核心功能规划和用户故事。",
+        "设计了基于微服务的后端架构，选择了Python和FastAPI作为技术栈。",
+        "创建了符合现代设计趋势的UI界面，强调简洁性和易用性。",
+        "完成了全面的测试计划，包括功能测试、性能测试和安全性测试。",
+    ]
+    update_task_status(execution, stages[0][0], "running", 0)
+    for i, (task_name, agent_name, duty, task) in enumerate(stages):
+        with tracer.span("task", description=task_name):
+            update_task_status(execution, task_name, "running", (i+1)*25)
+            update_agent(execution, agent_name, duty, task.description, progress_outputs[i])
+            if i == 1:
+                add_agent_interaction(execution, "资深开发工程师", "产品经理", "设计后端系统架构和API接口")
+            await asyncio.sleep(1)  # 模拟处理时间
+    for (_, agent_name, duty, task), output in zip(stages, final_outputs):
+        update_agent(execution, agent_name, duty, task.description, output)
+
+
+# 运行多智能体系统的函数：整个执行记录为一个trace（trace ID由执行ID决定），控制台据此展示调用链瀑布图
+# 执行在事件循环中运行（ASGI服务的事件循环，或执行注册表的后台事件循环），等待LLM响应时不占用线程，可以随时取消
+async def run_multi_agent_system(execution):
+    from llm_retry import retry_budget
+
+    with tracer.span("execution", trace_id=trace_id_for(execution.execution_id),
+                     execution_id=execution.execution_id, model=moonshot_model_name), retry_budget():
+        await run_crew(execution)
+
+async def run_crew(execution):
+    from crewai import Agent, Task, Crew, Process
+    from async_crew import kickoff_async
+    from crew_tracing import instrument_crew
+    from context_budget import ContextBudget, apply_context_budget, llm_summarizer
+    from llm_retry import classify_error
+
+    add_system_log(execution, f"启动多智能体协作系统 (使用Kimi大模型: {moonshot_model_name})")
     
     try:
-        # 初始化Kimi模型
-        kimi_llm = get_kimi_llm()
+        # 任务描述（每个智能体的Kimi模型按任务推送流式输出）
+        # 每个智能体只执行一个任务，用不到跨任务的对话记忆，因此关闭记忆：省去每个任务结束后的摘要调用，
+        # 摘要的流式输出也不会覆盖任务卡片
+        task1_description = "设计一个AI助手产品的功能规划和路线图，包括核心功能、目标用户和市场定位。"
+        task2_description = "基于产品需求，设计后端系统架构和API接口，选择合适的技术栈。"
+        task3_description = "设计产品的用户界面和交互流程，创建关键页面的设计稿。"
+        task4_description = "制定全面的测试计划，包括功能测试、性能测试和用户体验测试。"
         
         # 创建产品经理智能体
         product_manager = Agent(
@@ -179,9 +231,10 @@ def run_multi_agent_system():
             goal="设计一个创新的AI助手产品",
             backstory="你是一位经验丰富的产品经理，擅长将复杂需求转化为清晰的产品规划。",
             verbose=True,
-            llm=kimi_llm
+            memory=False,
+            llm=get_kimi_llm(execution, "产品经理", task1_description)
         )
-        update_agent("产品经理", "设计产品功能和路线图")
+        update_agent(execution, "产品经理", "设计产品功能和路线图")
         
         # 创建开发工程师智能体
         developer = Agent(
@@ -189,9 +242,10 @@ def run_multi_agent_system():
             goal="实现高质量的AI产品功能",
             backstory="你是一位技术精湛的开发工程师，精通多种编程语言和AI技术栈。",
             verbose=True,
-            llm=kimi_llm
+            memory=False,
+            llm=get_kimi_llm(execution, "资深开发工程师", task2_description)
         )
-        update_agent("资深开发工程师", "设计后端架构")
+        update_agent(execution, "资深开发工程师", "设计后端架构")
         
         # 创建UI设计师智能体
         designer = Agent(
@@ -199,9 +253,10 @@ def run_multi_agent_system():
             goal="设计美观且易用的产品界面",
             backstory="你是一位创意十足的UI/UX设计师，专注于用户体验和视觉设计。",
             verbose=True,
-            llm=kimi_llm
+            memory=False,
+            llm=get_kimi_llm(execution, "UI/UX设计师", task3_description)
         )
-        update_agent("UI/UX设计师", "设计用户界面")
+        update_agent(execution, "UI/UX设计师", "设计用户界面")
         
         # 创建测试工程师智能体
         tester = Agent(
@@ -209,19 +264,18 @@ def run_multi_agent_system():
             goal="确保产品质量和稳定性",
             backstory="你是一位细致入微的测试工程师，擅长发现潜在问题并提出改进建议。",
             verbose=True,
-            llm=kimi_llm
+            memory=False,
+            llm=get_kimi_llm(execution, "测试工程师", task4_description)
         )
-        update_agent("测试工程师", "制定测试计划")
+        update_agent(execution, "测试工程师", "制定测试计划")
         
         # 定义任务
-        task1_description = "设计一个AI助手产品的功能规划和路线图，包括核心功能、目标用户和市场定位。"
         task1 = Task(
             description=task1_description,
             expected_output="一份详细的产品需求文档，包含功能列表、用户故事和产品路线图。",
             agent=product_manager
         )
         
-        task2_description = "基于产品需求，设计后端系统架构和API接口，选择合适的技术栈。"
         task2 = Task(
             description=task2_description,
             expected_output="技术架构文档，包含系统设计图、API规范和技术选型说明。",
@@ -229,7 +283,6 @@ def run_multi_agent_system():
             context=[task1]
         )
         
-        task3_description = "设计产品的用户界面和交互流程，创建关键页面的设计稿。"
         task3 = Task(
             description=task3_description,
             expected_output="UI设计稿和交互流程图，包含色彩方案和组件库建议。",
@@ -237,7 +290,6 @@ def run_multi_agent_system():
             context=[task1]
         )
         
-        task4_description = "制定全面的测试计划，包括功能测试、性能测试和用户体验测试。"
         task4 = Task(
             description=task4_description,
             expected_output="测试计划文档，包含测试用例、测试策略和验收标准。",
@@ -252,77 +304,172 @@ def run_multi_agent_system():
             process=Process.sequential,
             verbose=2
         )
+        instrument_crew(crew)
+        # 测试计划任务同时引用前三个任务的输出，注入前按预算压缩（摘要不推送到智能体卡片）
+        apply_context_budget(crew, ContextBudget.from_env(moonshot_model_name, llm_summarizer(get_kimi_llm(execution))))
         
         # 添加智能体交互（模拟实际协作过程）
-        add_agent_interaction("产品经理", "资深开发工程师", "设计AI助手产品的核心技术架构")
-        add_agent_interaction("产品经理", "UI/UX设计师", "AI助手产品的用户界面和体验设计应注意哪些要素？")
-        add_agent_interaction("产品经理", "测试工程师", "制定AI助手产品的测试计划和测试用例")
+        add_agent_interaction(execution, "产品经理", "资深开发工程师", "设计AI助手产品的核心技术架构")
+        add_agent_interaction(execution, "产品经理", "UI/UX设计师", "AI助手产品的用户界面和体验设计应注意哪些要素？")
+        add_agent_interaction(execution, "产品经理", "测试工程师", "制定AI助手产品的测试计划和测试用例")
         
-        # 更新任务状态
-        update_task_status("任务1: 产品需求分析", "running", 0)
+        # 各任务在控制台上的名称、执行的智能体及其职责
+        stages = [
+            ("任务1: 产品需求分析", "产品经理", "设计产品功能和路线图", task1),
+            ("任务2: 技术架构设计", "资深开发工程师", "设计后端架构", task2),
+            ("任务3: UI设计", "UI/UX设计师", "设计用户界面", task3),
+            ("任务4: 测试计划", "测试工程师", "制定测试计划", task4),
+        ]
         
-        # 运行任务（使用重试机制）
-        max_retries = 3
-        retry_count = 0
-        result = None
-        
-        while retry_count < max_retries:
-            try:
-                # 模拟任务进度更新
-                for i in range(4):
-                    task_name = f"任务{i+1}: {'产品需求分析' if i==0 else '技术架构设计' if i==1 else 'UI设计' if i==2 else '测试计划'}"
-                    update_task_status(task_name, "running", (i+1)*25)
-                    
-                    # 更新对应任务的状态
-                    if i == 0:
-                        update_agent("产品经理", "设计产品功能和路线图", task1_description, "正在制定产品需求...")
-                    elif i == 1:
-                        update_agent("资深开发工程师", "设计后端架构", task2_description, "正在设计技术架构...")
-                        add_agent_interaction("资深开发工程师", "产品经理", "设计后端系统架构和API接口")
-                    elif i == 2:
-                        update_agent("UI/UX设计师", "设计用户界面", task3_description, "正在创建UI设计稿...")
-                    elif i == 3:
-                        update_agent("测试工程师", "制定测试计划", task4_description, "正在编写测试用例...")
-                    
-                    time.sleep(1)  # 模拟处理时间
-                
-                # 实际执行crew
-                # result = crew.kickoff()
-                
-                # 模拟最终结果
-                update_agent("产品经理", "设计产品功能和路线图", task1_description, "完成了产品需求文档，包含AI助手的核心功能规划和用户故事。")
-                update_agent("资深开发工程师", "设计后端架构", task2_description, "设计了基于微服务的后端架构，选择了Python和FastAPI作为技术栈。")
-                update_agent("UI/UX设计师", "设计用户界面", task3_description, "创建了符合现代设计趋势的UI界面，强调简洁性和易用性。")
-                update_agent("测试工程师", "制定测试计划", task4_description, "完成了全面的测试计划，包括功能测试、性能测试和安全性测试。")
-                
-                update_task_status("所有任务完成", "completed", 100)
-                add_system_log("多智能体协作系统执行完成！")
-                break
-                
-            except Exception as e:
-                retry_count += 1
-                error_msg = f"执行出错 (第{retry_count}/{max_retries}次尝试): {str(e)}"
-                logger.error(error_msg)
-                add_system_log(error_msg, "error")
-                
-                if retry_count < max_retries:
-                    wait_time = 2 ** retry_count
-                    add_system_log(f"{wait_time}秒后重试...")
-                    time.sleep(wait_time)
-                else:
-                    update_task_status("执行失败", "error", 0)
-                    add_system_log("已达到最大重试次数，请解决问题后重试")
+        # 运行任务：失败的LLM请求在调用内按错误类型重试，本次执行的所有调用共用LLM_RETRY_BUDGET次重试
+        try:
+            if crew_simulate:
+                await simulate_crew(execution, stages)
+            else:
+                for index, (_, _, _, task) in enumerate(stages):
+                    task.callback = task_completed_callback(execution, stages, index)
+                start_stage(execution, stages, 0)
+                await kickoff_async(crew)
+            
+            update_task_status(execution, "所有任务完成", "completed", 100)
+            add_system_log(execution, "多智能体协作系统执行完成！")
+
+        except Exception as e:
+            kind = classify_error(e)
+            error_msg = f"执行出错（{kind}）: {str(e)}"
+            logger.error(error_msg)
+            add_system_log(execution, error_msg, "error")
+            if kind == "auth":
+                add_system_log(execution, "API密钥认证失败，请检查.env文件中的MOONSHOT_API_KEY", "error")
+            elif kind == "quota":
+                add_system_log(execution, "账户额度不足或已被暂停，请检查Moonshot账户", "error")
+            update_task_status(execution, "执行失败", "error", 0)
                     
     except Exception as e:
         error_msg = f"系统错误: {str(e)}"
         logger.error(error_msg)
-        add_system_log(error_msg, "error")
-        update_task_status("系统错误", "error", 0)
+        add_system_log(execution, error_msg, "error")
+        update_task_status(execution, "系统错误", "error", 0)
 
-# 首页路由
-@app.route('/')
-def index():
-    html_template = '''
+# 链路追踪：每次执行的span保留在内存中供控制台展示，并写入TRACE_EXPORT_PATH
+tracer = get_shared_tracer()
+
+# 执行注册表：多个执行按上限并发运行，超出的排队等待
+# EXECUTION_BACKEND=queue时执行写入任务队列，由worker.py启动的工作进程（可分布在多台主机上）运行
+execution_backend = os.getenv("EXECUTION_BACKEND", "local").lower()
+if execution_backend == "queue":
+    from job_queue import get_shared_job_queue
+    from queued_registry import QueuedExecutionRegistry
+    
+    execution_registry = QueuedExecutionRegistry(
+        get_shared_job_queue(),
+        max_queued=int(os.getenv("EXECUTION_MAX_QUEUED", "20")),
+        max_retained=int(os.getenv("EXECUTION_MAX_RETAINED", "20")),
+        log_capacity=int(os.getenv("LOG_BUFFER_SIZE", "1000")),
+        model=moonshot_model_name,
+        history_size=event_broadcaster.history_size,
+        buffer_size=event_broadcaster.buffer_size,
+        firehose=event_broadcaster,
+        store=execution_store
+    )
+else:
+    execution_registry = ExecutionRegistry(
+        target=run_multi_agent_system,
+        max_workers=int(os.getenv("EXECUTION_MAX_WORKERS", "2")),
+        max_queued=int(os.getenv("EXECUTION_MAX_QUEUED", "20")),
+        max_retained=int(os.getenv("EXECUTION_MAX_RETAINED", "20")),
+        log_capacity=int(os.getenv("LOG_BUFFER_SIZE", "1000")),
+        model=moonshot_model_name,
+        history_size=event_broadcaster.history_size,
+        buffer_size=event_broadcaster.buffer_size,
+        firehose=event_broadcaster,
+        store=execution_store
+    )
+
+# 在/metrics输出时读取的瞬时指标
+Gauge("executions_queued", "排队等待运行的执行数", func=lambda: execution_registry.queued_count)
+Gauge("executions_running", "正在运行的执行数", func=lambda: execution_registry.running_count)
+Gauge("sse_subscribers", "当前的SSE连接数（汇总事件流与各执行事件流）", func=lambda: (
+    event_broadcaster.subscriber_count
+    + sum(execution.broadcaster.subscriber_count for execution in execution_registry.list())
+))
+
+# 尚未启动过任何执行时展示的数据
+def idle_execution_data():
+    return {
+        "execution_id": None,
+        "queued_time": None,
+        "start_time": None,
+        "model": moonshot_model_name,
+        "agents": [],
+        "agent_interactions": [],
+        "system_logs": [],
+        "log_first_seq": None,
+        "log_last_seq": 0,
+        "version": 0,
+        "status": "idle",
+        "current_task": None,
+        "progress": 0
+    }
+
+# 查找执行数据：仍在内存中的执行直接返回，否则从持久化存储读取
+def find_execution_data(execution_id):
+    execution = execution_registry.get(execution_id)
+    if execution is not None:
+        return execution.snapshot(log_tail_size)
+    return execution_store.get_execution(execution_id, log_limit=log_tail_size)
+
+# 首页和旧版接口默认展示最近一次执行，指定execution_id时展示历史执行
+def current_execution_data(execution_id=None):
+    if execution_id:
+        return find_execution_data(execution_id)
+    execution = execution_registry.latest()
+    if execution is not None:
+        return execution.snapshot(log_tail_size)
+    # 重启后内存为空，展示存储中最近的一次执行
+    latest = execution_store.list_executions(limit=1)
+    if latest:
+        return execution_store.get_execution(latest[0]["execution_id"], log_limit=log_tail_size)
+    return idle_execution_data()
+
+# 生成/api/execution-data的响应，返回(状态码, JSON内容, ETag)；ETag命中时内容为None（WSGI与ASGI入口共用）
+# 内存中的执行以版本号作为ETag，提供since时只返回该版本之后的增量
+def execution_data_response(execution_id=None, since=None, if_none_match=None):
+    execution = execution_registry.get(execution_id) if execution_id else execution_registry.latest()
+    if execution is not None:
+        # 版本未变化时无需组装和序列化数据
+        etag = f'W/"{execution.execution_id}-{execution.version}"'
+        if etag_matches(if_none_match, etag):
+            return 304, None, etag
+        document = execution.delta(since) if since is not None else None
+        if document is None:
+            document = execution.snapshot(log_tail_size)
+        body = json.dumps(document, ensure_ascii=False).encode("utf-8")
+        return 200, body, f'W/"{execution.execution_id}-{document["version"]}"'
+    
+    # 历史执行没有版本号，按内容计算ETag
+    document = current_execution_data(execution_id)
+    if document is None:
+        return 404, json.dumps({"status": "error", "message": "执行不存在"}, ensure_ascii=False).encode("utf-8"), None
+    body = json.dumps(document, ensure_ascii=False).encode("utf-8")
+    etag = body_etag(body)
+    if etag_matches(if_none_match, etag):
+        return 304, None, etag
+    return 200, body, etag
+
+# 读取分页参数；default为None且未提供参数时返回None
+def int_arg(name, default, maximum=None):
+    try:
+        value = int(request.args.get(name, default))
+    except (TypeError, ValueError):
+        value = default
+    if value is None:
+        return None
+    value = max(value, 0)
+    return min(value, maximum) if maximum is not None else value
+
+# 控制台页面模板：shell为真时只输出页面外壳，执行数据由前端通过API加载
+DASHBOARD_TEMPLATE = '''
     <!DOCTYPE html>
     <html lang="zh-CN">
     <head>
@@ -387,7 +534,7 @@ def index():
                 </div>
                 <div class="flex items-center space-x-4">
                     <span class="text-sm text-gray-600 hidden md:inline">
-                        执行ID: <span id="execution-id">{{ execution_data.execution_id }}</span>
+                        执行ID: <span id="execution-id">{{ execution_data.execution_id or '-' }}</span>
                     </span>
                     <span class="text-sm bg-blue-100 text-blue-800 px-2 py-1 rounded-full">
                         {{ execution_data.model }}
@@ -395,6 +542,9 @@ def index():
                     <button id="start-btn" class="bg-primary text-white px-4 py-2 rounded-lg hover:bg-primary/90 transition-colors flex items-center">
                         <i class="fa fa-play mr-2"></i>启动任务
                     </button>
+                    <button id="cancel-btn" class="hidden bg-gray-200 text-gray-700 px-4 py-2 rounded-lg hover:bg-gray-300 transition-colors flex items-center">
+                        <i class="fa fa-stop mr-2"></i>取消
+                    </button>
                 </div>
             </div>
         </nav>
@@ -413,7 +563,7 @@ def index():
                                 </div>
                                 <div>
                                     <p class="text-sm text-gray-500">开始时间</p>
-                                    <p class="font-semibold" id="start-time">{{ execution_data.start_time }}</p>
+                                    <p class="font-semibold" id="start-time">{{ execution_data.start_time or '-' }}</p>
                                 </div>
                             </div>
                         </div>
@@ -478,6 +628,9 @@ def index():
                     <button class="tab-btn px-6 py-3 font-medium text-gray-500 hover:text-gray-700" onclick="switchTab('logs')">
                         <i class="fa fa-list-alt mr-2"></i>系统日志
                     </button>
+                    <button class="tab-btn px-6 py-3 font-medium text-gray-500 hover:text-gray-700" onclick="switchTab('trace')">
+                        <i class="fa fa-align-left mr-2"></i>调用链
+                    </button>
                 </div>
             </div>
 
@@ -486,7 +639,7 @@ def index():
                 <div class="grid grid-cols-1 lg:grid-cols-2 gap-6 mb-8" id="agents-container">
                     {% if execution_data.agents %}
                     {% for agent in execution_data.agents %}
-                    <div class="bg-white rounded-xl shadow-lg overflow-hidden card-hover">
+                    <div class="bg-white rounded-xl shadow-lg overflow-hidden card-hover" data-agent-name="{{ agent.name }}">
                         <div class="bg-primary/10 p-4 border-l-4 border-primary">
                             <h3 class="text-xl font-bold flex items-center">
                                 <i class="fa fa-user-circle text-primary mr-3"></i>
@@ -494,9 +647,9 @@ def index():
                             </h3>
                             <p class="text-gray-600 text-sm mt-1">{{ agent.role }}</p>
                         </div>
-                        <div class="p-4">
+                        <div class="p-4 agent-tasks">
                             {% for task in agent.tasks %}
-                            <div class="mb-4">
+                            <div class="mb-4" data-task-id="{{ task.task_id }}">
                                 <div class="flex items-start mb-2">
                                     <i class="fa fa-tasks text-secondary mt-1 mr-2"></i>
                                     <h4 class="font-semibold text-sm">{{ task.description }}</h4>
@@ -561,7 +714,7 @@ def index():
                         </h3>
                     </div>
                     <div class="p-4 max-h-96 overflow-y-auto" id="logs-container">
-                        <ul class="space-y-2 text-sm">
+                        <ul class="space-y-2 text-sm" id="logs-list">
                             {% if execution_data.system_logs %}
                             {% for log in execution_data.system_logs %}
                             <li class="p-2 rounded-lg {% if 'ERROR' in log %}bg-red-50 text-red-800{% elif 'INFO' in log %}bg-blue-50 text-blue-800{% else %}bg-gray-50{% endif %}">
@@ -577,6 +730,21 @@ def index():
                     </div>
                 </div>
             </div>
+
+            <div id="trace-tab" class="tab-content hidden">
+                <div class="bg-white rounded-xl shadow-lg overflow-hidden">
+                    <div class="p-4 border-b">
+                        <h3 class="text-xl font-bold flex items-center">
+                            <i class="fa fa-align-left text-primary mr-3"></i>
+                            调用链
+                        </h3>
+                        <p class="text-gray-500 text-sm mt-1">执行 → 任务 → 智能体步骤 → LLM调用，悬停查看属性</p>
+                    </div>
+                    <div class="p-4 overflow-x-auto text-xs" id="trace-container">
+                        <p class="text-center py-8 text-gray-500">暂无调用链</p>
+                    </div>
+                </div>
+            </div>
         </main>
 
         <!-- 页脚 -->
@@ -609,6 +777,56 @@ def index():
                 // 更新选中按钮样式
                 event.currentTarget.classList.add('text-primary', 'border-b-2', 'border-primary');
                 event.currentTarget.classList.remove('text-gray-500');
+                            
+                if (tabName === 'trace') {
+                    loadTrace();
+                }
+            }
+
+            // 调用链瀑布图：每行一个span，按深度缩进，条形的位置和宽度按相对整个trace的时间比例绘制
+            const traceColors = {
+                'execution': 'bg-primary', 'task': 'bg-secondary', 'agent.execute': 'bg-indigo-400',
+                'agent.tool': 'bg-yellow-400', 'agent.delegation': 'bg-orange-400', 'llm.call': 'bg-green-500',
+                'http.request': 'bg-gray-400'
+            };
+
+            function escapeHtml(text) {
+                const div = document.createElement('div');
+                div.textContent = text;
+                return div.innerHTML;
+            }
+
+            function loadTrace() {
+                const container = document.getElementById('trace-container');
+                if (!executionId) {
+                    return;
+                }
+                fetch(`/api/executions/${executionId}/trace`)
+                    .then(response => response.ok ? response.json() : null)
+                    .then(data => {
+                        if (!data || data.spans.length === 0) {
+                            container.innerHTML = '<p class="text-center py-8 text-gray-500">暂无调用链</p>';
+                            return;
+                        }
+                        const total = Math.max(...data.spans.map(span => span.offset_ms + span.duration_ms), 1);
+                        container.innerHTML = data.spans.map(span => {
+                            const label = span.attributes.agent || span.attributes.description || span.attributes.tool || span.attributes.task || '';
+                            const title = escapeHtml(Object.entries(span.attributes).map(([key, value]) => `${key}: ${value}`).join('\n'));
+                            const left = span.offset_ms / total * 100;
+                            const width = Math.max(span.duration_ms / total * 100, 0.3);
+                            const color = span.status === 'error' ? 'bg-red-500' : (traceColors[span.name] || 'bg-gray-400');
+                            return `<div class="flex items-center py-1 hover:bg-gray-50" title="${title}">
+                                <div class="w-72 flex-shrink-0 truncate" style="padding-left: ${span.depth * 12}px">
+                                    <span class="font-medium">${escapeHtml(span.name)}</span>
+                                    <span class="text-gray-500 ml-1">${escapeHtml(String(label))}</span>
+                                </div>
+                                <div class="flex-1 relative h-4 min-w-[300px]">
+                                    <div class="absolute h-4 rounded ${color}" style="left: ${left}%; width: ${width}%"></div>
+                                </div>
+                                <div class="w-24 text-right text-gray-500">${span.duration_ms.toFixed(1)} ms</div>
+                            </div>`;
+                        }).join('');
+                    });
             }
 
             // 导航栏滚动效果
@@ -633,10 +851,26 @@ def index():
                 })
                 .then(response => response.json())
                 .then(data => {
-                    if (data.status === 'started') {
-                        this.innerHTML = '<i class="fa fa-refresh fa-spin mr-2"></i>执行中...';
-                        document.getElementById('system-status').textContent = 'Running';
+                    if (data.status === 'started' || data.status === 'queued') {
+                        this.innerHTML = data.status === 'queued' ?
+                            '<i class="fa fa-hourglass-half mr-2"></i>排队中...' :
+                            '<i class="fa fa-refresh fa-spin mr-2"></i>执行中...';
+                        document.getElementById('execution-id').textContent = data.execution_id;
+                        document.getElementById('system-status').textContent = data.status.charAt(0).toUpperCase() + data.status.slice(1);
                         document.getElementById('system-status').classList.add('text-green-500');
+                        document.getElementById('cancel-btn').classList.remove('hidden');
+                        // 切换到新执行的事件流
+                        executionId = data.execution_id;
+                        lastEventId = null;
+                        const olderLogsBtn = document.getElementById('load-older-logs');
+                        if (olderLogsBtn) {
+                            olderLogsBtn.remove();
+                        }
+                        connectSSE();
+                    } else {
+                        alert(data.message);
+                        this.disabled = false;
+                        this.innerHTML = '<i class="fa fa-play mr-2"></i>启动任务';
                     }
                 })
                 .catch(error => {
@@ -646,181 +880,500 @@ def index():
                 });
             });
 
+            // 取消按钮事件：取消当前执行（排队中的不再运行，运行中的中断进行中的LLM请求）
+            document.getElementById('cancel-btn').addEventListener('click', function() {
+                if (!executionId) {
+                    return;
+                }
+                this.disabled = true;
+                fetch(`/api/executions/${executionId}/cancel`, {
+                    method: 'POST'
+                })
+                .then(response => response.json())
+                .then(data => {
+                    if (data.status === 'error') {
+                        alert(data.message);
+                    }
+                    this.disabled = false;
+                })
+                .catch(error => {
+                    console.error('取消执行失败:', error);
+                    this.disabled = false;
+                });
+            });
+
             // 实时更新数据的WebSocket-like实现
+            // 当前跟踪的执行ID，以及最后收到的事件ID（重连时用于补发断线期间的事件）
+            let executionId = {{ execution_data.execution_id|tojson }};
+            let lastEventId = null;
+            let source = null;
+            
             function connectSSE() {
-                const source = new EventSource('/api/events');
+                if (source) {
+                    source.close();
+                }
+                const base = executionId ? `/api/executions/${executionId}/events` : '/api/events';
+                const url = lastEventId ? `${base}?last_event_id=${lastEventId}` : base;
+                source = new EventSource(url);
                 
                 source.onmessage = function(event) {
+                    if (event.lastEventId) {
+                        lastEventId = event.lastEventId;
+                    }
                     try {
-                        const data = JSON.parse(event.data);
-                        
-                        // 根据数据类型更新UI
-                        if (data.type === 'status_update') {
-                            document.getElementById('progress-percent').textContent = data.data.progress + '%';
-                            document.getElementById('progress-bar').style.width = data.data.progress + '%';
-                            document.getElementById('current-task').textContent = data.data.current_task || '等待开始';
-                            document.getElementById('system-status').textContent = data.data.status.charAt(0).toUpperCase() + data.data.status.slice(1);
-                            
-                            // 更新状态颜色
-                            const statusElement = document.getElementById('system-status');
-                            statusElement.classList.remove('text-green-500', 'text-red-500', 'text-blue-500');
-                            if (data.data.status === 'running') {
-                                statusElement.classList.add('text-green-500');
-                            } else if (data.data.status === 'error') {
-                                statusElement.classList.add('text-red-500');
-                            } else if (data.data.status === 'completed') {
-                                statusElement.classList.add('text-blue-500');
-                                // 任务完成后启用按钮
-                                const startBtn = document.getElementById('start-btn');
-                                startBtn.disabled = false;
-                                startBtn.innerHTML = '<i class="fa fa-play mr-2"></i>重新开始';
-                            }
+                        handleEvent(JSON.parse(event.data));
+                    } catch (e) {
+                        console.error('解析事件数据失败:', e);
+                    }
+                };
+                
+                source.onerror = function(event) {
+                    console.error('SSE连接错误:', event);
+                    // 关闭当前连接，带上最后的事件ID重新连接
+                    source.close();
+                    setTimeout(connectSSE, 5000);
+                };
+            }
+
+            // 根据事件类型更新UI（SSE事件与页面外壳加载的初始数据共用）
+            function handleEvent(data) {
+                if (data.type === 'resync') {
+                    // 服务端因缓冲区溢出丢弃了事件，重新加载页面获取完整状态
+                    window.location.reload();
+                }
+                
+                else if (data.type === 'status_update') {
+                    document.getElementById('progress-percent').textContent = data.data.progress + '%';
+                    document.getElementById('progress-bar').style.width = data.data.progress + '%';
+                    document.getElementById('current-task').textContent = data.data.current_task || '等待开始';
+                    document.getElementById('system-status').textContent = data.data.status.charAt(0).toUpperCase() + data.data.status.slice(1);
+                    
+                    // 更新状态颜色
+                    const statusElement = document.getElementById('system-status');
+                    statusElement.classList.remove('text-green-500', 'text-red-500', 'text-blue-500', 'text-gray-500');
+                    if (data.data.status === 'running') {
+                        statusElement.classList.add('text-green-500');
+                        document.getElementById('cancel-btn').classList.remove('hidden');
+                    } else if (data.data.status === 'error') {
+                        statusElement.classList.add('text-red-500');
+                    } else if (data.data.status === 'completed' || data.data.status === 'cancelled') {
+                        statusElement.classList.add(data.data.status === 'completed' ? 'text-blue-500' : 'text-gray-500');
+                        // 任务完成或取消后启用按钮
+                        const startBtn = document.getElementById('start-btn');
+                        startBtn.disabled = false;
+                        startBtn.innerHTML = '<i class="fa fa-play mr-2"></i>重新开始';
+                    }
+                    // 执行结束后隐藏取消按钮并刷新调用链（稍作延迟，等待根span结束）
+                    if (data.data.status === 'completed' || data.data.status === 'error' || data.data.status === 'cancelled') {
+                        document.getElementById('cancel-btn').classList.add('hidden');
+                        setTimeout(loadTrace, 500);
+                    }
+                }
+                
+                else if (data.type === 'log') {
+                    const logsContainer = document.getElementById('logs-container');
+                    const logsList = document.getElementById('logs-list');
+                    // 清除空状态提示
+                    if (logsList.querySelector('.text-center')) {
+                        logsList.innerHTML = '';
+                    }
+                    const logItem = document.createElement('li');
+                    logItem.className = data.data.includes('ERROR') ? 
+                        'p-2 rounded-lg bg-red-50 text-red-800' : 
+                        'p-2 rounded-lg bg-blue-50 text-blue-800';
+                    logItem.textContent = data.data;
+                    logsList.appendChild(logItem);
+                    // 滚动到底部
+                    logsContainer.scrollTop = logsContainer.scrollHeight;
+                }
+                
+                else if (data.type === 'interaction') {
+                    const interactionsContainer = document.getElementById('interactions-container');
+                    // 清除空状态提示
+                    if (interactionsContainer.querySelector('.text-center')) {
+                        interactionsContainer.innerHTML = '';
+                    }
+                    
+                    const interactionHtml = `
+                        <div class="p-4 hover:bg-gray-50 transition-colors">
+                            <div class="flex items-center justify-between mb-2">
+                                <div class="flex items-center">
+                                    <span class="bg-blue-100 text-blue-800 text-xs font-medium px-2.5 py-0.5 rounded mr-3">${data.data.from_agent}</span>
+                                    <i class="fa fa-arrow-right text-gray-400 mx-2"></i>
+                                    <span class="bg-green-100 text-green-800 text-xs font-medium px-2.5 py-0.5 rounded">${data.data.to_agent}</span>
+                                </div>
+                                <span class="text-xs text-gray-500">${data.data.timestamp}</span>
+                            </div>
+                            <div class="bg-gray-50 rounded-lg p-3 text-sm">
+                                ${data.data.content}
+                            </div>
+                        </div>
+                    `;
+                    interactionsContainer.insertAdjacentHTML('beforeend', interactionHtml);
+                    document.getElementById('interaction-count').textContent = 
+                        parseInt(document.getElementById('interaction-count').textContent) + 1;
+                }
+                
+                else if (data.type === 'agent_update') {
+                    const agentsContainer = document.getElementById('agents-container');
+                    const agentName = data.data.name;
+                    let agentElement = document.querySelector(`[data-agent-name="${agentName}"]`);
+                    
+                    if (!agentElement) {
+                        // 移除空状态提示
+                        if (agentsContainer.querySelector('.text-center')) {
+                            agentsContainer.innerHTML = '';
                         }
                         
-                        else if (data.type === 'log') {
-                            const logsContainer = document.getElementById('logs-container');
-                            const logItem = document.createElement('li');
-                            logItem.className = data.data.includes('ERROR') ? 
-                                'p-2 rounded-lg bg-red-50 text-red-800' : 
-                                'p-2 rounded-lg bg-blue-50 text-blue-800';
-                            logItem.textContent = data.data;
-                            logsContainer.appendChild(logItem);
-                            // 滚动到底部
-                            logsContainer.scrollTop = logsContainer.scrollHeight;
-                        }
+                        // 创建新的智能体卡片
+                        const agentHtml = `
+                            <div class="bg-white rounded-xl shadow-lg overflow-hidden card-hover" data-agent-name="${agentName}">
+                                <div class="bg-primary/10 p-4 border-l-4 border-primary">
+                                    <h3 class="text-xl font-bold flex items-center">
+                                        <i class="fa fa-user-circle text-primary mr-3"></i>
+                                        ${agentName}
+                                    </h3>
+                                    <p class="text-gray-600 text-sm mt-1">${data.data.role}</p>
+                                </div>
+                                <div class="p-4 agent-tasks">
+                                    <!-- 任务内容将动态添加 -->
+                                </div>
+                            </div>
+                        `;
+                        agentsContainer.insertAdjacentHTML('beforeend', agentHtml);
+                        agentElement = document.querySelector(`[data-agent-name="${agentName}"]`);
+                        document.getElementById('agent-count').textContent = 
+                            parseInt(document.getElementById('agent-count').textContent) + 1;
+                    }
+                    
+                    // 更新任务内容
+                    if (data.data.tasks && data.data.tasks.length > 0) {
+                        const tasksContainer = agentElement.querySelector('.agent-tasks');
+                        tasksContainer.innerHTML = '';
                         
-                        else if (data.type === 'interaction') {
-                            const interactionsContainer = document.getElementById('interactions-container');
-                            // 清除空状态提示
-                            if (interactionsContainer.querySelector('.text-center')) {
-                                interactionsContainer.innerHTML = '';
-                            }
-                            
-                            const interactionHtml = `
-                                <div class="p-4 hover:bg-gray-50 transition-colors">
-                                    <div class="flex items-center justify-between mb-2">
-                                        <div class="flex items-center">
-                                            <span class="bg-blue-100 text-blue-800 text-xs font-medium px-2.5 py-0.5 rounded mr-3">${data.data.from_agent}</span>
-                                            <i class="fa fa-arrow-right text-gray-400 mx-2"></i>
-                                            <span class="bg-green-100 text-green-800 text-xs font-medium px-2.5 py-0.5 rounded">${data.data.to_agent}</span>
-                                        </div>
-                                        <span class="text-xs text-gray-500">${data.data.timestamp}</span>
+                        data.data.tasks.forEach(task => {
+                            const taskHtml = `
+                                <div class="mb-4" data-task-id="${task.task_id}">
+                                    <div class="flex items-start mb-2">
+                                        <i class="fa fa-tasks text-secondary mt-1 mr-2"></i>
+                                        <h4 class="font-semibold text-sm">${task.description}</h4>
                                     </div>
                                     <div class="bg-gray-50 rounded-lg p-3 text-sm">
-                                        ${data.data.content}
+                                        <pre class="whitespace-pre-wrap word-break">${task.output}</pre>
                                     </div>
                                 </div>
                             `;
-                            interactionsContainer.insertAdjacentHTML('beforeend', interactionHtml);
-                            document.getElementById('interaction-count').textContent = 
-                                parseInt(document.getElementById('interaction-count').textContent) + 1;
-                        }
-                        
-                        else if (data.type === 'agent_update') {
-                            const agentsContainer = document.getElementById('agents-container');
-                            const agentName = data.data.name;
-                            let agentElement = document.querySelector(`[data-agent-name="${agentName}"]`);
-                            
-                            if (!agentElement) {
-                                // 移除空状态提示
-                                if (agentsContainer.querySelector('.text-center')) {
-                                    agentsContainer.innerHTML = '';
-                                }
-                                
-                                // 创建新的智能体卡片
-                                const agentHtml = `
-                                    <div class="bg-white rounded-xl shadow-lg overflow-hidden card-hover" data-agent-name="${agentName}">
-                                        <div class="bg-primary/10 p-4 border-l-4 border-primary">
-                                            <h3 class="text-xl font-bold flex items-center">
-                                                <i class="fa fa-user-circle text-primary mr-3"></i>
-                                                ${agentName}
-                                            </h3>
-                                            <p class="text-gray-600 text-sm mt-1">${data.data.role}</p>
-                                        </div>
-                                        <div class="p-4 agent-tasks">
-                                            <!-- 任务内容将动态添加 -->
-                                        </div>
-                                    </div>
-                                `;
-                                agentsContainer.insertAdjacentHTML('beforeend', agentHtml);
-                                agentElement = document.querySelector(`[data-agent-name="${agentName}"]`);
-                                document.getElementById('agent-count').textContent = 
-                                    parseInt(document.getElementById('agent-count').textContent) + 1;
-                            }
-                            
-                            // 更新任务内容
-                            if (data.data.tasks && data.data.tasks.length > 0) {
-                                const tasksContainer = agentElement.querySelector('.agent-tasks');
-                                tasksContainer.innerHTML = '';
-                                
-                                data.data.tasks.forEach(task => {
-                                    const taskHtml = `
-                                        <div class="mb-4">
-                                            <div class="flex items-start mb-2">
-                                                <i class="fa fa-tasks text-secondary mt-1 mr-2"></i>
-                                                <h4 class="font-semibold text-sm">${task.description}</h4>
-                                            </div>
-                                            <div class="bg-gray-50 rounded-lg p-3 text-sm">
-                                                <pre class="whitespace-pre-wrap word-break">${task.output}</pre>
-                                            </div>
-                                        </div>
-                                    `;
-                                    tasksContainer.insertAdjacentHTML('beforeend', taskHtml);
-                                });
-                            }
-                        }
-                    } catch (e) {
-                        console.error('解析事件数据失败:', e);
+                            tasksContainer.insertAdjacentHTML('beforeend', taskHtml);
+                        });
                     }
-                };
+                }
                 
-                source.onerror = function(event) {
-                    console.error('SSE连接错误:', event);
-                    // 尝试重新连接
-                    setTimeout(connectSSE, 5000);
-                };
+                else if (data.type === 'task_delta') {
+                    // LLM流式输出：追加到对应任务的输出中，任务完成后由agent_update给出完整内容
+                    const agentElement = document.querySelector(`[data-agent-name="${data.data.agent}"]`);
+                    const taskElement = agentElement && agentElement.querySelector(`[data-task-id="${data.data.task_id}"]`);
+                    if (taskElement) {
+                        const output = taskElement.querySelector('pre');
+                        output.textContent = data.data.reset ? data.data.delta : output.textContent + data.data.delta;
+                    }
+                }
+            }
+
+            // 按需加载更早的日志，每次读取一页插入到列表顶部
+            function renderLogItem(log) {
+                const logItem = document.createElement('li');
+                logItem.className = log.level === 'error' ?
+                    'p-2 rounded-lg bg-red-50 text-red-800' :
+                    'p-2 rounded-lg bg-blue-50 text-blue-800';
+                logItem.textContent = `${log.timestamp} - ${log.level.toUpperCase()} - ${log.message}`;
+                return logItem;
+            }
+            
+            function showOlderLogsButton(beforeSeq) {
+                const olderLogsBtn = document.createElement('button');
+                olderLogsBtn.id = 'load-older-logs';
+                olderLogsBtn.dataset.beforeSeq = beforeSeq;
+                olderLogsBtn.className = 'w-full mb-2 text-sm text-primary hover:underline';
+                olderLogsBtn.innerHTML = '<i class="fa fa-history mr-1"></i>加载更早的日志';
+                const logsList = document.getElementById('logs-list');
+                logsList.parentNode.insertBefore(olderLogsBtn, logsList);
+                olderLogsBtn.addEventListener('click', function() {
+                    fetch(`/api/executions/${executionId}/logs?before_seq=${this.dataset.beforeSeq}&limit=100`)
+                    .then(response => response.json())
+                    .then(data => {
+                        const logsList = document.getElementById('logs-list');
+                        data.logs.slice().reverse().forEach(log => {
+                            logsList.insertBefore(renderLogItem(log), logsList.firstChild);
+                        });
+                        if (!data.logs.length || data.logs[0].seq <= 1) {
+                            this.remove();
+                        } else {
+                            this.dataset.beforeSeq = data.prev_before_seq;
+                        }
+                    })
+                    .catch(error => console.error('加载日志失败:', error));
+                });
+            }
+
+            // 页面外壳：通过API加载执行数据，复用事件处理逻辑渲染后再连接SSE
+            function loadExecutionData() {
+                fetch('/api/execution-data' + window.location.search)
+                .then(response => response.json())
+                .then(data => {
+                    executionId = data.execution_id;
+                    document.getElementById('execution-id').textContent = data.execution_id || '-';
+                    document.getElementById('start-time').textContent = data.start_time || '-';
+                    data.agents.forEach(agent => handleEvent({type: 'agent_update', data: agent}));
+                    data.agent_interactions.forEach(interaction => handleEvent({type: 'interaction', data: interaction}));
+                    data.system_logs.forEach(log => handleEvent({type: 'log', data: log}));
+                    handleEvent({type: 'status_update', data: data});
+                    if (data.log_first_seq && data.log_first_seq > 1) {
+                        showOlderLogsButton(data.log_first_seq);
+                    }
+                })
+                .catch(error => console.error('加载执行数据失败:', error))
+                .finally(connectSSE);
             }
 
             // 页面加载完成后连接SSE
             document.addEventListener('DOMContentLoaded', function() {
+                {% if shell %}
+                loadExecutionData();
+                {% else %}
+                {% if execution_data.log_first_seq and execution_data.log_first_seq > 1 %}
+                showOlderLogsButton({{ execution_data.log_first_seq }});
+                {% endif %}
                 connectSSE();
+                {% endif %}
             });
         </script>
     </body>
     </html>
-    '''
-    return render_template_string(html_template, execution_data=execution_data)
+'''
+
+# 模板在启动时编译一次，渲染结果按执行ID和版本缓存
+dashboard_page = CachedTemplate(app.jinja_env, DASHBOARD_TEMPLATE, max_entries=int(os.getenv("PAGE_CACHE_SIZE", "32")))
+
+# 首页路由：轻量的页面外壳，内容不随执行数据变化
+@app.route('/')
+def index():
+    return dashboard_page.render(
+        ("shell", moonshot_model_name),
+        lambda: {"execution_data": idle_execution_data(), "shell": True}
+    )
+
+# 服务端渲染的执行快照页面（默认最近一次执行，?execution_id= 指定历史执行）
+@app.route('/snapshot')
+def snapshot_page():
+    execution_id = request.args.get('execution_id')
+    execution = execution_registry.get(execution_id) if execution_id else execution_registry.latest()
+    if execution is not None:
+        # 缓存键与页面内容取自同一个不可变快照
+        state = execution.state.current
+        return dashboard_page.render(
+            (execution.execution_id, state.version),
+            lambda: {"execution_data": execution.snapshot(log_tail_size, state), "shell": False}
+        )
+    
+    # 已结束的历史执行不会再变化，直接按执行ID缓存
+    if execution_id:
+        page = dashboard_page.get((execution_id, "stored"))
+        if page is not None:
+            return page
+    execution_data = current_execution_data(execution_id)
+    if execution_data is None:
+        return "执行不存在", 404
+    cache_key = (execution_data["execution_id"], "stored") if execution_data["status"] in FINISHED_STATUSES else None
+    return dashboard_page.render(cache_key, lambda: {"execution_data": execution_data, "shell": False})
 
-# API - 获取执行数据
+# API - 获取执行数据（默认最近一次执行，?execution_id= 指定历史执行，?since=<version> 只返回增量）
 @app.route('/api/execution-data')
 def get_execution_data():
-    return jsonify(execution_data)
+    status, body, etag = execution_data_response(
+        request.args.get('execution_id'),
+        since=int_arg('since', None),
+        if_none_match=request.headers.get('If-None-Match')
+    )
+    response = Response(body, status=status, mimetype="application/json")
+    if etag:
+        response.headers['ETag'] = etag
+    return response
 
 # API - 启动执行
 @app.route('/api/start-execution', methods=['POST'])
 def start_execution():
-    if execution_data["status"] == "running":
-        return jsonify({"status": "error", "message": "执行已经在进行中"})
+    return jsonify(start_execution_in_background())
+
+# 登记新执行并交给工作线程池（WSGI与ASGI入口共用）
+def start_execution_in_background():
+    try:
+        execution = execution_registry.submit()
+    except ExecutionQueueFull as e:
+        return {"status": "error", "message": str(e)}
     
-    # 在后台线程中运行多智能体系统
-    thread = Thread(target=run_multi_agent_system)
-    thread.daemon = True
-    thread.start()
+    # 工作线程都被占用时，新执行需要排队
+    if execution_registry.running_count + execution_registry.queued_count > execution_registry.max_workers:
+        return {"status": "queued", "execution_id": execution.execution_id, "message": "执行已进入队列"}
+    return {"status": "started", "execution_id": execution.execution_id, "message": "执行已开始"}
+
+# API - 执行列表 / 启动新执行
+@app.route('/api/executions', methods=['GET', 'POST'])
+def executions():
+    if request.method == 'POST':
+        result = start_execution_in_background()
+        return jsonify(result), 429 if result["status"] == "error" else 202
+    # 历史执行从存储分页读取，仍在内存中的执行使用实时摘要
+    executions = []
+    for row in execution_store.list_executions(
+        limit=int_arg('limit', 50, maximum=500),
+        offset=int_arg('offset', 0),
+        status=request.args.get('status')
+    ):
+        execution = execution_registry.get(row["execution_id"])
+        executions.append(execution.summary() if execution is not None else row)
+    return jsonify({
+        "executions": executions,
+        "running": execution_registry.running_count,
+        "queued": execution_registry.queued_count,
+        "max_workers": execution_registry.max_workers
+    })
+
+# API - 取消执行：排队中的执行不再运行，运行中的执行中断进行中的LLM请求
+@app.route('/api/executions/<execution_id>/cancel', methods=['POST'])
+def cancel_execution(execution_id):
+    cancelled = execution_registry.cancel(execution_id)
+    if cancelled is None:
+        return jsonify({"status": "error", "message": "执行不存在"}), 404
+    if not cancelled:
+        return jsonify({"status": "error", "message": "执行已结束，无法取消"}), 409
+    return jsonify({"status": "cancelling", "execution_id": execution_id, "message": "已发出取消"}), 202
+
+# API - 单次执行的完整数据
+@app.route('/api/executions/<execution_id>')
+def execution_detail(execution_id):
+    execution_data = find_execution_data(execution_id)
+    if execution_data is None:
+        return jsonify({"status": "error", "message": "执行不存在"}), 404
+    return jsonify(execution_data)
+
+# API - 按序号分页读取执行日志
+# ?after_seq= 向后读取，?before_seq= 向前读取（都不指定时读取最近的日志），另支持limit、level、since/until
+@app.route('/api/executions/<execution_id>/logs')
+def execution_logs(execution_id):
+    after_seq = int_arg('after_seq', None)
+    before_seq = int_arg('before_seq', None)
+    limit = int_arg('limit', 100, maximum=1000)
+    level = request.args.get('level')
+    since = request.args.get('since')
+    until = request.args.get('until')
     
-    return jsonify({"status": "started", "message": "执行已开始"})
+    logs = None
+    execution = execution_registry.get(execution_id)
+    if execution is not None and not since and not until:
+        # 运行中的执行优先从内存环形缓冲区读取，所需范围已被淘汰时再查询存储
+        logs = execution.logs.query(after_seq=after_seq, before_seq=before_seq, limit=limit, level=level)
+    if logs is None:
+        logs = execution_store.get_logs(
+            execution_id, after_seq=after_seq, before_seq=before_seq, limit=limit,
+            since=since, until=until, level=level
+        )
+    return jsonify({
+        "logs": logs,
+        "next_after_seq": logs[-1]["seq"] if logs else after_seq,
+        "prev_before_seq": logs[0]["seq"] if logs else before_seq
+    })
 
-# API - Server-Sent Events 端点
-@app.route('/api/events')
-def events():
+# API - 分页读取智能体交互（?agent=&after_id=&limit=&since=&until=）
+@app.route('/api/executions/<execution_id>/interactions')
+def execution_interactions(execution_id):
+    interactions = execution_store.get_interactions(
+        execution_id,
+        agent=request.args.get('agent'),
+        after_id=int_arg('after_id', 0),
+        limit=int_arg('limit', 100, maximum=1000),
+        since=request.args.get('since'),
+        until=request.args.get('until')
+    )
+    return jsonify({
+        "interactions": interactions,
+        "next_after_id": interactions[-1]["id"] if interactions else None
+    })
+
+# API - 工作进程：任务队列模式下列出在线的工作进程及其槽位和运行数
+@app.route('/api/workers')
+def workers():
+    if execution_backend != "queue":
+        return jsonify({"backend": execution_backend, "workers": []})
+    return jsonify({
+        "backend": execution_backend,
+        "workers": execution_registry.workers(),
+        "jobs": execution_registry.job_queue.counts()
+    })
+
+# API - 共享HTTP连接池的状态
+@app.route('/api/http-pool')
+def http_pool_status():
+    return jsonify(http_pool_stats())
+
+# API - 执行的调用链：按开始时间排序的span，附带相对执行开始的偏移和嵌套深度，供控制台绘制瀑布图
+@app.route('/api/executions/<execution_id>/trace')
+def execution_trace(execution_id):
+    trace_id = trace_id_for(execution_id)
+    spans = tracer.get_trace(trace_id)
+    if spans is None:
+        return jsonify({"status": "error", "message": "调用链不存在或已被淘汰"}), 404
+    
+    trace_start = spans[0].start_ns
+    depths = {}
+    result = []
+    for span in spans:
+        depth = depths[span.span_id] = depths.get(span.parent_id, -1) + 1
+        span_data = span.to_dict()
+        span_data["offset_ms"] = round((span.start_ns - trace_start) / 1e6, 3)
+        span_data["depth"] = depth
+        result.append(span_data)
+    return jsonify({"execution_id": execution_id, "trace_id": trace_id, "spans": result})
+
+# 解析SSE订阅参数并返回事件流响应
+def event_stream_response(broadcaster):
+    # 支持按事件类型(?types=log,agent_update)和智能体(?agent=产品经理)过滤
+    event_types = request.args.get('types')
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    subscription = broadcaster.subscribe(
+        event_types=event_types.split(',') if event_types else None,
+        agent=request.args.get('agent'),
+        last_event_id=int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    )
+    
     def event_stream():
-        while True:
-            if not execution_queue.empty():
-                event = execution_queue.get()
-                yield f'data: {json.dumps(event)}\n\n'
-            time.sleep(0.1)
+        try:
+            while True:
+                payload = subscription.get(timeout=sse_heartbeat_seconds)
+                # 没有事件时发送注释行作为心跳，保持连接
+                yield payload if payload is not None else ': keep-alive\n\n'
+        finally:
+            subscription.close()
     
     return Response(event_stream(), mimetype="text/event-stream")
 
+# Prometheus格式的指标
+@app.route('/metrics')
+def metrics():
+    return Response(REGISTRY.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+# API - Server-Sent Events 端点（所有执行的事件）
+@app.route('/api/events')
+def events():
+    return event_stream_response(event_broadcaster)
+
+# API - 单次执行的Server-Sent Events
+@app.route('/api/executions/<execution_id>/events')
+def execution_events(execution_id):
+    execution = execution_registry.get(execution_id)
+    if execution is None:
+        return jsonify({"status": "error", "message": "执行不存在"}), 404
+    return event_stream_response(execution.broadcaster)
+
 if __name__ == '__main__':
     # 从环境变量读取配置
     port = int(os.getenv('PORT', 5003))
@@ -0,0 +1,186 @@
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+
+from metrics import EVENT_FANOUT_SECONDS
+
+# 缓冲区满时可以合并的事件类型：只需保留最新的一条
+_COALESCE_KEYS = {
+    "status_update": lambda data: "status_update",
+    "agent_update": lambda data: f"agent_update:{data.get('name')}"
+}
+
+
+class BroadcastEvent:
+    """已序列化好的事件，所有订阅者共享同一份SSE文本"""
+
+    __slots__ = ("id", "type", "agents", "coalesce_key", "payload")
+
+    def __init__(self, event_id, event_type, data):
+        self.id = event_id
+        self.type = event_type
+        self.agents = {
+            data.get(field) for field in ("name", "from_agent", "to_agent", "agent")
+            if isinstance(data, dict) and data.get(field)
+        }
+        key_func = _COALESCE_KEYS.get(event_type)
+        self.coalesce_key = key_func(data) if key_func and isinstance(data, dict) else None
+        body = json.dumps({"type": event_type, "data": data}, ensure_ascii=False)
+        self.payload = f"id: {event_id}\ndata: {body}\n\n"
+
+
+class Subscription:
+    """单个SSE连接的订阅，拥有独立的有界缓冲区"""
+
+    def __init__(self, broadcaster, buffer_size, event_types=None, agent=None):
+        self.broadcaster = broadcaster
+        self.buffer_size = buffer_size
+        self.event_types = set(event_types) if event_types else None
+        self.agent = agent
+        self.dropped = 0
+        self._buffer = deque()
+        self._overflowed = False
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def matches(self, event):
+        if self.event_types is not None and event.type not in self.event_types:
+            return False
+        if self.agent is not None and self.agent not in event.agents:
+            return False
+        return True
+
+    def offer(self, event):
+        """投递事件；缓冲区满时先尝试合并同类事件，否则丢弃最旧的事件"""
+        with self._cond:
+            if len(self._buffer) >= self.buffer_size:
+                stale = None
+                if event.coalesce_key is not None:
+                    stale = next((e for e in self._buffer if e.coalesce_key == event.coalesce_key), None)
+                if stale is not None:
+                    self._buffer.remove(stale)
+                else:
+                    self._buffer.popleft()
+                    self.dropped += 1
+                    self._overflowed = True
+            self._buffer.append(event)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """阻塞等待下一条事件，返回SSE文本；超时或订阅关闭时返回None"""
+        with self._cond:
+            if not self._buffer and not self._closed:
+                self._cond.wait(timeout)
+            if self._overflowed:
+                # 有事件被丢弃时通知客户端重新拉取完整状态
+                self._overflowed = False
+                return 'data: {"type": "resync", "data": null}\n\n'
+            if self._buffer:
+                return self._buffer.popleft().payload
+            return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.broadcaster.unsubscribe(self)
+
+
+class AsyncSubscription(Subscription):
+    """供asyncio使用的订阅：等待事件时不占用线程，发布线程通过事件循环唤醒"""
+
+    def __init__(self, broadcaster, buffer_size, loop, event_types=None, agent=None):
+        super().__init__(broadcaster, buffer_size, event_types, agent)
+        self._loop = loop
+        self._ready = asyncio.Event()
+        # 只有协程正在等待时才需要跨线程唤醒事件循环
+        self._waiting = False
+
+    def offer(self, event):
+        super().offer(event)
+        if not self._waiting:
+            return
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # 事件循环已关闭，连接随之结束
+            pass
+
+    async def aget(self, timeout=None):
+        """等待下一条事件，返回SSE文本；超时返回None"""
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        self._waiting = True
+        try:
+            while True:
+                self._ready.clear()
+                payload = self.get(timeout=0)
+                if payload is not None or self._closed:
+                    return payload
+                remaining = deadline - time.monotonic() if deadline is not None else None
+                if remaining is not None and remaining <= 0:
+                    return None
+                try:
+                    await asyncio.wait_for(self._ready.wait(), remaining)
+                except asyncio.TimeoutError:
+                    return None
+        finally:
+            self._waiting = False
+
+
+class EventBroadcaster:
+    """发布/订阅事件广播器：事件带有单调递增的ID，断线重连可按Last-Event-ID补发"""
+
+    def __init__(self, history_size=1000, buffer_size=500):
+        self.history_size = history_size
+        self.buffer_size = buffer_size
+        self._history = deque(maxlen=history_size)
+        self._subscribers = set()
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def publish(self, event_type, data):
+        """发布事件：只序列化一次，再分发给所有匹配的订阅者"""
+        started = time.perf_counter()
+        with self._lock:
+            event = BroadcastEvent(self._next_id, event_type, data)
+            self._next_id += 1
+            self._history.append(event)
+            for subscription in self._subscribers:
+                if subscription.matches(event):
+                    subscription.offer(event)
+        EVENT_FANOUT_SECONDS.observe(time.perf_counter() - started)
+        return event.id
+
+    def subscribe(self, event_types=None, agent=None, last_event_id=None):
+        """创建订阅；提供last_event_id时先补发该ID之后仍在历史记录中的事件"""
+        subscription = Subscription(self, self.buffer_size, event_types, agent)
+        return self._register(subscription, last_event_id)
+
+    def subscribe_async(self, event_types=None, agent=None, last_event_id=None):
+        """在当前事件循环中创建异步订阅"""
+        loop = asyncio.get_running_loop()
+        subscription = AsyncSubscription(self, self.buffer_size, loop, event_types, agent)
+        return self._register(subscription, last_event_id)
+
+    def _register(self, subscription, last_event_id):
+        with self._lock:
+            if last_event_id is not None:
+                if last_event_id >= self._next_id:
+                    # 客户端的ID比服务端还新，说明服务端已重启，从头补发
+                    last_event_id = 0
+                for event in self._history:
+                    if event.id > last_event_id and subscription.matches(event):
+                        subscription.offer(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
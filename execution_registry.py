@@ -0,0 +1,303 @@
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from event_broadcaster import EventBroadcaster
+from execution_state import VersionedExecutionState
+from log_buffer import LogRingBuffer, format_log_entry
+
+logger = logging.getLogger(__name__)
+
+# 已结束的执行状态
+FINISHED_STATUSES = ("completed", "error", "cancelled")
+
+
+class ExecutionQueueFull(Exception):
+    """排队等待的执行数已达上限"""
+
+
+class Execution:
+    """单次执行：保存该次执行的数据，并拥有独立的事件流"""
+
+    def __init__(self, execution_id, model, history_size=1000, buffer_size=500, firehose=None,
+                 log_capacity=1000, journal_size=10000):
+        self.execution_id = execution_id
+        # 执行状态按写时复制保存为不可变快照，每次修改递增版本号并登记变更，用于增量响应
+        self.state = VersionedExecutionState(
+            execution_id, model, time.strftime("%Y-%m-%d %H:%M:%S"), journal_size
+        )
+        self.broadcaster = EventBroadcaster(history_size=history_size, buffer_size=buffer_size)
+        # 系统日志只在内存中保留最近的log_capacity条，完整日志在持久化存储中
+        self.logs = LogRingBuffer(log_capacity)
+        # 当前任务的开始时间（time.monotonic），用于统计任务耗时
+        self.task_started_at = None
+        # 汇总所有执行事件的广播器（/api/events）
+        self._firehose = firehose
+        # 取消相关：已请求取消、运行该执行的asyncio任务、线程池中的Future（由ExecutionRegistry维护）
+        self.cancel_requested = False
+        self.task = None
+        self.future = None
+
+    @property
+    def status(self):
+        return self.state.current.status
+
+    @property
+    def version(self):
+        return self.state.current.version
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    def publish(self, event_type, data):
+        """同时发布到本次执行的事件流和汇总事件流"""
+        self.broadcaster.publish(event_type, data)
+        if self._firehose is not None:
+            self._firehose.publish(event_type, data)
+
+    def snapshot(self, log_tail=100, state=None):
+        """对外返回的执行数据：system_logs只包含最近log_tail条日志，并附带序号范围供分页读取
+
+        state为已取得的ExecutionState快照，默认使用最新版本。
+        """
+        state = state or self.state.current
+        # 只取该版本快照已登记的日志，保证各部分来自同一版本
+        tail = [entry for entry in self.logs.tail(log_tail) if entry["seq"] <= state.log_last_seq]
+        snapshot = state.to_dict()
+        snapshot["full"] = True
+        snapshot["system_logs"] = [format_log_entry(entry) for entry in tail]
+        snapshot["log_first_seq"] = tail[0]["seq"] if tail else None
+        snapshot["log_last_seq"] = state.log_last_seq
+        return snapshot
+
+    def delta(self, since):
+        """返回since版本之后修改过的智能体（含任务）、新增的交互和日志，以及当前状态字段
+
+        变更记录已被淘汰、所需日志已不在缓冲区或since不是本次执行的版本时返回None，调用方应返回完整数据。
+        """
+        state, changes = self.state.changes_since(since)
+        if changes is None:
+            return None
+        agent_names = {key for kind, key in changes if kind == "agent"}
+        interaction_indexes = sorted({key for kind, key in changes if kind == "interaction"})
+        log_seqs = [key for kind, key in changes if kind == "log"]
+        logs = self.logs.query(after_seq=min(log_seqs) - 1, limit=None) if log_seqs else []
+        if logs is None:
+            return None
+        interactions = state.interactions
+        return {
+            "execution_id": self.execution_id,
+            "version": state.version,
+            "since": since,
+            "full": False,
+            "status": state.status,
+            "current_task": state.current_task,
+            "progress": state.progress,
+            "start_time": state.start_time,
+            "agents": [agent.to_dict() for name, agent in state.agents.items() if name in agent_names],
+            "agent_interactions": [interactions[index].to_dict() for index in interaction_indexes],
+            "system_logs": [format_log_entry(entry) for entry in logs if entry["seq"] <= state.log_last_seq],
+            "log_last_seq": state.log_last_seq
+        }
+
+    def summary(self):
+        """列表接口使用的摘要，不包含日志和任务输出"""
+        state = self.state.current
+        summary = state.header()
+        del summary["version"]
+        summary["agent_count"] = len(state.agents)
+        summary["subscriber_count"] = self.broadcaster.subscriber_count
+        return summary
+
+
+class ExecutionRegistry:
+    """执行注册表：按execution_id登记执行，最多max_workers个同时运行，超出并发上限的执行排队等待
+
+    target为协程函数时在事件循环中运行：attach_loop指定的事件循环（ASGI服务的事件循环），未指定时在
+    注册表自己的后台线程中运行一个事件循环；所有执行共用同一个事件循环，等待LLM响应时不占用线程，
+    排队中和运行中的执行都可以取消。target为普通函数时由线程池运行，只能取消排队中的执行。
+    """
+
+    def __init__(self, target, max_workers=2, max_queued=20, max_retained=100,
+                 model=None, history_size=1000, buffer_size=500, firehose=None, store=None, log_capacity=1000):
+        if max_workers < 1:
+            raise ValueError("max_workers必须大于等于1")
+        self.target = target
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.max_retained = max_retained
+        self.model = model
+        self.history_size = history_size
+        self.buffer_size = buffer_size
+        self.log_capacity = log_capacity
+        self.firehose = firehose
+        # 可选的持久化存储（ExecutionStore），用于保存执行状态
+        self.store = store
+        self._executions = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crew-execution")
+        self._loop = None
+        self._owns_loop = False
+        # 限制同时运行的协程执行数，在事件循环中创建
+        self._semaphore = None
+
+    def _count(self, status):
+        return sum(1 for execution in self._executions.values() if execution.status == status)
+
+    @property
+    def running_count(self):
+        with self._lock:
+            return self._count("running")
+
+    @property
+    def queued_count(self):
+        with self._lock:
+            return self._count("queued")
+
+    def submit(self):
+        """登记一次新执行并交给线程池；排队数已满时抛出ExecutionQueueFull"""
+        with self._lock:
+            if self._count("queued") >= self.max_queued:
+                raise ExecutionQueueFull(f"排队等待的执行已达上限({self.max_queued})")
+            execution_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+            execution = Execution(execution_id, self.model, self.history_size, self.buffer_size,
+                                  self.firehose, self.log_capacity)
+            self._executions[execution_id] = execution
+            self._save(execution)
+            self._prune()
+        if asyncio.iscoroutinefunction(self.target):
+            asyncio.run_coroutine_threadsafe(self._run_on_loop(execution), self._event_loop())
+        else:
+            execution.future = self._executor.submit(self._run, execution)
+        logger.info(f"已登记执行: {execution_id}")
+        return execution
+
+    def attach_loop(self, loop):
+        """之后登记的协程执行在该事件循环中运行（在ASGI应用启动时调用）"""
+        with self._lock:
+            self._loop = loop
+            self._owns_loop = False
+            self._semaphore = None
+
+    def _event_loop(self):
+        with self._lock:
+            if self._loop is None:
+                # 没有关联事件循环时（例如Flask开发服务器），在后台线程中运行一个供所有执行共用的事件循环
+                self._loop = asyncio.new_event_loop()
+                self._owns_loop = True
+                threading.Thread(target=self._loop.run_forever, name="crew-execution-loop", daemon=True).start()
+            return self._loop
+
+    def _begin(self, execution):
+        """把排队中的执行标记为运行中；已被取消时返回False"""
+        with self._lock:
+            if execution.cancel_requested:
+                return False
+            execution.state.update_status(status="running", start_time=time.strftime("%Y-%m-%d %H:%M:%S"))
+        execution.publish("status_update", {"current_task": None, "status": "running", "progress": 0})
+        self._save(execution)
+        return True
+
+    def _fail(self, execution, error):
+        logger.error(f"执行 {execution.execution_id} 异常退出: {str(error)}")
+        execution.state.update_status(status="error")
+        execution.publish("status_update", {"current_task": "系统错误", "status": "error", "progress": 0})
+        self._save(execution)
+
+    def _mark_cancelled(self, execution):
+        with self._lock:
+            if execution.finished:
+                return
+            state = execution.state.update_status(status="cancelled", current_task="已取消")
+        execution.publish("status_update", {"current_task": "已取消", "status": "cancelled", "progress": state.progress})
+        self._save(execution)
+        logger.info(f"执行已取消: {execution.execution_id}")
+
+    def _run(self, execution):
+        if not self._begin(execution):
+            return
+        try:
+            self.target(execution)
+        except Exception as e:
+            self._fail(execution, e)
+
+    async def _run_on_loop(self, execution):
+        execution.task = asyncio.current_task()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        try:
+            async with self._semaphore:
+                if not self._begin(execution):
+                    return
+                try:
+                    await self.target(execution)
+                except Exception as e:
+                    self._fail(execution, e)
+        except asyncio.CancelledError:
+            self._mark_cancelled(execution)
+
+    def cancel(self, execution_id):
+        """取消执行，返回是否已取消或已发出取消；执行不存在时返回None
+
+        排队中的执行立即标记为已取消；运行中的协程执行在其事件循环中取消，进行中的LLM请求随之中断，
+        状态在协程退出时更新。已结束的执行和正在运行的同步执行无法取消。
+        """
+        execution = self.get(execution_id)
+        if execution is None:
+            return None
+        with self._lock:
+            if execution.finished:
+                return False
+            execution.cancel_requested = True
+            queued = execution.status == "queued"
+            task = execution.task
+        if queued:
+            self._mark_cancelled(execution)
+            if execution.future is not None:
+                execution.future.cancel()
+        if task is not None:
+            try:
+                task.get_loop().call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                # 事件循环已关闭
+                return queued
+            return True
+        return queued
+
+    def _save(self, execution):
+        if self.store is not None:
+            self.store.save_execution(execution.state.current.header())
+
+    def _prune(self):
+        """保留的执行数超过上限时，按登记顺序移除最早的已结束执行"""
+        overflow = len(self._executions) - self.max_retained
+        if overflow <= 0:
+            return
+        for execution_id in [eid for eid, e in self._executions.items() if e.finished][:overflow]:
+            del self._executions[execution_id]
+
+    def get(self, execution_id):
+        with self._lock:
+            return self._executions.get(execution_id)
+
+    def latest(self):
+        """最近登记的执行，没有时返回None"""
+        with self._lock:
+            return next(reversed(self._executions.values()), None)
+
+    def list(self):
+        """按登记时间倒序返回所有执行"""
+        with self._lock:
+            return list(reversed(self._executions.values()))
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+        with self._lock:
+            loop, owns_loop = self._loop, self._owns_loop
+        if owns_loop:
+            loop.call_soon_threadsafe(loop.stop)
@@ -0,0 +1,188 @@
+import hashlib
+import threading
+import dataclasses
+from collections import deque
+from dataclasses import dataclass, field
+from types import MappingProxyType
+
+_EMPTY = MappingProxyType({})
+
+
+def _empty_mapping():
+    return _EMPTY
+
+
+def make_task_id(description):
+    """未显式指定任务ID时，由任务描述生成稳定的短ID"""
+    return hashlib.sha1(description.encode("utf-8")).hexdigest()[:12]
+
+
+@dataclass(frozen=True, slots=True)
+class TaskRecord:
+    task_id: str
+    description: str
+    output: str
+
+    def to_dict(self):
+        return {"task_id": self.task_id, "description": self.description, "output": self.output}
+
+
+@dataclass(frozen=True, slots=True)
+class AgentRecord:
+    name: str
+    role: str
+    # task_id -> TaskRecord，按添加顺序排列
+    tasks: MappingProxyType = field(default_factory=_empty_mapping)
+
+    def to_dict(self):
+        return {"name": self.name, "role": self.role, "tasks": [task.to_dict() for task in self.tasks.values()]}
+
+
+@dataclass(frozen=True, slots=True)
+class InteractionRecord:
+    from_agent: str
+    to_agent: str
+    content: str
+    timestamp: str
+
+    def to_dict(self):
+        return {
+            "from_agent": self.from_agent,
+            "to_agent": self.to_agent,
+            "content": self.content,
+            "timestamp": self.timestamp
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class ExecutionState:
+    """某一版本的执行状态快照，发布后不再修改，读取方无需加锁即可序列化"""
+
+    execution_id: str
+    model: str
+    version: int = 0
+    status: str = "queued"  # queued, running, completed, error
+    queued_time: str = None
+    start_time: str = None
+    current_task: str = None
+    progress: int = 0
+    # 智能体名称 -> AgentRecord
+    agents: MappingProxyType = field(default_factory=_empty_mapping)
+    # 任务ID -> 智能体名称
+    task_index: MappingProxyType = field(default_factory=_empty_mapping)
+    # 交互列表只追加不修改，快照只读取前interaction_count条
+    interaction_log: list = None
+    interaction_count: int = 0
+    log_last_seq: int = 0
+
+    @property
+    def interactions(self):
+        return self.interaction_log[:self.interaction_count] if self.interaction_log else []
+
+    def agent(self, name):
+        return self.agents.get(name)
+
+    def task(self, task_id):
+        """按任务ID查找任务，返回(智能体名称, TaskRecord)，不存在时返回None"""
+        agent_name = self.task_index.get(task_id)
+        if agent_name is None:
+            return None
+        return agent_name, self.agents[agent_name].tasks[task_id]
+
+    def header(self):
+        """执行的状态字段（不含智能体和交互）"""
+        return {
+            "execution_id": self.execution_id,
+            "queued_time": self.queued_time,
+            "start_time": self.start_time,
+            "model": self.model,
+            "status": self.status,
+            "current_task": self.current_task,
+            "progress": self.progress,
+            "version": self.version
+        }
+
+    def to_dict(self):
+        data = self.header()
+        data["agents"] = [agent.to_dict() for agent in self.agents.values()]
+        data["agent_interactions"] = [interaction.to_dict() for interaction in self.interactions]
+        return data
+
+
+class VersionedExecutionState:
+    """执行状态的写入端：每次修改按写时复制生成新的不可变快照并递增版本号
+
+    写入方之间用锁串行化；读取方通过current直接拿到最新快照，不需要加锁，也不会阻塞写入方。
+    每次修改都会登记到有界的变更记录中，用于计算增量。
+    """
+
+    def __init__(self, execution_id, model, queued_time=None, journal_size=10000):
+        self._lock = threading.Lock()
+        self._journal = deque(maxlen=journal_size)
+        self._current = ExecutionState(
+            execution_id=execution_id, model=model, queued_time=queued_time, interaction_log=[]
+        )
+
+    @property
+    def current(self):
+        return self._current
+
+    def _publish(self, kind, key, **changes):
+        # 调用方持有self._lock
+        state = dataclasses.replace(self._current, version=self._current.version + 1, **changes)
+        self._journal.append((state.version, kind, key))
+        self._current = state
+        return state
+
+    def update_status(self, **fields):
+        """更新status、current_task、progress、start_time等状态字段"""
+        with self._lock:
+            return self._publish("status", None, **fields)
+
+    def upsert_agent(self, name, role, task_description=None, task_output=None, task_id=None):
+        """添加或更新智能体及其任务，返回更新后的AgentRecord"""
+        with self._lock:
+            state = self._current
+            agent = state.agents.get(name) or AgentRecord(name=name, role=role)
+            task_index = state.task_index
+            if task_description:
+                task_id = task_id or make_task_id(task_description)
+                task = agent.tasks.get(task_id)
+                if task is None:
+                    task = TaskRecord(task_id, task_description, task_output or "正在处理...")
+                elif task_output:
+                    task = dataclasses.replace(task, output=task_output)
+                tasks = dict(agent.tasks)
+                tasks[task_id] = task
+                agent = dataclasses.replace(agent, tasks=MappingProxyType(tasks))
+                if task_id not in task_index:
+                    task_index = dict(task_index)
+                    task_index[task_id] = name
+                    task_index = MappingProxyType(task_index)
+            agents = dict(state.agents)
+            agents[name] = agent
+            self._publish("agent", name, agents=MappingProxyType(agents), task_index=task_index)
+            return agent
+
+    def add_interaction(self, from_agent, to_agent, content, timestamp):
+        with self._lock:
+            state = self._current
+            interaction = InteractionRecord(from_agent, to_agent, content, timestamp)
+            # 旧快照只读取自己的前interaction_count条，追加不影响它们
+            state.interaction_log.append(interaction)
+            self._publish("interaction", state.interaction_count, interaction_count=state.interaction_count + 1)
+            return interaction
+
+    def mark_log(self, seq):
+        """登记新写入的日志序号（日志本身保存在LogRingBuffer中）"""
+        with self._lock:
+            return self._publish("log", seq, log_last_seq=seq)
+
+    def changes_since(self, since):
+        """返回(最新快照, since之后的变更列表)；变更记录已被淘汰或since无效时返回(最新快照, None)"""
+        with self._lock:
+            state = self._current
+            journal = list(self._journal)
+        if since > state.version or (journal and since < journal[0][0] - 1):
+            return state, None
+        return state, [(kind, key) for version, kind, key in journal if version > since]
@@ -0,0 +1,319 @@
+import os
+import queue
+import sqlite3
+import logging
+import threading
+
+from execution_state import make_task_id
+from log_buffer import format_log_entry
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS executions ("
+    " execution_id TEXT PRIMARY KEY,"
+    " model TEXT,"
+    " status TEXT NOT NULL,"
+    " current_task TEXT,"
+    " progress INTEGER NOT NULL DEFAULT 0,"
+    " queued_time TEXT,"
+    " start_time TEXT)",
+    "CREATE INDEX IF NOT EXISTS idx_executions_queued ON executions (queued_time)",
+    "CREATE TABLE IF NOT EXISTS agents ("
+    " execution_id TEXT NOT NULL,"
+    " name TEXT NOT NULL,"
+    " role TEXT,"
+    " PRIMARY KEY (execution_id, name))",
+    # 任务按任务ID（与内存中的执行状态、task_delta事件和页面的data-task-id一致）保存
+    "CREATE TABLE IF NOT EXISTS task_outputs ("
+    " execution_id TEXT NOT NULL,"
+    " task_id TEXT NOT NULL,"
+    " agent TEXT NOT NULL,"
+    " description TEXT NOT NULL,"
+    " output TEXT,"
+    " PRIMARY KEY (execution_id, task_id))",
+    "CREATE INDEX IF NOT EXISTS idx_task_outputs_agent ON task_outputs (agent)",
+    # 日志和交互只追加不修改；日志按执行内的序号分页，交互按自增id分页
+    "CREATE TABLE IF NOT EXISTS system_logs ("
+    " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+    " execution_id TEXT NOT NULL,"
+    " seq INTEGER NOT NULL,"
+    " level TEXT NOT NULL,"
+    " message TEXT NOT NULL,"
+    " created_at TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_system_logs_execution ON system_logs (execution_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_system_logs_seq ON system_logs (execution_id, seq)",
+    "CREATE TABLE IF NOT EXISTS interactions ("
+    " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+    " execution_id TEXT NOT NULL,"
+    " from_agent TEXT NOT NULL,"
+    " to_agent TEXT NOT NULL,"
+    " content TEXT NOT NULL,"
+    " created_at TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_interactions_execution ON interactions (execution_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_interactions_from ON interactions (from_agent, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_interactions_to ON interactions (to_agent, created_at)",
+)
+
+JOURNAL_MODES = ("WAL", "DELETE", "TRUNCATE", "PERSIST")
+
+_EXECUTION_FIELDS = ("execution_id", "model", "status", "current_task", "progress", "queued_time", "start_time")
+
+
+def sqlite_journal_mode():
+    """SQLite日志模式，由SQLITE_JOURNAL_MODE配置（默认WAL；数据库放在多台主机共享的文件系统上时使用DELETE）"""
+    mode = os.getenv("SQLITE_JOURNAL_MODE", "WAL").upper()
+    if mode not in JOURNAL_MODES:
+        raise ValueError(f"SQLITE_JOURNAL_MODE必须是{', '.join(JOURNAL_MODES)}之一")
+    return mode
+
+
+class ExecutionStore:
+    """执行记录的持久化存储（SQLite，默认WAL模式）
+
+    写入只是放进队列，由后台线程批量提交，不阻塞执行线程；读取按游标分页，
+    历史执行无需常驻内存。日志和智能体交互表只追加，按执行ID、智能体和时间范围建有索引。
+    """
+
+    def __init__(self, path, batch_size=500, journal_mode="WAL"):
+        self.path = path
+        self.batch_size = batch_size
+        self.journal_mode = journal_mode
+        self._local = threading.local()
+        self._queue = queue.Queue()
+        with self._connect() as conn:
+            legacy = self._detach_legacy_task_outputs(conn)
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            if legacy:
+                self._migrate_legacy_task_outputs(conn)
+        self._writer = threading.Thread(target=self._write_loop, name="execution-store-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        # sqlite3连接不能跨线程使用，每个线程各自持有一个连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _detach_legacy_task_outputs(conn):
+        """旧版本的task_outputs表没有task_id列（按智能体和任务描述保存），改名后等待迁移"""
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(task_outputs)")}
+        if not columns or "task_id" in columns:
+            return False
+        conn.execute("BEGIN")
+        conn.execute("ALTER TABLE task_outputs RENAME TO task_outputs_legacy")
+        conn.execute("DROP INDEX IF EXISTS idx_task_outputs_agent")
+        return True
+
+    @staticmethod
+    def _migrate_legacy_task_outputs(conn):
+        # 旧记录没有保存任务ID，按未显式指定任务ID时的规则由任务描述生成；按原顺序复制
+        rows = conn.execute(
+            "SELECT execution_id, agent, description, output FROM task_outputs_legacy ORDER BY rowid"
+        ).fetchall()
+        conn.executemany(
+            "INSERT OR REPLACE INTO task_outputs (execution_id, task_id, agent, description, output)"
+            " VALUES (?, ?, ?, ?, ?)",
+            [(row["execution_id"], make_task_id(row["description"]), row["agent"], row["description"], row["output"])
+             for row in rows]
+        )
+        conn.execute("DROP TABLE task_outputs_legacy")
+        logger.info(f"已迁移 {len(rows)} 条任务输出记录（补充任务ID）")
+
+    # ---- 写入：只入队，由后台线程批量提交 ----
+
+    def save_execution(self, data):
+        """保存执行的状态字段（不含智能体、日志和交互）"""
+        self._queue.put((
+            "INSERT INTO executions (execution_id, model, status, current_task, progress, queued_time, start_time)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(execution_id) DO UPDATE SET model = excluded.model, status = excluded.status,"
+            " current_task = excluded.current_task, progress = excluded.progress,"
+            " queued_time = excluded.queued_time, start_time = excluded.start_time",
+            tuple(data.get(field) for field in _EXECUTION_FIELDS)
+        ))
+
+    def save_agent(self, execution_id, agent):
+        """保存智能体及其任务输出（agent为AgentRecord.to_dict()的结果，任务按task_id保存）"""
+        self._queue.put((
+            "INSERT INTO agents (execution_id, name, role) VALUES (?, ?, ?)"
+            " ON CONFLICT(execution_id, name) DO UPDATE SET role = excluded.role",
+            (execution_id, agent["name"], agent["role"])
+        ))
+        for task in agent["tasks"]:
+            self._queue.put((
+                "INSERT INTO task_outputs (execution_id, task_id, agent, description, output) VALUES (?, ?, ?, ?, ?)"
+                " ON CONFLICT(execution_id, task_id) DO UPDATE SET agent = excluded.agent,"
+                " description = excluded.description, output = excluded.output",
+                (execution_id, task["task_id"], agent["name"], task["description"], task["output"])
+            ))
+
+    def append_log(self, execution_id, entry):
+        """保存一条带序号的日志（LogRingBuffer.append返回的条目）"""
+        self._queue.put((
+            "INSERT INTO system_logs (execution_id, seq, level, message, created_at) VALUES (?, ?, ?, ?, ?)",
+            (execution_id, entry["seq"], entry["level"], entry["message"], entry["timestamp"])
+        ))
+
+    def append_interaction(self, execution_id, interaction):
+        self._queue.put((
+            "INSERT INTO interactions (execution_id, from_agent, to_agent, content, created_at) VALUES (?, ?, ?, ?, ?)",
+            (execution_id, interaction["from_agent"], interaction["to_agent"],
+             interaction["content"], interaction["timestamp"])
+        ))
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._queue.get()]
+            # 把队列中已有的写入合并到同一个事务里
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            waiters = [item for item in batch if isinstance(item, threading.Event)]
+            statements = [item for item in batch if not isinstance(item, threading.Event)]
+            try:
+                with conn:
+                    for sql, params in statements:
+                        conn.execute(sql, params)
+            except sqlite3.Error as e:
+                logger.error(f"写入执行记录失败，丢弃 {len(statements)} 条写入: {str(e)}")
+            for waiter in waiters:
+                waiter.set()
+
+    def flush(self, timeout=None):
+        """等待此前入队的写入全部提交"""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    # ---- 读取：分页查询 ----
+
+    def list_executions(self, limit=50, offset=0, status=None):
+        """按排队时间倒序分页列出执行摘要"""
+        sql = "SELECT * FROM executions"
+        params = []
+        if status:
+            sql += " WHERE status = ?"
+            params.append(status)
+        sql += " ORDER BY queued_time DESC, execution_id DESC LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        return [dict(row) for row in self._connect().execute(sql, params)]
+
+    def get_execution(self, execution_id, log_limit=None, interaction_limit=None):
+        """组装与内存中执行数据相同结构的文档；log_limit/interaction_limit只取最近的若干条"""
+        conn = self._connect()
+        row = conn.execute("SELECT * FROM executions WHERE execution_id = ?", (execution_id,)).fetchone()
+        if row is None:
+            return None
+        data = dict(row)
+        agents = []
+        for agent in conn.execute("SELECT name, role FROM agents WHERE execution_id = ? ORDER BY rowid", (execution_id,)):
+            tasks = conn.execute(
+                "SELECT task_id, description, output FROM task_outputs WHERE execution_id = ? AND agent = ? ORDER BY rowid",
+                (execution_id, agent["name"])
+            )
+            agents.append({"name": agent["name"], "role": agent["role"], "tasks": [dict(task) for task in tasks]})
+        data["agents"] = agents
+        logs = self.get_logs(execution_id, limit=log_limit)
+        data["system_logs"] = [format_log_entry(log) for log in logs]
+        data["log_first_seq"] = logs[0]["seq"] if logs else None
+        data["log_last_seq"] = conn.execute(
+            "SELECT COALESCE(MAX(seq), 0) FROM system_logs WHERE execution_id = ?", (execution_id,)
+        ).fetchone()[0]
+        interactions = self._latest(conn, "interactions", execution_id, interaction_limit)
+        data["agent_interactions"] = [
+            {
+                "from_agent": item["from_agent"],
+                "to_agent": item["to_agent"],
+                "content": item["content"],
+                "timestamp": item["created_at"]
+            }
+            for item in interactions
+        ]
+        return data
+
+    @staticmethod
+    def _latest(conn, table, execution_id, limit):
+        if limit is None:
+            return conn.execute(f"SELECT * FROM {table} WHERE execution_id = ? ORDER BY id", (execution_id,)).fetchall()
+        rows = conn.execute(
+            f"SELECT * FROM {table} WHERE execution_id = ? ORDER BY id DESC LIMIT ?", (execution_id, limit)
+        ).fetchall()
+        return rows[::-1]
+
+    def get_logs(self, execution_id, after_seq=None, before_seq=None, limit=100, since=None, until=None, level=None):
+        """按序号读取日志窗口，结果按序号升序排列，可按时间范围（含两端）和级别过滤
+
+        与LogRingBuffer.query相同：指定after_seq时返回其后的最早limit条，
+        否则返回before_seq之前（未指定时到末尾）的最近limit条；limit为None时不限条数。
+        """
+        sql = "SELECT seq, level, message, created_at AS timestamp FROM system_logs WHERE execution_id = ?"
+        params = [execution_id]
+        if after_seq is not None:
+            sql += " AND seq > ?"
+            params.append(after_seq)
+        if before_seq is not None:
+            sql += " AND seq < ?"
+            params.append(before_seq)
+        if since:
+            sql += " AND created_at >= ?"
+            params.append(since)
+        if until:
+            sql += " AND created_at <= ?"
+            params.append(until)
+        if level:
+            sql += " AND level = ?"
+            params.append(level)
+        backward = after_seq is None and limit is not None
+        sql += " ORDER BY seq DESC" if backward else " ORDER BY seq"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = [dict(row) for row in self._connect().execute(sql, params)]
+        return rows[::-1] if backward else rows
+
+    def get_interactions(self, execution_id=None, agent=None, after_id=0, limit=100, since=None, until=None):
+        """按id游标分页读取智能体交互；agent匹配发起方或接收方，不指定execution_id时跨执行查询"""
+        sql = ("SELECT id, execution_id, from_agent, to_agent, content, created_at AS timestamp FROM interactions"
+               " WHERE id > ?")
+        params = [after_id]
+        if execution_id:
+            sql += " AND execution_id = ?"
+            params.append(execution_id)
+        if agent:
+            sql += " AND (from_agent = ? OR to_agent = ?)"
+            params += [agent, agent]
+        if since:
+            sql += " AND created_at >= ?"
+            params.append(since)
+        if until:
+            sql += " AND created_at <= ?"
+            params.append(until)
+        sql += " ORDER BY id LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in self._connect().execute(sql, params)]
+
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+
+def get_shared_execution_store():
+    """进程内共享的执行存储，路径由EXECUTION_STORE_PATH配置"""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            path = os.getenv("EXECUTION_STORE_PATH", ".executions.sqlite3")
+            _shared_store = ExecutionStore(path, journal_mode=sqlite_journal_mode())
+            logger.info(f"执行记录存储: {path}")
+        return _shared_store
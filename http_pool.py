@@ -0,0 +1,184 @@
+"""进程内共享的HTTP连接池：所有智能体、层级模式的管理者LLM和每次执行共用同一个keep-alive客户端
+
+每个LLM各建一个客户端时，每次执行都要重新进行TCP/TLS握手，并发执行之间也没有连接数上限。
+共享客户端在请求之间保持并复用到接口的连接，安装h2时使用HTTP/2在同一连接上多路复用。
+异步执行使用按事件循环共享的httpx.AsyncClient（连接绑定在创建它的事件循环上），配置与同步客户端相同。
+"""
+import os
+import atexit
+import asyncio
+import logging
+import threading
+import importlib.util
+import weakref
+
+from metrics import Counter, Gauge
+from tracing import http_request_hook, http_response_hook
+
+logger = logging.getLogger(__name__)
+
+HTTP_POOL_REQUESTS = Counter("http_pool_requests_total", "经共享连接池发出的HTTP请求数")
+HTTP_POOL_CONNECTIONS_OPENED = Counter("http_pool_connections_opened_total", "共享连接池新建的连接数（TCP握手次数）")
+
+_shared_client = None
+_shared_client_http2 = False
+_shared_client_lock = threading.Lock()
+# 事件循环 -> 该循环的异步客户端；事件循环被回收后对应的条目随之删除
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _connection_trace(event_name, info):
+    # httpcore的trace扩展：每次新建TCP连接时触发connection.connect_tcp.complete
+    if event_name == "connection.connect_tcp.complete":
+        HTTP_POOL_CONNECTIONS_OPENED.inc()
+
+
+async def _async_connection_trace(event_name, info):
+    _connection_trace(event_name, info)
+
+
+def _pool_request_hook(request):
+    HTTP_POOL_REQUESTS.inc()
+    request.extensions.setdefault("trace", _connection_trace)
+
+
+def _async_pool_request_hook(request):
+    HTTP_POOL_REQUESTS.inc()
+    # 异步传输层会await trace回调
+    request.extensions.setdefault("trace", _async_connection_trace)
+
+
+def _async_hook(hook):
+    """AsyncClient的事件钩子必须是协程函数；同步钩子只做计数和记录，直接在事件循环中调用"""
+    async def run(message):
+        hook(message)
+    return run
+
+
+def http2_available():
+    return importlib.util.find_spec("h2") is not None
+
+
+def _client_options():
+    """同步和异步客户端共用的连接池配置，按环境变量读取"""
+    import httpx
+
+    max_connections = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "20"))
+    max_keepalive = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", str(max_connections)))
+    # 限流器按分钟发放配额，请求之间常有数秒间隔，空闲连接保留时间比httpx默认的5秒长
+    keepalive_seconds = float(os.getenv("HTTP_POOL_KEEPALIVE_SECONDS", "90"))
+    timeout_seconds = float(os.getenv("HTTP_TIMEOUT_SECONDS", "600"))
+    http2 = os.getenv("HTTP_POOL_HTTP2", "true").lower() == "true"
+    if http2 and not http2_available():
+        logger.info("未安装h2，共享连接池使用HTTP/1.1（pip install h2 启用HTTP/2）")
+        http2 = False
+    return {
+        "http2": http2,
+        "limits": httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_seconds
+        ),
+        "timeout": httpx.Timeout(timeout_seconds, connect=10.0)
+    }
+
+
+def get_shared_http_client():
+    """获取进程内共享的httpx客户端，按环境变量配置
+
+    HTTP_POOL_MAX_CONNECTIONS（最大连接数）、HTTP_POOL_MAX_KEEPALIVE（保留的空闲连接数）、
+    HTTP_POOL_KEEPALIVE_SECONDS（空闲连接保留时间）、HTTP_POOL_HTTP2（是否启用HTTP/2）、
+    HTTP_TIMEOUT_SECONDS（读取超时，也是连接池已满时等待空闲连接的时间）
+    """
+    global _shared_client, _shared_client_http2
+    # 在首次创建客户端时才导入httpx和LLM指标（依赖langchain），只读取连接池状态时不需要
+    import httpx
+    from llm_metrics import metrics_response_hook
+
+    with _shared_client_lock:
+        if _shared_client is None:
+            options = _client_options()
+            _shared_client = httpx.Client(
+                **options,
+                event_hooks={
+                    "request": [_pool_request_hook, http_request_hook],
+                    "response": [metrics_response_hook, http_response_hook]
+                }
+            )
+            _shared_client_http2 = options["http2"]
+            atexit.register(_shared_client.close)
+            limits = options["limits"]
+            logger.info(
+                f"已创建共享HTTP连接池: 最大连接数={limits.max_connections}, 空闲保留={limits.keepalive_expiry}秒, "
+                f"HTTP/2={'是' if options['http2'] else '否'}"
+            )
+        return _shared_client
+
+
+def get_shared_async_http_client():
+    """获取当前事件循环共享的httpx.AsyncClient，配置与get_shared_http_client相同
+
+    不在事件循环中调用时返回None（由openai按需创建默认的异步客户端）。
+    """
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+    import httpx
+    from llm_metrics import metrics_response_hook
+
+    with _shared_client_lock:
+        client = _async_clients.get(loop)
+        if client is None:
+            options = _client_options()
+            client = httpx.AsyncClient(
+                **options,
+                event_hooks={
+                    "request": [_async_hook(_async_pool_request_hook), _async_hook(http_request_hook)],
+                    "response": [_async_hook(metrics_response_hook), _async_hook(http_response_hook)]
+                }
+            )
+            _async_clients[loop] = client
+            logger.info(f"已为事件循环创建共享异步HTTP连接池: HTTP/2={'是' if options['http2'] else '否'}")
+        return client
+
+
+async def aclose_shared_async_http_client():
+    """关闭当前事件循环的异步客户端（事件循环结束前调用，例如ASGI应用关闭时）"""
+    with _shared_client_lock:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _pool_connections():
+    with _shared_client_lock:
+        clients = [_shared_client] if _shared_client is not None else []
+        clients.extend(_async_clients.values())
+    connections = []
+    for client in clients:
+        # httpx没有公开连接池状态，从传输层的httpcore连接池读取
+        pool = getattr(client._transport, "_pool", None)
+        connections.extend(getattr(pool, "connections", []))
+    return connections
+
+
+def http_pool_stats():
+    """共享连接池的状态：当前连接数（包括各事件循环的异步连接池）、其中空闲和使用中的连接数，以及累计的请求数和新建连接数"""
+    connections = _pool_connections()
+    idle = sum(1 for connection in connections if connection.is_idle())
+    return {
+        "created": _shared_client is not None,
+        "async_clients": len(_async_clients),
+        "http2": _shared_client_http2,
+        "connections": len(connections),
+        "idle": idle,
+        "active": len(connections) - idle,
+        "requests": HTTP_POOL_REQUESTS.value(),
+        "connections_opened": HTTP_POOL_CONNECTIONS_OPENED.value()
+    }
+
+
+Gauge("http_pool_connections", "共享连接池当前的连接数", func=lambda: len(_pool_connections()))
+Gauge("http_pool_idle_connections", "共享连接池当前的空闲连接数",
+      func=lambda: sum(1 for connection in _pool_connections() if connection.is_idle()))
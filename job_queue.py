@@ -0,0 +1,370 @@
+"""执行任务队列：Web应用登记执行，工作进程（worker.py）租用并运行，结果和事件写回队列
+
+队列保存在SQLite数据库中，不需要单独的消息中间件。工作进程租用任务时设置租约到期时间（可见性超时），
+运行期间定期续约；工作进程崩溃或失联后租约过期，任务会被其他工作进程重新租用，超过最大尝试次数时
+标记为error。执行发布的事件追加到job_events表，由Web应用按自增id顺序读取并转发给SSE订阅者。
+
+多台主机共用队列时，数据库文件需放在支持文件锁的共享文件系统上，并把SQLITE_JOURNAL_MODE设为DELETE
+（WAL模式依赖共享内存，只能在同一台主机上使用）；租约到期时间按各主机的时钟计算，主机之间需要同步时钟。
+"""
+import os
+import json
+import time
+import queue
+import socket
+import sqlite3
+import logging
+import threading
+from dataclasses import dataclass, field
+
+from execution_store import sqlite_journal_mode
+
+logger = logging.getLogger(__name__)
+
+# 已结束的任务状态（与执行状态一致）
+FINISHED_JOB_STATUSES = ("completed", "error", "cancelled")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS jobs ("
+    " job_id TEXT PRIMARY KEY,"
+    " payload TEXT NOT NULL,"
+    " status TEXT NOT NULL,"
+    " attempts INTEGER NOT NULL DEFAULT 0,"
+    " max_attempts INTEGER NOT NULL,"
+    " lease_owner TEXT,"
+    " lease_expires REAL,"
+    " cancel_requested INTEGER NOT NULL DEFAULT 0,"
+    " result TEXT,"
+    " error TEXT,"
+    " created_at REAL NOT NULL,"
+    " updated_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)",
+    "CREATE TABLE IF NOT EXISTS job_events ("
+    " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+    " job_id TEXT NOT NULL,"
+    " event_type TEXT NOT NULL,"
+    " data TEXT NOT NULL,"
+    " created_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_job_events_job ON job_events (job_id)",
+    "CREATE TABLE IF NOT EXISTS workers ("
+    " worker_id TEXT PRIMARY KEY,"
+    " host TEXT NOT NULL,"
+    " pid INTEGER NOT NULL,"
+    " slots INTEGER NOT NULL,"
+    " running INTEGER NOT NULL DEFAULT 0,"
+    " started_at REAL NOT NULL,"
+    " heartbeat_at REAL NOT NULL)",
+)
+
+
+@dataclass(frozen=True)
+class Job:
+    """工作进程持有的一次租约：attempt同时作为租约标识，租约被其他工作进程接手后旧租约的写入不再生效"""
+
+    job_id: str
+    worker_id: str
+    attempt: int
+    max_attempts: int
+    payload: dict = field(default_factory=dict)
+
+
+class JobQueue:
+    """基于SQLite的任务队列，可被多个进程同时使用
+
+    租用、续约和结束都在单个IMMEDIATE事务中完成，同一个任务同时只会被一个工作进程持有。
+    事件写入只是放进队列，由后台线程批量提交，不阻塞执行。
+    """
+
+    def __init__(self, path, max_attempts=3, journal_mode="WAL", batch_size=500):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.journal_mode = journal_mode
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._events = queue.Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        conn = self._connect()
+        for statement in _SCHEMA:
+            conn.execute(statement)
+
+    def _connect(self):
+        # sqlite3连接不能跨线程使用，每个线程各自持有一个连接；事务由各方法显式开启
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        conn = self._connect()
+        return _ImmediateTransaction(conn)
+
+    # ---- Web应用：登记和取消 ----
+
+    def enqueue(self, job_id, payload=None, max_attempts=None):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (job_id, payload, status, max_attempts, created_at, updated_at)"
+                " VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, json.dumps(payload or {}, ensure_ascii=False), max_attempts or self.max_attempts, now, now)
+            )
+
+    def cancel(self, job_id):
+        """取消任务：排队中的任务直接标记为cancelled并返回"cancelled"；运行中的任务设置取消标记，
+        由持有租约的工作进程在下次续约时取消，返回"requested"。任务不存在返回None，已结束返回False。
+        """
+        with self._transaction() as conn:
+            row = conn.execute("SELECT status FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            if row["status"] in FINISHED_JOB_STATUSES:
+                return False
+            if row["status"] == "queued":
+                conn.execute(
+                    "UPDATE jobs SET status = 'cancelled', cancel_requested = 1, updated_at = ? WHERE job_id = ?",
+                    (time.time(), job_id)
+                )
+                return "cancelled"
+            conn.execute(
+                "UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE job_id = ?", (time.time(), job_id)
+            )
+            return "requested"
+
+    # ---- 工作进程：租用、续约和结束 ----
+
+    def _expire(self, conn, now):
+        """处理租约已过期的任务：已请求取消的标记为cancelled，已达到最大尝试次数的标记为error"""
+        conn.execute(
+            "UPDATE jobs SET status = 'cancelled', lease_owner = NULL, updated_at = ?"
+            " WHERE status = 'running' AND lease_expires < ? AND cancel_requested = 1",
+            (now, now)
+        )
+        conn.execute(
+            "UPDATE jobs SET status = 'error', lease_owner = NULL, error = '租约过期，已达到最大尝试次数', updated_at = ?"
+            " WHERE status = 'running' AND lease_expires < ? AND attempts >= max_attempts",
+            (now, now)
+        )
+
+    def lease(self, worker_id, visibility_timeout):
+        """租用最早登记的可运行任务（排队中或租约已过期），没有时返回None"""
+        now = time.time()
+        with self._transaction() as conn:
+            self._expire(conn, now)
+            row = conn.execute(
+                "SELECT job_id, payload, attempts, max_attempts, lease_owner FROM jobs"
+                " WHERE status = 'queued' OR (status = 'running' AND lease_expires < ?)"
+                " ORDER BY created_at, job_id LIMIT 1",
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            attempt = row["attempts"] + 1
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = ?, lease_owner = ?, lease_expires = ?, updated_at = ?"
+                " WHERE job_id = ?",
+                (attempt, worker_id, now + visibility_timeout, now, row["job_id"])
+            )
+        if row["lease_owner"]:
+            logger.warning(f"任务 {row['job_id']} 的租约已过期（原工作进程: {row['lease_owner']}），重新租用")
+        return Job(row["job_id"], worker_id, attempt, row["max_attempts"], json.loads(row["payload"]))
+
+    def heartbeat(self, job, visibility_timeout):
+        """续约，返回"ok"、"cancel"（已请求取消）或"lost"（租约已过期并被其他工作进程接手或任务已结束）"""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ?, updated_at = ?"
+                " WHERE job_id = ? AND lease_owner = ? AND attempts = ? AND status = 'running'",
+                (now + visibility_timeout, now, job.job_id, job.worker_id, job.attempt)
+            )
+            if cursor.rowcount == 0:
+                return "lost"
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE job_id = ?", (job.job_id,)).fetchone()
+        return "cancel" if row["cancel_requested"] else "ok"
+
+    def finish(self, job, status, result=None, error=None):
+        """写回结果并结束任务；租约已失效时不做修改并返回False"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, lease_owner = NULL, updated_at = ?"
+                " WHERE job_id = ? AND lease_owner = ? AND attempts = ? AND status = 'running'",
+                (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error,
+                 time.time(), job.job_id, job.worker_id, job.attempt)
+            )
+        return cursor.rowcount == 1
+
+    def release(self, job, error=None, count_attempt=True):
+        """放弃租约：仍有剩余尝试次数时放回队列，否则标记为error；返回任务的新状态，租约已失效时返回None
+
+        count_attempt为False时（例如工作进程正常退出）本次尝试不计入尝试次数。
+        """
+        with self._transaction() as conn:
+            attempts = job.attempt if count_attempt else job.attempt - 1
+            status = "queued" if attempts < job.max_attempts else "error"
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, attempts = ?, error = ?, lease_owner = NULL, lease_expires = NULL,"
+                " updated_at = ? WHERE job_id = ? AND lease_owner = ? AND attempts = ? AND status = 'running'",
+                (status, attempts, error, time.time(), job.job_id, job.worker_id, job.attempt)
+            )
+        return status if cursor.rowcount == 1 else None
+
+    # ---- 事件：工作进程批量写入，Web应用按id顺序读取 ----
+
+    def append_event(self, job_id, event_type, data):
+        self._ensure_writer()
+        self._events.put((job_id, event_type, json.dumps(data, ensure_ascii=False), time.time()))
+
+    def _ensure_writer(self):
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="job-event-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        conn = self._connect()
+        while True:
+            batch = [self._events.get()]
+            # 把队列中已有的事件合并到同一个事务里
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._events.get_nowait())
+                except queue.Empty:
+                    break
+            waiters = [item for item in batch if isinstance(item, threading.Event)]
+            rows = [item for item in batch if not isinstance(item, threading.Event)]
+            try:
+                with _ImmediateTransaction(conn):
+                    conn.executemany(
+                        "INSERT INTO job_events (job_id, event_type, data, created_at) VALUES (?, ?, ?, ?)", rows
+                    )
+            except sqlite3.Error as e:
+                logger.error(f"写入任务事件失败，丢弃 {len(rows)} 条事件: {str(e)}")
+            for waiter in waiters:
+                waiter.set()
+
+    def flush(self, timeout=None):
+        """等待此前写入的事件全部提交"""
+        if self._writer is None:
+            return True
+        done = threading.Event()
+        self._events.put(done)
+        return done.wait(timeout)
+
+    def events_after(self, after_id, limit=500):
+        """读取id大于after_id的事件，按id升序排列"""
+        rows = self._connect().execute(
+            "SELECT id, job_id, event_type, data, created_at FROM job_events WHERE id > ? ORDER BY id LIMIT ?",
+            (after_id, limit)
+        )
+        return [
+            {"id": row["id"], "job_id": row["job_id"], "event_type": row["event_type"],
+             "data": json.loads(row["data"]), "created_at": row["created_at"]}
+            for row in rows
+        ]
+
+    def last_event_id(self):
+        return self._connect().execute("SELECT COALESCE(MAX(id), 0) FROM job_events").fetchone()[0]
+
+    def purge_events(self, older_than):
+        """删除已结束超过older_than秒的任务的事件，返回删除的条数"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "DELETE FROM job_events WHERE job_id IN (SELECT job_id FROM jobs WHERE status IN (?, ?, ?)"
+                " AND updated_at < ?)",
+                (*FINISHED_JOB_STATUSES, time.time() - older_than)
+            )
+        return cursor.rowcount
+
+    # ---- 查询 ----
+
+    def get(self, job_id):
+        row = self._connect().execute("SELECT * FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def statuses(self, job_ids):
+        """返回{任务ID: (状态, 错误信息)}"""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return {}
+        placeholders = ",".join("?" * len(job_ids))
+        rows = self._connect().execute(
+            f"SELECT job_id, status, error FROM jobs WHERE job_id IN ({placeholders})", job_ids
+        )
+        return {row["job_id"]: (row["status"], row["error"]) for row in rows}
+
+    def counts(self):
+        """各状态的任务数"""
+        rows = self._connect().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")
+        return {row["status"]: row["n"] for row in rows}
+
+    # ---- 工作进程登记 ----
+
+    def register_worker(self, worker_id, slots):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO workers (worker_id, host, pid, slots, running, started_at, heartbeat_at)"
+                " VALUES (?, ?, ?, ?, 0, ?, ?)",
+                (worker_id, socket.gethostname(), os.getpid(), slots, now, now)
+            )
+
+    def worker_heartbeat(self, worker_id, running):
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE workers SET running = ?, heartbeat_at = ? WHERE worker_id = ?", (running, time.time(), worker_id)
+            )
+
+    def unregister_worker(self, worker_id):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+
+    def workers(self, max_age=60):
+        """最近max_age秒内有心跳的工作进程"""
+        rows = self._connect().execute(
+            "SELECT * FROM workers WHERE heartbeat_at >= ? ORDER BY host, worker_id", (time.time() - max_age,)
+        )
+        return [dict(row) for row in rows]
+
+
+class _ImmediateTransaction:
+    """BEGIN IMMEDIATE事务：开始时即取得写锁，避免多个进程先读后写时互相等待导致死锁"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
+
+
+_shared_queue = None
+_shared_queue_lock = threading.Lock()
+
+
+def get_shared_job_queue():
+    """进程内共享的任务队列：JOB_QUEUE_PATH（数据库路径）、JOB_MAX_ATTEMPTS（每个任务的最大尝试次数）"""
+    global _shared_queue
+    with _shared_queue_lock:
+        if _shared_queue is None:
+            path = os.getenv("JOB_QUEUE_PATH", ".jobs.sqlite3")
+            _shared_queue = JobQueue(
+                path,
+                max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+                journal_mode=sqlite_journal_mode()
+            )
+            logger.info(f"执行任务队列: {path}")
+        return _shared_queue
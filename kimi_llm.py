@@ -0,0 +1,233 @@
+import time
+import asyncio
+import logging
+import contextlib
+from typing import Any, Optional
+
+from langchain_core.pydantic_v1 import root_validator
+from langchain_openai import ChatOpenAI
+
+from metrics import LLM_RATE_LIMITER_WAIT_SECONDS
+from llm_metrics import LLMMetricsHandler, record_call_model
+from llm_retry import get_shared_retry_policy
+from rate_limiter import estimate_tokens, get_shared_rate_limiter
+from tracing import get_shared_tracer
+
+logger = logging.getLogger(__name__)
+
+
+def _estimate_prompt_tokens(messages):
+    return estimate_tokens("".join(str(m.content) for m in messages))
+
+
+def _total_tokens(result):
+    token_usage = (result.llm_output or {}).get("token_usage") or {}
+    return token_usage.get("total_tokens")
+
+
+def _set_model_name(result, model):
+    """llm_output的model_name改为实际请求的模型（父类总是填默认的model_name）；
+    流式调用合并分块得到的结果没有llm_output，一并补上"""
+    result.llm_output = dict(result.llm_output or {"token_usage": {}}, model_name=model)
+    return result
+
+
+def _streamed_model(result, default_model):
+    # 流式调用的第一个分块记录了实际请求的模型，合并后保留在generation_info中
+    info = (result.generations[0].generation_info if result.generations else None) or {}
+    return info.get("model_name", default_model)
+
+
+def _tag_model(chunk, model):
+    chunk.generation_info = dict(chunk.generation_info or {}, model_name=model)
+    return chunk
+
+
+class KimiChatOpenAI(ChatOpenAI):
+    """Kimi聊天模型：只有真正发往API的请求（缓存未命中）才向共享限流器申请配额
+
+    设置model_router时，每个请求发送前按估算的提示词大小选择模型（model_name只作为默认值和缓存键），
+    超出所有模型窗口的请求在申请配额之前就被拒绝。agent_role用于按角色覆盖路由和记录指标。
+
+    每个实例自带LLMMetricsHandler，无论由哪个入口创建，调用的耗时、token用量、429和重试次数都按角色和
+    实际请求的模型记录到/metrics。
+
+    异步接口（ainvoke/astream）在限流队列中等待时不占用线程；传入http_async_client时复用共享的异步连接池。
+
+    失败的请求按llm_retry的策略在调用内重试（每次重试重新排队申请配额），openai客户端自带的重试已关闭；
+    流式调用只在收到第一个分块之前重试。
+    """
+
+    model_router: Optional[Any] = None
+    agent_role: Optional[str] = None
+    max_retries: int = 0
+    pooled_http_client: Optional[Any] = None
+    # langchain-openai 0.0.2没有该字段，不声明时会被当作请求参数放进model_kwargs
+    http_async_client: Optional[Any] = None
+
+    @root_validator(pre=True)
+    def _take_http_client(cls, values):
+        # langchain-openai 0.0.2把http_client同时传给同步和异步的openai客户端，异步客户端不接受httpx.Client，
+        # 先取出来，父类按默认方式创建客户端后再换用共享连接池
+        values["pooled_http_client"] = values.pop("http_client", None)
+        return values
+
+    @root_validator()
+    def _use_pooled_http_client(cls, values):
+        http_client = values.get("pooled_http_client")
+        if http_client is not None:
+            # openai客户端的copy保留api_key、base_url、超时和重试设置，只替换HTTP客户端
+            values["client"] = values["client"]._client.copy(http_client=http_client).chat.completions
+        async_http_client = values.get("http_async_client")
+        if async_http_client is not None:
+            values["async_client"] = values["async_client"]._client.copy(http_client=async_http_client).chat.completions
+        return values
+
+    @root_validator()
+    def _add_metrics_handler(cls, values):
+        callbacks = values.get("callbacks")
+        if isinstance(callbacks, list) and any(isinstance(c, LLMMetricsHandler) for c in callbacks):
+            return values
+        handler = LLMMetricsHandler(values.get("agent_role") or "default", values["model_name"])
+        if callbacks is None:
+            values["callbacks"] = [handler]
+        elif isinstance(callbacks, list):
+            values["callbacks"] = callbacks + [handler]
+        else:
+            # 传入的是回调管理器
+            callbacks.add_handler(handler)
+        return values
+
+    def _acquire(self, limiter, estimated):
+        started = time.monotonic()
+        limiter.acquire(estimated)
+        LLM_RATE_LIMITER_WAIT_SECONDS.observe(time.monotonic() - started, model=self.model_name)
+
+    async def _acquire_async(self, limiter, estimated):
+        started = time.monotonic()
+        await limiter.acquire_async(estimated)
+        LLM_RATE_LIMITER_WAIT_SECONDS.observe(time.monotonic() - started, model=self.model_name)
+
+    def _call_scope(self, run_manager):
+        """发出请求期间进入各回调处理器的run_context（当前调用的指标记录、LLM调用的span），供HTTP钩子使用"""
+        stack = contextlib.ExitStack()
+        if run_manager is not None:
+            for handler in run_manager.handlers:
+                run_context = getattr(handler, "run_context", None)
+                if run_context is not None:
+                    stack.enter_context(run_context(run_manager.run_id))
+        return stack
+
+    def _prepare(self, messages, kwargs):
+        """选择本次请求的模型（写入kwargs覆盖请求参数中的model），返回用于申请限流配额的token估算值"""
+        prompt_tokens = _estimate_prompt_tokens(messages)
+        if self.model_router is not None:
+            model = self.model_router.route(
+                prompt_tokens, role=self.agent_role, max_tokens=self.max_tokens, default_model=self.model_name
+            )
+            kwargs["model"] = model
+            record_call_model(model)
+            span = get_shared_tracer().current_span()
+            if span is not None:
+                span.set_attribute("llm.model", model)
+                span.set_attribute("llm.estimated_prompt_tokens", prompt_tokens)
+        return prompt_tokens + (self.max_tokens or 0)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.streaming:
+            # 流式模式下父类通过_stream发出请求，由_stream路由并申请配额
+            result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return _set_model_name(result, _streamed_model(result, self.model_name))
+        with self._call_scope(run_manager):
+            estimated = self._prepare(messages, kwargs)
+            limiter = get_shared_rate_limiter()
+            retry = get_shared_retry_policy().start(limiter)
+            while True:
+                self._acquire(limiter, estimated)
+                try:
+                    result = super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+                    break
+                except Exception as e:
+                    delay = retry.next_delay(e)
+                    if delay is None:
+                        raise
+                time.sleep(delay)
+        limiter.record_usage(estimated, _total_tokens(result))
+        return _set_model_name(result, kwargs.get("model", self.model_name))
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        if self.streaming:
+            # 流式模式下父类通过_astream发出请求
+            result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            return _set_model_name(result, _streamed_model(result, self.model_name))
+        with self._call_scope(run_manager):
+            estimated = self._prepare(messages, kwargs)
+            limiter = get_shared_rate_limiter()
+            retry = get_shared_retry_policy().start(limiter)
+            while True:
+                await self._acquire_async(limiter, estimated)
+                try:
+                    result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+                    break
+                except Exception as e:
+                    delay = retry.next_delay(e)
+                    if delay is None:
+                        raise
+                await asyncio.sleep(delay)
+        limiter.record_usage(estimated, _total_tokens(result))
+        return _set_model_name(result, kwargs.get("model", self.model_name))
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        with self._call_scope(run_manager):
+            estimated = self._prepare(messages, kwargs)
+            limiter = get_shared_rate_limiter()
+            retry = get_shared_retry_policy().start(limiter)
+            total_tokens = None
+            while True:
+                self._acquire(limiter, estimated)
+                streamed = False
+                try:
+                    for chunk in super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                        if not streamed:
+                            # 记录实际请求的模型（路由的结果）
+                            _tag_model(chunk, kwargs.get("model", self.model_name))
+                        streamed = True
+                        # 接口返回用量时，最后一个分块带有usage_metadata
+                        usage = getattr(chunk.message, "usage_metadata", None)
+                        if usage:
+                            total_tokens = usage.get("total_tokens")
+                        yield chunk
+                    break
+                except Exception as e:
+                    # 已经输出的分块无法撤回，中途失败时不重试
+                    delay = None if streamed else retry.next_delay(e)
+                    if delay is None:
+                        raise
+                time.sleep(delay)
+        limiter.record_usage(estimated, total_tokens)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        with self._call_scope(run_manager):
+            estimated = self._prepare(messages, kwargs)
+            limiter = get_shared_rate_limiter()
+            retry = get_shared_retry_policy().start(limiter)
+            total_tokens = None
+            while True:
+                await self._acquire_async(limiter, estimated)
+                streamed = False
+                try:
+                    async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                        if not streamed:
+                            _tag_model(chunk, kwargs.get("model", self.model_name))
+                        streamed = True
+                        usage = getattr(chunk.message, "usage_metadata", None)
+                        if usage:
+                            total_tokens = usage.get("total_tokens")
+                        yield chunk
+                    break
+                except Exception as e:
+                    delay = None if streamed else retry.next_delay(e)
+                    if delay is None:
+                        raise
+                await asyncio.sleep(delay)
+        limiter.record_usage(estimated, total_tokens)
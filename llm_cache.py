@@ -0,0 +1,183 @@
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+
+from langchain_core.caches import BaseCache
+from langchain_core.load import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteLRUCache(BaseCache):
+    """以模型参数和消息内容的哈希为键、保存在SQLite文件中的LLM响应缓存
+
+    数据库使用WAL模式，多个进程可以共享同一个缓存文件。缓存按总字节数上限做LRU淘汰，
+    超过ttl_seconds的条目视为过期。总字节数保存在llm_cache_meta表中，与条目的增删在同一个事务中更新，
+    写入时不需要对整张表求和。
+    """
+
+    def __init__(self, path, max_bytes=256 * 1024 * 1024, ttl_seconds=7 * 24 * 3600):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache (accessed_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_created ON llm_cache (created_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS llm_cache_meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+            # 已有的缓存文件第一次打开时统计一次总字节数
+            conn.execute(
+                "INSERT OR IGNORE INTO llm_cache_meta (name, value)"
+                " SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM llm_cache"
+            )
+
+    def _connect(self):
+        # sqlite3连接不能跨线程使用，每个线程各自持有一个连接
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _make_key(prompt, llm_string):
+        return hashlib.sha256(f"{llm_string}\n{prompt}".encode("utf-8")).hexdigest()
+
+    def _count(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @staticmethod
+    def _add_total(conn, delta):
+        if delta:
+            conn.execute("UPDATE llm_cache_meta SET value = value + ? WHERE name = 'total_bytes'", (delta,))
+
+    @staticmethod
+    def _total(conn):
+        return conn.execute("SELECT value FROM llm_cache_meta WHERE name = 'total_bytes'").fetchone()[0]
+
+    def lookup(self, prompt, llm_string):
+        key = self._make_key(prompt, llm_string)
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute("SELECT value, size, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count(False)
+            return None
+        value, size, created_at = row
+        with conn:
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                # 按created_at删除读到的这一版本，其他进程已删除或替换时不重复扣减总字节数
+                deleted = conn.execute(
+                    "DELETE FROM llm_cache WHERE key = ? AND created_at = ?", (key, created_at)
+                ).rowcount
+                self._add_total(conn, -size * deleted)
+                self._count(False)
+                return None
+            conn.execute("UPDATE llm_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count(True)
+        return loads(value)
+
+    def update(self, prompt, llm_string, return_val):
+        key = self._make_key(prompt, llm_string)
+        value = dumps(list(return_val))
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        conn = self._connect()
+        with conn:
+            # 立即取得写锁：读取旧条目大小到更新总字节数之间，其他进程不能写入
+            conn.execute("BEGIN IMMEDIATE")
+            old = conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now)
+            )
+            self._add_total(conn, size - (old[0] if old else 0))
+            self._evict(conn)
+
+    def _evict(self, conn):
+        """删除过期条目，再按最近访问时间淘汰直到总大小不超过上限（在持有写锁的事务中调用）"""
+        if self.ttl_seconds:
+            expired_at = time.time() - self.ttl_seconds
+            expired = conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM llm_cache WHERE created_at < ?", (expired_at,)
+            ).fetchone()[0]
+            if expired:
+                conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (expired_at,))
+                self._add_total(conn, -expired)
+        total = self._total(conn)
+        if total <= self.max_bytes:
+            return
+        freed = 0
+        stale_keys = []
+        for key, size in conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed_at"):
+            stale_keys.append((key,))
+            freed += size
+            if total - freed <= self.max_bytes:
+                break
+        conn.executemany("DELETE FROM llm_cache WHERE key = ?", stale_keys)
+        self._add_total(conn, -freed)
+        logger.info(f"LLM缓存淘汰了 {len(stale_keys)} 条记录，释放 {freed} 字节")
+
+    def clear(self, **kwargs):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM llm_cache")
+            conn.execute("UPDATE llm_cache_meta SET value = 0 WHERE name = 'total_bytes'")
+
+    def stats(self):
+        """返回命中/未命中次数以及当前条目数和占用字节数"""
+        conn = self._connect()
+        entries = conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+        total = self._total(conn)
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": total
+        }
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def enable_llm_cache_from_env():
+    """当LLM_CACHE_ENABLED=true时启用全局LLM响应缓存，返回缓存对象（未启用时返回None）"""
+    global _shared_cache
+    if os.getenv("LLM_CACHE_ENABLED", "false").lower() != "true":
+        return None
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            from langchain.globals import set_llm_cache
+
+            path = os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite3")
+            max_bytes = int(float(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024)
+            ttl_seconds = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+            _shared_cache = SQLiteLRUCache(path, max_bytes=max_bytes, ttl_seconds=ttl_seconds)
+            set_llm_cache(_shared_cache)
+            logger.info(f"已启用LLM响应缓存: {path}")
+        return _shared_cache
@@ -0,0 +1,110 @@
+import time
+import threading
+import contextlib
+from contextvars import ContextVar
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from metrics import LLM_REQUEST_SECONDS, LLM_REQUESTS, LLM_TOKENS, LLM_RATE_LIMITED, LLM_RETRIES
+from rate_limiter import estimate_tokens
+from model_router import ContextWindowExceeded
+
+# 当前LLM调用的指标记录：模型发出请求期间设置（见LLMMetricsHandler.run_context），
+# 同步调用按线程、异步调用按协程隔离，HTTP响应钩子据此记录429和累计请求次数
+_current_call = ContextVar("llm_metrics_current_call", default=None)
+
+
+class _CallRecord:
+    __slots__ = ("labels", "started", "prompt_tokens", "attempts")
+
+    def __init__(self, labels, prompt_tokens):
+        self.labels = labels
+        self.started = time.monotonic()
+        self.prompt_tokens = prompt_tokens
+        self.attempts = 0
+
+
+def metrics_response_hook(response):
+    """httpx响应钩子：记录429响应数，并累计当前调用的HTTP请求次数用于计算重试次数"""
+    record = _current_call.get()
+    if record is None:
+        return
+    record.attempts += 1
+    if response.status_code == 429:
+        LLM_RATE_LIMITED.inc(**record.labels)
+
+
+def record_call_model(model):
+    """模型路由选定本次请求的模型后调用：当前调用的指标按实际请求的模型记录"""
+    record = _current_call.get()
+    if record is not None:
+        record.labels = dict(record.labels, model=model)
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """按智能体角色和模型记录LLM调用的耗时、结果和token用量
+
+    耗时从LangChain发起调用开始计算，包含在客户端限流器中等待的时间。接口未返回用量时按文本估算token数。
+    model为默认的模型标签，请求经过模型路由时改用路由选定的模型（见record_call_model）。
+    """
+
+    def __init__(self, role, model):
+        self.labels = {"role": role, "model": model}
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id, prompt_tokens):
+        with self._lock:
+            self._calls[run_id] = _CallRecord(self.labels, prompt_tokens)
+
+    def _finish(self, run_id, outcome):
+        """记录调用结束，返回该次调用的指标标签和估算的提示词token数"""
+        with self._lock:
+            record = self._calls.pop(run_id, None)
+        if record is None:
+            LLM_REQUESTS.inc(outcome=outcome, **self.labels)
+            return self.labels, 0
+        LLM_REQUESTS.inc(outcome=outcome, **record.labels)
+        LLM_REQUEST_SECONDS.observe(time.monotonic() - record.started, **record.labels)
+        if record.attempts > 1:
+            LLM_RETRIES.inc(record.attempts - 1, **record.labels)
+        return record.labels, record.prompt_tokens
+
+    @contextlib.contextmanager
+    def run_context(self, run_id):
+        """模型发出请求期间进入：把该次调用的记录设为当前调用（回调可能在其他线程或上下文中执行，不能在回调中设置）"""
+        with self._lock:
+            record = self._calls.get(run_id)
+        token = _current_call.set(record)
+        try:
+            yield record
+        finally:
+            try:
+                _current_call.reset(token)
+            except ValueError:
+                # 流式生成器在其他上下文中被关闭
+                pass
+
+    def on_chat_model_start(self, serialized, messages, run_id=None, **kwargs):
+        self._start(run_id, estimate_tokens("".join(str(m.content) for batch in messages for m in batch)))
+
+    def on_llm_start(self, serialized, prompts, run_id=None, **kwargs):
+        self._start(run_id, estimate_tokens("".join(prompts)))
+
+    def on_llm_end(self, response, run_id=None, **kwargs):
+        labels, estimated_prompt_tokens = self._finish(run_id, "success")
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        completion_tokens = usage.get("completion_tokens")
+        if completion_tokens is None:
+            completion_tokens = sum(estimate_tokens(g.text) for gens in response.generations for g in gens)
+        LLM_TOKENS.inc(usage.get("prompt_tokens") or estimated_prompt_tokens, direction="in", **labels)
+        LLM_TOKENS.inc(completion_tokens, direction="out", **labels)
+
+    def on_llm_error(self, error, run_id=None, **kwargs):
+        if isinstance(error, ContextWindowExceeded):
+            outcome = "rejected"
+        elif getattr(error, "status_code", None) == 429:
+            outcome = "rate_limited"
+        else:
+            outcome = "error"
+        self._finish(run_id, outcome)
@@ -0,0 +1,221 @@
+"""LLM调用级重试：只重试失败的那一次HTTP请求，而不是重新执行整个团队
+
+按错误类型决定是否重试：限流（429）、服务过载、5xx、超时和连接错误会重试；认证失败、参数错误、
+上下文超出窗口和账户额度用尽不会重试。重试间隔采用decorrelated jitter退避，接口给出Retry-After
+（响应头或Moonshot 429错误信息中的"please try again after N seconds"）时至少等待该时长。
+
+每次调用最多尝试LLM_RETRY_MAX_ATTEMPTS次；每次执行（retry_budget()范围内，例如一次kickoff）的所有调用
+共用LLM_RETRY_BUDGET次重试。收到429时共享限流器暂停放行，之后所有执行的请求和重试都在同一个队列中
+按配额逐个放行，不会在同一时刻一起重试。
+"""
+import os
+import re
+import time
+import random
+import logging
+import threading
+import contextlib
+from contextvars import ContextVar
+from email.utils import parsedate_to_datetime
+
+from metrics import LLM_RETRY_DECISIONS, LLM_RETRY_DELAY_SECONDS
+from model_router import ContextWindowExceeded
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_KINDS = ("rate_limit", "overloaded", "server", "timeout", "connection")
+
+# Moonshot的429错误：限流（可重试）、引擎过载（可重试）、额度用尽或账户欠费（重试无用）
+_OVERLOADED_TYPES = ("engine_overloaded_error",)
+_QUOTA_TYPES = ("exceeded_current_quota_error", "insufficient_quota")
+_TRY_AFTER_PATTERN = re.compile(r"try again (?:after|in) (\d+(?:\.\d+)?)\s*(ms|milliseconds?|s|seconds?)", re.IGNORECASE)
+_MAX_RPM_PATTERN = re.compile(r"max RPM:\s*(\d+)", re.IGNORECASE)
+
+_TIMEOUT_CLASSES = ("APITimeoutError", "TimeoutException", "TimeoutError")
+_CONNECTION_CLASSES = ("APIConnectionError", "TransportError", "ConnectionError", "RemoteProtocolError")
+
+
+def _error_body(error):
+    """取出接口返回的错误对象（{"message": ..., "type": ...}），兼容外层带有"error"键的格式"""
+    body = getattr(error, "body", None)
+    if isinstance(body, dict) and isinstance(body.get("error"), dict):
+        body = body["error"]
+    return body if isinstance(body, dict) else {}
+
+
+def classify_error(error):
+    """错误类型：rate_limit、overloaded、quota、auth、bad_request、context_window、server、timeout、connection或unknown"""
+    if isinstance(error, ContextWindowExceeded):
+        return "context_window"
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        error_type = _error_body(error).get("type")
+        if status == 429:
+            if error_type in _QUOTA_TYPES:
+                return "quota"
+            return "overloaded" if error_type in _OVERLOADED_TYPES else "rate_limit"
+        if status in (401, 403):
+            return "auth"
+        if status == 408:
+            return "timeout"
+        if status == 409 or status >= 500:
+            return "server"
+        if 400 <= status < 500:
+            return "bad_request"
+    # 没有状态码时按异常类型判断（openai、httpx和内置的超时/连接异常）
+    class_names = {cls.__name__ for cls in type(error).__mro__}
+    if class_names.intersection(_TIMEOUT_CLASSES):
+        return "timeout"
+    if class_names.intersection(_CONNECTION_CLASSES):
+        return "connection"
+    return "unknown"
+
+
+def retry_after_seconds(error):
+    """接口要求的等待时间（秒）：依次读取retry-after-ms、Retry-After响应头（秒数或HTTP日期）
+    和Moonshot错误信息中的"please try again after N seconds"；错误信息只给出RPM上限时按一个请求的间隔估算
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    message = str(_error_body(error).get("message") or error)
+    match = _TRY_AFTER_PATTERN.search(message)
+    if match:
+        seconds = float(match.group(1))
+        return seconds / 1000 if match.group(2).lower().startswith("m") else seconds
+    match = _MAX_RPM_PATTERN.search(message)
+    if match and int(match.group(1)) > 0:
+        return 60.0 / int(match.group(1))
+    return None
+
+
+class RetryBudget:
+    """一次执行内所有LLM调用共用的重试次数上限"""
+
+    def __init__(self, max_retries):
+        self.max_retries = max_retries
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def try_spend(self):
+        with self._lock:
+            if self.used >= self.max_retries:
+                return False
+            self.used += 1
+            return True
+
+
+_current_budget = ContextVar("llm_retry_budget", default=None)
+
+
+@contextlib.contextmanager
+def retry_budget(max_retries=None):
+    """在该范围内发出的LLM调用共用一份重试预算（默认LLM_RETRY_BUDGET次），范围内启动的协程和线程池任务同样生效"""
+    if max_retries is None:
+        max_retries = int(os.getenv("LLM_RETRY_BUDGET", "20"))
+    budget = RetryBudget(max_retries)
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+class RetryPolicy:
+    """重试策略：max_attempts为单次调用的最大尝试次数（含第一次），退避从base_delay开始、不超过max_delay"""
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=60.0, rng=None):
+        if max_attempts < 1:
+            raise ValueError("max_attempts必须大于等于1")
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._rng = rng or random.Random()
+
+    def backoff(self, previous_delay):
+        """decorrelated jitter：在[base_delay, 上一次间隔的3倍]之间随机取值，同时失败的调用各自错开"""
+        return min(self.max_delay, self._rng.uniform(self.base_delay, max(previous_delay, self.base_delay) * 3))
+
+    def jitter(self):
+        return self._rng.uniform(0, self.base_delay)
+
+    def start(self, limiter=None):
+        """开始一次调用，返回记录该调用重试状态的CallRetry"""
+        return CallRetry(self, _current_budget.get(), limiter)
+
+
+class CallRetry:
+    """单次LLM调用的重试状态"""
+
+    def __init__(self, policy, budget=None, limiter=None):
+        self.policy = policy
+        self.budget = budget
+        self.limiter = limiter
+        self.attempt = 1
+        self._previous_delay = policy.base_delay
+
+    def _give_up(self, kind, decision, error):
+        LLM_RETRY_DECISIONS.inc(kind=kind, decision=decision)
+        if decision != "not_retryable":
+            logger.error(f"LLM请求失败（{kind}），不再重试（{decision}，已尝试{self.attempt}次）: {str(error)}")
+        return None
+
+    def next_delay(self, error):
+        """请求失败后调用：返回重试前应等待的秒数，不应重试时返回None（调用方重新抛出原异常）"""
+        kind = classify_error(error)
+        if kind not in RETRYABLE_KINDS:
+            return self._give_up(kind, "not_retryable", error)
+        if self.attempt >= self.policy.max_attempts:
+            return self._give_up(kind, "attempts_exhausted", error)
+        retry_after = retry_after_seconds(error) if kind in ("rate_limit", "overloaded") else None
+        if retry_after is not None and retry_after > self.policy.max_delay:
+            return self._give_up(kind, "retry_after_too_long", error)
+        if self.budget is not None and not self.budget.try_spend():
+            return self._give_up(kind, "budget_exhausted", error)
+
+        delay = self.policy.backoff(self._previous_delay)
+        if retry_after is not None:
+            # 至少等到接口要求的时间，再加上随机抖动，避免同时收到429的调用在同一时刻重试
+            delay = max(delay, retry_after + self.policy.jitter())
+        self._previous_delay = delay
+        if self.limiter is not None and kind in ("rate_limit", "overloaded"):
+            # 其他执行排队中的请求也要等待，之后按配额逐个放行
+            self.limiter.pause(retry_after if retry_after is not None else self.policy.base_delay)
+        self.attempt += 1
+        LLM_RETRY_DECISIONS.inc(kind=kind, decision="retry")
+        LLM_RETRY_DELAY_SECONDS.observe(delay, kind=kind)
+        logger.warning(
+            f"LLM请求失败（{kind}），{delay:.1f}秒后重试（第{self.attempt}/{self.policy.max_attempts}次尝试）: {str(error)}"
+        )
+        return delay
+
+
+_shared_policy = None
+_shared_policy_lock = threading.Lock()
+
+
+def get_shared_retry_policy():
+    """进程内共享的重试策略：LLM_RETRY_MAX_ATTEMPTS、LLM_RETRY_BASE_DELAY、LLM_RETRY_MAX_DELAY"""
+    global _shared_policy
+    with _shared_policy_lock:
+        if _shared_policy is None:
+            _shared_policy = RetryPolicy(
+                max_attempts=int(os.getenv("LLM_RETRY_MAX_ATTEMPTS", "4")),
+                base_delay=float(os.getenv("LLM_RETRY_BASE_DELAY", "1")),
+                max_delay=float(os.getenv("LLM_RETRY_MAX_DELAY", "60"))
+            )
+        return _shared_policy
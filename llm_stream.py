@@ -0,0 +1,68 @@
+import time
+import threading
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from execution_state import make_task_id
+
+
+class TaskOutputStreamer(BaseCallbackHandler):
+    """把LLM流式输出的token作为task_delta事件发布，用于在智能体卡片中实时追加任务输出
+
+    token先在内存中累积，距上次发布超过interval秒时才合并成一条事件发布，避免每个token一条事件；
+    每次LLM调用的第一批token立即发布。任务的完整输出仍以最终的update_agent为准。
+    """
+
+    # 异步调用时在事件循环中按顺序直接处理（只做内存累积和发布），不按token逐个交给线程池，以免token乱序
+    run_inline = True
+
+    def __init__(self, publish, agent_name, task_description, interval=0.1):
+        self.publish = publish
+        self.agent_name = agent_name
+        self.task_id = make_task_id(task_description)
+        self.interval = interval
+        self._pending = []
+        self._reset = False
+        self._last_publish = 0.0
+        self._lock = threading.Lock()
+
+    def _start(self):
+        # 新的一次LLM调用：卡片中改为展示本次调用的输出
+        with self._lock:
+            self._pending = []
+            self._reset = True
+            self._last_publish = 0.0
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._start()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._start()
+
+    def on_llm_new_token(self, token, **kwargs):
+        with self._lock:
+            self._pending.append(token)
+            if time.monotonic() - self._last_publish >= self.interval:
+                self._flush()
+
+    def on_llm_end(self, response, **kwargs):
+        with self._lock:
+            self._flush()
+
+    def on_llm_error(self, error, **kwargs):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        # 调用方持有self._lock
+        if not self._pending:
+            return
+        self.publish("task_delta", {
+            "agent": self.agent_name,
+            "task_id": self.task_id,
+            "delta": "".join(self._pending),
+            "reset": self._reset
+        })
+        self._pending = []
+        self._reset = False
+        self._last_publish = time.monotonic()
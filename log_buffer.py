@@ -0,0 +1,71 @@
+import threading
+from collections import deque
+
+
+def format_log_entry(entry):
+    """还原为 "时间 - 级别 - 内容" 形式的日志行"""
+    return f"{entry['timestamp']} - {entry['level'].upper()} - {entry['message']}"
+
+
+class LogRingBuffer:
+    """固定容量的日志环形缓冲区：每条日志带有从1开始连续递增的序号，写满后淘汰最旧的日志"""
+
+    def __init__(self, capacity=1000):
+        if capacity < 1:
+            raise ValueError("capacity必须大于等于1")
+        self.capacity = capacity
+        self._buffer = deque(maxlen=capacity)
+        self._next_seq = 1
+        self._lock = threading.Lock()
+
+    def append(self, level, message, timestamp):
+        with self._lock:
+            entry = {"seq": self._next_seq, "level": level, "message": message, "timestamp": timestamp}
+            self._next_seq += 1
+            self._buffer.append(entry)
+        return entry
+
+    @property
+    def first_seq(self):
+        """缓冲区中最早一条日志的序号；为空时等于下一条日志的序号"""
+        with self._lock:
+            return self._buffer[0]["seq"] if self._buffer else self._next_seq
+
+    @property
+    def last_seq(self):
+        """最近一条日志的序号，还没有日志时为0"""
+        with self._lock:
+            return self._next_seq - 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._buffer)
+
+    def tail(self, limit):
+        with self._lock:
+            return list(self._buffer)[-limit:] if limit else []
+
+    def query(self, after_seq=None, before_seq=None, limit=100, level=None):
+        """按序号范围读取日志窗口，结果按序号升序排列
+
+        指定after_seq时返回其后的最早limit条；否则返回before_seq之前（未指定时到末尾）的最近limit条。
+        limit为None时不限条数。
+        所需的范围已被淘汰出缓冲区时返回None，调用方应改为查询持久化存储。
+        """
+        with self._lock:
+            first_seq = self._buffer[0]["seq"] if self._buffer else self._next_seq
+            entries = [
+                entry for entry in self._buffer
+                if (after_seq is None or entry["seq"] > after_seq)
+                and (before_seq is None or entry["seq"] < before_seq)
+                and (level is None or entry["level"] == level)
+            ]
+        if after_seq is not None:
+            return entries[:limit] if after_seq + 1 >= first_seq else None
+        if limit is None:
+            return entries if first_seq == 1 else None
+        window = entries[-limit:] if limit else []
+        if len(window) < limit and first_seq > 1:
+            # 窗口没有填满，而更早的日志已被淘汰
+            return None
+        return window
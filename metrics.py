@@ -0,0 +1,216 @@
+"""进程内的指标注册表，按Prometheus文本格式输出（只依赖标准库）
+
+指标在模块级定义，各处直接引用并记录；/metrics接口调用render()输出所有指标。
+"""
+import math
+import threading
+
+DEFAULT_LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标{self.name}需要标签: {', '.join(self.labelnames)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """返回[(后缀, 标签值, 额外标签, 值)]"""
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, values, extra, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, values, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """只增不减的计数器"""
+
+    type_name = "counter"
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("计数器只能增加")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [("", key, None, value) for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """可增可减的瞬时值；提供func时在输出时调用func()获取当前值（不支持标签）"""
+
+    type_name = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, func=None):
+        if func is not None and labelnames:
+            raise ValueError("使用func的指标不支持标签")
+        self._func = func
+        super().__init__(name, documentation, labelnames, registry)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self._func is not None:
+            return [("", (), None, self._func())]
+        with self._lock:
+            return [("", key, None, value) for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """按上界分桶的直方图，输出累计的_bucket、_sum和_count"""
+
+    type_name = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), registry=None, buckets=DEFAULT_LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][index] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def count(self, **labels):
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return state["count"] if state else 0
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state["counts"]):
+                    cumulative += count
+                    samples.append(("_bucket", key, f'le="{_format_value(bound)}"', cumulative))
+                samples.append(("_sum", key, None, state["sum"]))
+                samples.append(("_count", key, None, state["count"]))
+        return samples
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标{metric.name}已注册")
+            self._metrics[metric.name] = metric
+
+    def unregister(self, name):
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def render(self):
+        """按Prometheus文本格式（0.0.4）输出所有指标"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# LLM调用（按智能体角色和模型）
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_duration_seconds", "LLM调用耗时（秒），包含在客户端限流器中等待的时间", ("role", "model")
+)
+LLM_REQUESTS = Counter(
+    "llm_requests_total", "LLM调用次数，outcome为success、error、rate_limited或rejected（本地预检拒绝）", ("role", "model", "outcome")
+)
+LLM_TOKENS = Counter("llm_tokens_total", "LLM消耗的token数，direction为in（输入）或out（输出）", ("role", "model", "direction"))
+LLM_RATE_LIMITED = Counter("llm_rate_limited_responses_total", "接口返回429的HTTP响应数（含被自动重试的）", ("role", "model"))
+LLM_RETRIES = Counter("llm_retries_total", "LLM调用的HTTP重试次数", ("role", "model"))
+LLM_RETRY_DECISIONS = Counter(
+    "llm_retry_decisions_total",
+    "LLM请求失败后的重试决策，kind为错误类型，decision为retry、not_retryable、attempts_exhausted、budget_exhausted或retry_after_too_long",
+    ("kind", "decision")
+)
+LLM_RETRY_DELAY_SECONDS = Histogram(
+    "llm_retry_delay_seconds", "LLM请求重试前等待的时间（秒），含Retry-After和随机抖动", ("kind",),
+    buckets=(0.5, 1, 2, 5, 10, 30, 60)
+)
+LLM_RATE_LIMITER_WAIT_SECONDS = Histogram(
+    "llm_rate_limiter_wait_seconds", "请求在客户端限流器中等待配额的时间（秒），持续升高说明配额饱和", ("model",),
+    buckets=(0.01, 0.1, 0.5, 1, 2, 5, 10, 30, 60)
+)
+LLM_ROUTED_REQUESTS = Counter("llm_routed_requests_total", "按上下文大小路由到各模型的请求数", ("role", "model"))
+LLM_PREFLIGHT_REJECTIONS = Counter(
+    "llm_preflight_rejections_total", "本地预检时超出所有可用模型窗口而直接拒绝的请求数（未发往API）", ("role",)
+)
+
+# 任务上下文预算
+CONTEXT_TOKENS_SAVED = Counter("context_tokens_saved_total", "压缩上游任务输出节省的上下文token数（估算）", ("role",))
+CONTEXT_COMPRESSIONS = Counter(
+    "context_compressions_total", "上游输出的压缩次数，method为summary（LLM摘要）、trim（按行截断）或cached（复用缓存）", ("method",)
+)
+
+# 任务与智能体
+TASK_DURATION_SECONDS = Histogram(
+    "task_duration_seconds", "任务从开始到切换为下一个任务或执行结束的耗时（秒）", ("task",),
+    buckets=(1, 2, 5, 10, 30, 60, 120, 300, 600, 1800)
+)
+AGENT_UPDATES = Counter("agent_updates_total", "智能体及任务输出的更新次数", ("agent",))
+
+# 事件分发
+EVENT_FANOUT_SECONDS = Histogram(
+    "event_fanout_duration_seconds", "发布一条事件（序列化并投递到所有订阅者）的耗时（秒）", (),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+)
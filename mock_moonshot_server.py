@@ -0,0 +1,321 @@
+"""本地的Moonshot（OpenAI兼容接口）替身服务，用于无网络的离线运行、回归测试和压测
+
+实现POST /v1/chat/completions（流式与非流式）和GET /v1/models，只依赖标准库。可以配置首个token前的
+延迟分布、输出token速度、固定或回显的响应内容，并按比例注入429（带Retry-After）、超时和5xx故障。
+
+运行方式：
+    python mock_moonshot_server.py [--port 8900] [--latency lognormal:0.8,0.5] [--tokens-per-second 60]
+                                   [--fault-429 0.05] [--fault-5xx 0.01] [--fault-timeout 0.01] [--seed 42]
+
+然后让应用指向本地服务（本地服务没有配额，可以同时放开客户端限流）：
+    MOONSHOT_BASE_URL=http://127.0.0.1:8900/v1 MOONSHOT_RPM_LIMIT=100000 python multi_agent_system.py
+"""
+import re
+import json
+import math
+import time
+import uuid
+import random
+import hashlib
+import argparse
+import threading
+from collections import deque, Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rate_limiter import estimate_tokens
+
+# 与estimate_tokens的估算方式一致：中日韩字符每个一个token，其余字符每4个一个token
+_TOKEN_PATTERN = re.compile(
+    r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]"
+    r"|[^\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]{1,4}"
+)
+
+# 默认的固定响应采用ReAct格式，CrewAI的智能体可以直接解析出最终答案
+DEFAULT_CANNED_RESPONSES = [
+    "Thought: 我已经掌握了足够的信息，可以给出最终答案。\n"
+    "Final Answer: 经过分析，建议分三个阶段推进：第一阶段明确核心功能和目标用户，"
+    "第二阶段完成技术选型和原型验证，第三阶段进行小范围试点并根据反馈迭代。",
+    "Thought: 我已经掌握了足够的信息，可以给出最终答案。\n"
+    "Final Answer: 方案包括以下要点：1. 模块化的服务架构；2. 统一的接口规范；"
+    "3. 完善的监控与告警；4. 自动化测试覆盖核心流程。",
+    "Thought: 我已经掌握了足够的信息，可以给出最终答案。\n"
+    "Final Answer: 总结如下：当前设计满足主要需求，建议优先优化响应速度和易用性，"
+    "并在上线前完成性能测试和安全评审。",
+]
+
+
+def parse_latency(spec):
+    """解析延迟分布，返回按随机数生成器采样延迟（秒）的函数
+
+    支持fixed:秒数、uniform:最小值,最大值、normal:均值,标准差、lognormal:中位数,sigma。
+    """
+    kind, _, args = spec.partition(":")
+    try:
+        values = [float(v) for v in args.split(",")] if args else []
+    except ValueError:
+        raise ValueError(f"无法解析延迟分布: {spec}")
+    if kind == "fixed" and len(values) == 1:
+        return lambda rng: values[0]
+    if kind == "uniform" and len(values) == 2:
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal" and len(values) == 2:
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal" and len(values) == 2 and values[0] > 0:
+        mu = math.log(values[0])
+        return lambda rng: rng.lognormvariate(mu, values[1])
+    raise ValueError(f"无法解析延迟分布: {spec}")
+
+
+def split_tokens(text):
+    """按估算规则把文本切分为token，流式响应每次发送一个"""
+    return _TOKEN_PATTERN.findall(text)
+
+
+class MockBehavior:
+    """替身服务的行为配置：延迟、吞吐、响应内容和故障注入；固定seed时结果可复现"""
+
+    def __init__(self, latency="fixed:0.2", tokens_per_second=50.0, response_mode="canned",
+                 canned_responses=None, fault_429=0.0, fault_5xx=0.0, fault_timeout=0.0,
+                 retry_after=1, timeout_seconds=120.0, rpm=0, seed=None):
+        if response_mode not in ("canned", "echo"):
+            raise ValueError("response_mode必须是canned或echo")
+        self.sample_latency = parse_latency(latency)
+        self.tokens_per_second = tokens_per_second
+        self.response_mode = response_mode
+        self.canned_responses = canned_responses or DEFAULT_CANNED_RESPONSES
+        self.fault_429 = fault_429
+        self.fault_5xx = fault_5xx
+        self.fault_timeout = fault_timeout
+        self.retry_after = retry_after
+        self.timeout_seconds = timeout_seconds
+        # 模拟服务端的每分钟请求配额，0表示不限制
+        self.rpm = rpm
+        self.stats = Counter()
+        self._rng = random.Random(seed)
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def plan(self):
+        """为一次请求抽取(故障类型, 详情, 首个token前的延迟)
+
+        故障类型为None、429、5xx或timeout；超出模拟配额的429详情为Retry-After秒数，5xx的详情为状态码。
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+            now = time.monotonic()
+            if self.rpm:
+                while self._recent and now - self._recent[0] >= 60:
+                    self._recent.popleft()
+                if len(self._recent) >= self.rpm:
+                    self.stats["429"] += 1
+                    return "429", max(1, int(60 - (now - self._recent[0])) + 1), 0.0
+                self._recent.append(now)
+            roll = self._rng.random()
+            latency = self.sample_latency(self._rng)
+            for fault, rate in (("429", self.fault_429), ("5xx", self.fault_5xx), ("timeout", self.fault_timeout)):
+                if roll < rate:
+                    self.stats[fault] += 1
+                    status = self._rng.choice((500, 502, 503)) if fault == "5xx" else None
+                    return fault, status, latency
+                roll -= rate
+            return None, None, latency
+
+    def reply_for(self, messages):
+        """生成响应内容：canned按最后一条用户消息的哈希选择固定响应（相同输入总是相同输出），echo原样返回"""
+        last = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        if not isinstance(last, str):
+            last = json.dumps(last, ensure_ascii=False)
+        if self.response_mode == "echo":
+            return last
+        digest = hashlib.sha1(last.encode("utf-8")).digest()
+        return self.canned_responses[int.from_bytes(digest[:4], "big") % len(self.canned_responses)]
+
+
+class MockMoonshotHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    behavior = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, document, headers=None):
+        body = json.dumps(document, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status, error_type, message, headers=None):
+        self._send_json(status, {"error": {"type": error_type, "message": message}}, headers)
+
+    def _write_chunk(self, data):
+        # 流式响应使用分块传输编码，连接可以复用
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("/v1/models", "/models"):
+            self._send_json(200, {"object": "list", "data": [
+                {"id": model, "object": "model", "owned_by": "mock"}
+                for model in ("moonshot-v1-8k", "moonshot-v1-32k", "moonshot-v1-128k")
+            ]})
+        elif self.path == "/stats":
+            self._send_json(200, dict(self.behavior.stats))
+        else:
+            self._send_error(404, "not_found", "接口不存在")
+
+    def do_POST(self):
+        if self.path.rstrip("/") not in ("/v1/chat/completions", "/chat/completions"):
+            self._send_error(404, "not_found", "接口不存在")
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            messages = request["messages"]
+        except (ValueError, KeyError, TypeError):
+            self._send_error(400, "invalid_request_error", "请求体不是有效的chat completions请求")
+            return
+
+        behavior = self.behavior
+        fault, detail, latency = behavior.plan()
+        if fault == "429":
+            retry_after = detail or behavior.retry_after
+            self._send_error(429, "rate_limit_reached_error", "请求过于频繁，请稍后重试",
+                             {"Retry-After": str(retry_after)})
+            return
+        time.sleep(latency)
+        if fault == "5xx":
+            self._send_error(detail, "server_error", "服务暂时不可用")
+            return
+        if fault == "timeout":
+            # 长时间不响应后直接断开连接，模拟客户端读超时
+            time.sleep(behavior.timeout_seconds)
+            self.close_connection = True
+            return
+
+        model = request.get("model", "moonshot-v1-8k")
+        tokens = split_tokens(behavior.reply_for(messages))
+        finish_reason = "stop"
+        max_tokens = request.get("max_tokens")
+        if max_tokens and len(tokens) > max_tokens:
+            tokens = tokens[:max_tokens]
+            finish_reason = "length"
+        prompt_tokens = sum(estimate_tokens(str(m.get("content") or "")) for m in messages)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(tokens),
+            "total_tokens": prompt_tokens + len(tokens)
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        behavior.stats["completion_tokens"] += len(tokens)
+
+        if not request.get("stream"):
+            if behavior.tokens_per_second:
+                time.sleep(len(tokens) / behavior.tokens_per_second)
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": finish_reason
+                }],
+                "usage": usage
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta, reason=None, **extra):
+            document = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": reason}] if delta is not None else [],
+                **extra
+            }
+            return f"data: {json.dumps(document, ensure_ascii=False)}\n\n".encode("utf-8")
+
+        interval = 1 / behavior.tokens_per_second if behavior.tokens_per_second else 0
+        try:
+            self._write_chunk(chunk({"role": "assistant", "content": ""}))
+            for token in tokens:
+                if interval:
+                    time.sleep(interval)
+                self._write_chunk(chunk({"content": token}))
+            self._write_chunk(chunk({}, finish_reason))
+            if (request.get("stream_options") or {}).get("include_usage"):
+                self._write_chunk(chunk(None, usage=usage))
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+def create_server(behavior, host="127.0.0.1", port=8900):
+    """创建替身服务（未启动），port为0时由系统分配端口，可通过server.server_address读取"""
+    handler = type("BoundMockMoonshotHandler", (MockMoonshotHandler,), {"behavior": behavior})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", default="fixed:0.2",
+                        help="首个token前的延迟分布：fixed:S、uniform:A,B、normal:MEAN,STD、lognormal:MEDIAN,SIGMA")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="输出速度，0表示不限速")
+    parser.add_argument("--response-mode", choices=("canned", "echo"), default="canned")
+    parser.add_argument("--canned-file", help="JSON字符串数组文件，替换默认的固定响应")
+    parser.add_argument("--fault-429", type=float, default=0.0, help="返回429的请求比例")
+    parser.add_argument("--fault-5xx", type=float, default=0.0, help="返回5xx的请求比例")
+    parser.add_argument("--fault-timeout", type=float, default=0.0, help="不响应直至超时的请求比例")
+    parser.add_argument("--retry-after", type=int, default=1, help="注入的429响应的Retry-After（秒）")
+    parser.add_argument("--timeout-seconds", type=float, default=120.0, help="超时故障保持连接的时间（秒）")
+    parser.add_argument("--rpm", type=int, default=0, help="模拟服务端每分钟请求配额，0表示不限制")
+    parser.add_argument("--seed", type=int, help="随机种子，固定后延迟和故障序列可复现")
+    args = parser.parse_args()
+
+    canned = None
+    if args.canned_file:
+        with open(args.canned_file, encoding="utf-8") as f:
+            canned = json.load(f)
+    behavior = MockBehavior(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        response_mode=args.response_mode,
+        canned_responses=canned,
+        fault_429=args.fault_429,
+        fault_5xx=args.fault_5xx,
+        fault_timeout=args.fault_timeout,
+        retry_after=args.retry_after,
+        timeout_seconds=args.timeout_seconds,
+        rpm=args.rpm,
+        seed=args.seed
+    )
+    server = create_server(behavior, args.host, args.port)
+    host, port = server.server_address[:2]
+    print(f"Moonshot替身服务已启动: http://{host}:{port}/v1")
+    print(f"使用方式: MOONSHOT_BASE_URL=http://{host}:{port}/v1 MOONSHOT_RPM_LIMIT=100000 python multi_agent_system.py")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
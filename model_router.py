@@ -0,0 +1,115 @@
+"""按上下文大小选择模型：发送请求前在本地估算提示词token数，选择窗口能容纳的最小模型
+
+8k、32k、128k三个模型的窗口不同，价格和速度也不同。所有请求都用同一个模型时，大上下文的任务会超出窗口，
+小任务又用不上更便宜、更快的模型。路由器为每个请求选择窗口能容纳（提示词 + 输出预留 + 估算误差余量）的
+最小模型；最大的模型也容纳不下时在本地直接拒绝，不浪费一次请求和限流配额。
+"""
+import os
+import logging
+import threading
+
+from metrics import LLM_ROUTED_REQUESTS, LLM_PREFLIGHT_REJECTIONS
+
+logger = logging.getLogger(__name__)
+
+# 各模型的上下文窗口（token）
+MODEL_CONTEXT_WINDOWS = {
+    "moonshot-v1-8k": 8192,
+    "moonshot-v1-32k": 32768,
+    "moonshot-v1-128k": 131072
+}
+
+
+class ContextWindowExceeded(ValueError):
+    """请求在本地估算后超出所有可用模型的上下文窗口"""
+
+    def __init__(self, required_tokens, model, window):
+        self.required_tokens = required_tokens
+        self.model = model
+        self.window = window
+        super().__init__(f"请求约需{required_tokens}个token，超出{model}的上下文窗口（{window}）")
+
+
+def parse_overrides(value):
+    """解析 角色=模型 的逗号分隔列表，例如 "AI研究员=moonshot-v1-32k,manager=moonshot-v1-32k" """
+    overrides = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            role, model = item.split("=", 1)
+            overrides[role.strip()] = model.strip()
+    return overrides
+
+
+class ModelRouter:
+    """为每个请求选择模型
+
+    role_overrides把角色映射到该角色可用的最小模型（例如需要更强推理的角色固定从32k起步），
+    超出该模型窗口时仍会升级到更大的模型。enabled为False时总是使用调用方的默认模型，只做本地预检。
+    """
+
+    def __init__(self, windows=None, output_reserve=1024, safety_margin=0.1, role_overrides=None, enabled=True):
+        windows = windows or MODEL_CONTEXT_WINDOWS
+        self.models = sorted(windows.items(), key=lambda item: item[1])
+        self.output_reserve = output_reserve
+        self.safety_margin = safety_margin
+        self.role_overrides = dict(role_overrides or {})
+        self.enabled = enabled
+        for role, model in self.role_overrides.items():
+            if model not in windows:
+                raise ValueError(f"角色{role}的覆盖模型{model}不在可用模型中")
+
+    def required_tokens(self, prompt_tokens, max_tokens=None):
+        # 本地估算比较粗略，按比例留出余量；输出按max_tokens预留，未设置时按output_reserve预留
+        return int(prompt_tokens * (1 + self.safety_margin)) + (max_tokens or self.output_reserve)
+
+    def _candidates(self, role, default_model):
+        names = [name for name, _ in self.models]
+        if default_model is not None and default_model not in names and default_model not in MODEL_CONTEXT_WINDOWS:
+            # 自定义模型（例如其他兼容接口的模型）不参与路由
+            return []
+        if not self.enabled:
+            return [item for item in self.models if item[0] == default_model]
+        floor = self.role_overrides.get(role)
+        start = names.index(floor) if floor in names else 0
+        return self.models[start:]
+
+    def route(self, prompt_tokens, role=None, max_tokens=None, default_model=None):
+        """返回本次请求使用的模型；没有模型能容纳时抛出ContextWindowExceeded"""
+        label = role or "default"
+        candidates = self._candidates(role, default_model)
+        if not candidates:
+            return default_model
+        required = self.required_tokens(prompt_tokens, max_tokens)
+        for model, window in candidates:
+            if required <= window:
+                LLM_ROUTED_REQUESTS.inc(role=label, model=model)
+                return model
+        LLM_PREFLIGHT_REJECTIONS.inc(role=label)
+        model, window = candidates[-1]
+        raise ContextWindowExceeded(required, model, window)
+
+
+_shared_router = None
+_shared_router_lock = threading.Lock()
+
+
+def get_shared_model_router():
+    """获取进程内共享的路由器，按环境变量配置
+
+    MODEL_ROUTING（auto或off）、MODEL_ROUTING_OVERRIDES（角色=模型）、MODEL_ROUTING_OUTPUT_RESERVE（未设置max_tokens时
+    为输出预留的token数）、MODEL_ROUTING_MODELS（参与路由的模型，逗号分隔）
+    """
+    global _shared_router
+    with _shared_router_lock:
+        if _shared_router is None:
+            enabled = os.getenv("MODEL_ROUTING", "auto").lower() != "off"
+            models = [m.strip() for m in os.getenv("MODEL_ROUTING_MODELS", "").split(",") if m.strip()]
+            windows = {m: MODEL_CONTEXT_WINDOWS[m] for m in models if m in MODEL_CONTEXT_WINDOWS} or None
+            _shared_router = ModelRouter(
+                windows=windows,
+                output_reserve=int(os.getenv("MODEL_ROUTING_OUTPUT_RESERVE", "1024")),
+                role_overrides=parse_overrides(os.getenv("MODEL_ROUTING_OVERRIDES")),
+                enabled=enabled
+            )
+            logger.info(f"模型路由: {'按上下文大小选择' if enabled else '关闭（只做预检）'}")
+        return _shared_router
@@ -1,12 +1,8 @@
 import os
-import time
 import logging
-from crewai import Agent, Task, Crew, Process
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 
-# 配置日志
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# crewai、langchain等较重的依赖在首次使用时才导入，导入本模块不会创建模型、智能体或团队
 logger = logging.getLogger(__name__)
 
 # 加载环境变量
@@ -15,36 +11,56 @@ load_dotenv()
 # 设置API密钥和代理配置
 moonshot_api_key = os.getenv("MOONSHOT_API_KEY")
 moonshot_model_name = os.getenv("MOONSHOT_MODEL_NAME", "moonshot-v1-8k")
+# OpenAI兼容接口地址，可指向本地的mock_moonshot_server.py做离线运行和压测
+moonshot_base_url = os.getenv("MOONSHOT_BASE_URL", "https://api.moonshot.cn/v1")
+
+# 执行模式: sequential（按顺序执行）或 parallel（按context依赖并行执行）
+execution_mode = os.getenv("CREW_EXECUTION_MODE", "sequential")
+max_parallel_tasks = int(os.getenv("CREW_MAX_PARALLEL_TASKS", "2"))
+
+# 配置代理支持（在创建共享HTTP客户端之前调用，httpx在创建时读取代理环境变量）
+def configure_proxy():
+    proxy_url = os.getenv("HTTP_PROXY")
+    if proxy_url:
+        logger.info(f"已配置代理: {proxy_url}")
+        os.environ["HTTP_PROXY"] = proxy_url
+        os.environ["HTTPS_PROXY"] = proxy_url
+        os.environ["http_proxy"] = proxy_url
+        os.environ["https_proxy"] = proxy_url
 
-if not moonshot_api_key or moonshot_api_key == "sk-your-actual-api-key-here":
-    logger.warning("警告: 未设置有效的Kimi API密钥，请在.env文件中配置您的实际MOONSHOT_API_KEY")
-    logger.warning("示例: MOONSHOT_API_KEY=sk-abcdef1234567890abcdef1234567890abcdef1234567890")
+# 初始化Kimi模型
+def get_kimi_llm(role=None):
+    """初始化Kimi大语言模型（使用OpenAI兼容接口）
 
-# 配置代理支持
-proxy_url = os.getenv("HTTP_PROXY")
-if proxy_url:
-    logger.info(f"已配置代理: {proxy_url}")
-    os.environ["HTTP_PROXY"] = proxy_url
-    os.environ["HTTPS_PROXY"] = proxy_url
-    os.environ["http_proxy"] = proxy_url
-    os.environ["https_proxy"] = proxy_url
+    每个请求按提示词大小路由到合适的模型，role用于按角色覆盖路由（MODEL_ROUTING_OVERRIDES）。
+    """
+    from kimi_llm import KimiChatOpenAI
+    from llm_cache import enable_llm_cache_from_env
+    from http_pool import get_shared_http_client, get_shared_async_http_client
+    from model_router import get_shared_model_router
 
-# 初始化Kimi模型
-def get_kimi_llm():
-    """初始化Kimi大语言模型（使用OpenAI兼容接口）"""
     try:
+        configure_proxy()
         logger.info(f"正在初始化Kimi模型: {moonshot_model_name}")
         # 设置环境变量以便crewai能够正确使用Kimi API
         os.environ["OPENAI_API_KEY"] = moonshot_api_key
-        os.environ["OPENAI_BASE_URL"] = "https://api.moonshot.cn/v1"
+        os.environ["OPENAI_BASE_URL"] = moonshot_base_url
         os.environ["OPENAI_MODEL_NAME"] = moonshot_model_name
         
-        # 使用OpenAI兼容接口调用Kimi模型
-        kimi_llm = ChatOpenAI(
+        # 按配置启用LLM响应缓存（LLM_CACHE_ENABLED=true）
+        enable_llm_cache_from_env()
+        
+        # 使用OpenAI兼容接口调用Kimi模型，真正发出的请求会经过共享限流器
+        kimi_llm = KimiChatOpenAI(
             model_name=moonshot_model_name,
             api_key=moonshot_api_key,
-            base_url="https://api.moonshot.cn/v1",
-            temperature=0.7
+            base_url=moonshot_base_url,
+            temperature=0.7,
+            http_client=get_shared_http_client(),
+            # 在事件循环中创建时（例如batch_runner --async），异步请求复用该事件循环的共享连接池
+            http_async_client=get_shared_async_http_client(),
+            model_router=get_shared_model_router(),
+            agent_role=role
         )
         logger.info("Kimi模型初始化成功")
         return kimi_llm
@@ -52,119 +68,159 @@ def get_kimi_llm():
         logger.error(f"初始化Kimi模型失败: {str(e)}")
         raise
 
-# 初始化模型
-kimi_llm = get_kimi_llm()
-
-# 创建产品经理智能体
-product_manager = Agent(
-    role="产品经理",
-    goal="设计一个创新的AI助手产品",
-    backstory="你是一位经验丰富的产品经理，擅长将复杂需求转化为清晰的产品规划。",
-    verbose=True,
-    llm=kimi_llm
-)
-
-# 创建开发工程师智能体
-developer = Agent(
-    role="资深开发工程师",
-    goal="实现高质量的AI产品功能",
-    backstory="你是一位技术精湛的开发工程师，精通多种编程语言和AI技术栈。",
-    verbose=True,
-    llm=kimi_llm
-)
-
-# 创建UI设计师智能体
-designer = Agent(
-    role="UI/UX设计师",
-    goal="设计美观且易用的产品界面",
-    backstory="你是一位创意十足的UI/UX设计师，专注于用户体验和视觉设计。",
-    verbose=True,
-    llm=kimi_llm
-)
-
-# 创建测试工程师智能体
-tester = Agent(
-    role="测试工程师",
-    goal="确保产品质量和稳定性",
-    backstory="你是一位细致入微的测试工程师，擅长发现潜在问题并提出改进建议。",
-    verbose=True,
-    llm=kimi_llm
-)
-
-# 定义任务
-task1 = Task(
-    description="设计一个AI助手产品的功能规划和路线图，包括核心功能、目标用户和市场定位。",
-    expected_output="一份详细的产品需求文档，包含功能列表、用户故事和产品路线图。",
-    agent=product_manager
-)
-
-task2 = Task(
-    description="基于产品需求，设计后端系统架构和API接口，选择合适的技术栈。",
-    expected_output="技术架构文档，包含系统设计图、API规范和技术选型说明。",
-    agent=developer,
-    context=[task1]
-)
-
-task3 = Task(
-    description="设计产品的用户界面和交互流程，创建关键页面的设计稿。",
-    expected_output="UI设计稿和交互流程图，包含色彩方案和组件库建议。",
-    agent=designer,
-    context=[task1]
-)
-
-task4 = Task(
-    description="制定全面的测试计划，包括功能测试、性能测试和用户体验测试。",
-    expected_output="测试计划文档，包含测试用例、测试策略和验收标准。",
-    agent=tester,
-    context=[task1, task2, task3]
-)
+# 默认的产品简报；批量执行时每条简报的字段填入智能体目标和任务描述（见batch_runner.py）
+DEFAULT_BRIEF = {"product": "AI助手", "requirements": ""}
 
 # 创建团队
-crew = Crew(
-    agents=[product_manager, developer, designer, tester],
-    tasks=[task1, task2, task3, task4],
-    process=Process.sequential,
-    verbose=2
-)
+def create_crew(llm=None, brief=None):
+    """创建产品开发团队：四个智能体和按context依赖的四个任务，每次调用都返回新的实例
+
+    未指定llm时为每个智能体创建Kimi模型，指定时所有智能体共用。brief中的字段覆盖DEFAULT_BRIEF，
+    product填入产品名称，requirements（非空时）作为补充要求附在第一个任务之后。
+    """
+    from crewai import Agent, Task, Crew, Process
+    from crew_tracing import instrument_crew
+    from context_budget import ContextBudget, apply_context_budget, llm_summarizer
+
+    # 未指定llm时每个角色使用各自的模型实例，以便按角色路由和统计
+    llm_for = (lambda role: llm) if llm is not None else get_kimi_llm
+    fields = {**DEFAULT_BRIEF, **(brief or {})}
+    requirements = f"\n补充要求：{fields['requirements']}" if fields["requirements"] else ""
+    
+    # 创建产品经理智能体
+    product_manager = Agent(
+        role="产品经理",
+        goal="设计一个创新的{product}产品".format_map(fields),
+        backstory="你是一位经验丰富的产品经理，擅长将复杂需求转化为清晰的产品规划。",
+        verbose=True,
+        llm=llm_for("产品经理")
+    )
+
+    # 创建开发工程师智能体
+    developer = Agent(
+        role="资深开发工程师",
+        goal="实现高质量的AI产品功能",
+        backstory="你是一位技术精湛的开发工程师，精通多种编程语言和AI技术栈。",
+        verbose=True,
+        llm=llm_for("资深开发工程师")
+    )
+
+    # 创建UI设计师智能体
+    designer = Agent(
+        role="UI/UX设计师",
+        goal="设计美观且易用的产品界面",
+        backstory="你是一位创意十足的UI/UX设计师，专注于用户体验和视觉设计。",
+        verbose=True,
+        llm=llm_for("UI/UX设计师")
+    )
+
+    # 创建测试工程师智能体
+    tester = Agent(
+        role="测试工程师",
+        goal="确保产品质量和稳定性",
+        backstory="你是一位细致入微的测试工程师，擅长发现潜在问题并提出改进建议。",
+        verbose=True,
+        llm=llm_for("测试工程师")
+    )
+
+    # 定义任务
+    task1 = Task(
+        description="设计一个{product}产品的功能规划和路线图，包括核心功能、目标用户和市场定位。".format_map(fields) + requirements,
+        expected_output="一份详细的产品需求文档，包含功能列表、用户故事和产品路线图。",
+        agent=product_manager
+    )
+
+    task2 = Task(
+        description="基于产品需求，设计后端系统架构和API接口，选择合适的技术栈。",
+        expected_output="技术架构文档，包含系统设计图、API规范和技术选型说明。",
+        agent=developer,
+        context=[task1]
+    )
+
+    task3 = Task(
+        description="设计产品的用户界面和交互流程，创建关键页面的设计稿。",
+        expected_output="UI设计稿和交互流程图，包含色彩方案和组件库建议。",
+        agent=designer,
+        context=[task1]
+    )
+
+    task4 = Task(
+        description="制定全面的测试计划，包括功能测试、性能测试和用户体验测试。",
+        expected_output="测试计划文档，包含测试用例、测试策略和验收标准。",
+        agent=tester,
+        context=[task1, task2, task3]
+    )
+
+    crew = Crew(
+        agents=[product_manager, developer, designer, tester],
+        tasks=[task1, task2, task3, task4],
+        process=Process.sequential,
+        verbose=2
+    )
+    # 链路追踪：kickoff、任务、智能体步骤、委派和LLM调用的span写入TRACE_EXPORT_PATH
+    instrument_crew(crew)
+    # 上游任务的输出按CONTEXT_BUDGET_TOKENS压缩后再注入下游任务，摘要按上游输出缓存
+    apply_context_budget(crew, ContextBudget.from_env(moonshot_model_name, llm_summarizer(llm_for("context_budget"))))
+    return crew
 
 # 运行团队
-if __name__ == "__main__":
+def main():
+    from crew_tracing import traced_run
+    from task_scheduler import run_crew_in_parallel
+    from checkpoint_store import TaskCheckpointer
+    from llm_retry import classify_error, retry_budget
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if not moonshot_api_key or moonshot_api_key == "sk-your-actual-api-key-here":
+        logger.warning("警告: 未设置有效的Kimi API密钥，请在.env文件中配置您的实际MOONSHOT_API_KEY")
+        logger.warning("示例: MOONSHOT_API_KEY=sk-abcdef1234567890abcdef1234567890abcdef1234567890")
+    
     print("启动多智能体协作系统 (使用Kimi大模型)...")
     print(f"当前使用模型: {moonshot_model_name}")
+    print(f"执行模式: {execution_mode}")
     print("提示: 如果遇到连接问题，请检查：")
     print("1. .env文件中是否设置了有效的Kimi API密钥 (MOONSHOT_API_KEY)")
     print("2. 是否需要配置代理环境变量：HTTP_PROXY和HTTPS_PROXY")
     print("3. 网络连接是否稳定\n")
     
-    max_retries = 3
-    retry_count = 0
     result = None
+    # 失败的LLM请求在调用内按错误类型重试（本次运行的所有调用共用LLM_RETRY_BUDGET次重试）；
+    # 仍然失败时，已完成任务的输出保存在检查点中，重新运行时只执行未完成的任务
+    checkpointer = TaskCheckpointer(os.getenv("CREW_EXECUTION_ID", "multi_agent_system"))
+    crew = create_crew()
+    all_tasks = list(crew.tasks)
     
-    while retry_count < max_retries:
-        try:
-            result = crew.kickoff()
-            break  # 成功执行，退出重试循环
-        except Exception as e:
-            retry_count += 1
-            error_msg = str(e)
-            logger.error(f"执行出错 (第{retry_count}/{max_retries}次尝试): {error_msg}")
-            
-            # 提供更友好的错误提示
-            if "timeout" in error_msg.lower():
-                print(f"\n错误: 连接超时，请检查网络连接或API密钥是否正确")
-                print("提示: 如果您在需要代理的环境中，可以在.env文件中添加代理配置：")
-                print("HTTP_PROXY=http://your-proxy-server:port")
-                print("HTTPS_PROXY=http://your-proxy-server:port")
-            elif "authentication" in error_msg.lower() or "api_key" in error_msg.lower():
-                print(f"\n错误: API密钥认证失败，请检查.env文件中的API密钥是否正确")
-            
-            if retry_count < max_retries:
-                wait_time = 2 ** retry_count  # 指数退避
-                print(f"\n{wait_time}秒后重试...")
-                time.sleep(wait_time)
+    try:
+        with retry_budget():
+            if execution_mode == "parallel":
+                result = checkpointer.kickoff(
+                    crew, all_tasks,
+                    run=lambda c: traced_run(c, lambda: run_crew_in_parallel(c, max_workers=max_parallel_tasks))
+                )
             else:
-                print("\n已达到最大重试次数，请解决上述问题后重试")
+                result = checkpointer.kickoff(crew, all_tasks)
+    except Exception as e:
+        kind = classify_error(e)
+        logger.error(f"执行出错（{kind}）: {str(e)}")
+        
+        # 按错误类型给出提示
+        if kind in ("timeout", "connection"):
+            print(f"\n错误: 连接超时或失败，请检查网络连接或API密钥是否正确")
+            print("提示: 如果您在需要代理的环境中，可以在.env文件中添加代理配置：")
+            print("HTTP_PROXY=http://your-proxy-server:port")
+            print("HTTPS_PROXY=http://your-proxy-server:port")
+        elif kind == "auth":
+            print(f"\n错误: API密钥认证失败，请检查.env文件中的API密钥是否正确")
+        elif kind == "quota":
+            print(f"\n错误: 账户额度不足或已被暂停，请检查Moonshot账户")
+        elif kind in ("rate_limit", "overloaded"):
+            print(f"\n错误: 接口持续限流，请调低MOONSHOT_RPM_LIMIT后重试")
+        print("\n已完成任务的输出已保存为检查点，解决上述问题后重新运行会从未完成的任务继续")
     
     if result:
         print("\n任务完成！以下是协作结果：")
-        print(result)
\ No newline at end of file
+        print(result)
+
+
+if __name__ == "__main__":
+    main()
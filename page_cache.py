@@ -0,0 +1,42 @@
+import threading
+from collections import OrderedDict
+
+
+class CachedTemplate:
+    """启动时编译一次的页面模板，渲染结果按缓存键保存（LRU）
+
+    缓存键需要包含决定页面内容的全部信息（例如执行ID和版本号），内容变化时自然换用新键；
+    cache_key为None时每次都重新渲染。
+    """
+
+    def __init__(self, jinja_env, source, max_entries=32):
+        self.template = jinja_env.from_string(source)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._pages = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_key):
+        """返回已缓存的页面，没有时返回None"""
+        with self._lock:
+            page = self._pages.get(cache_key)
+            if page is not None:
+                self._pages.move_to_end(cache_key)
+                self.hits += 1
+            return page
+
+    def render(self, cache_key, build_context):
+        """命中缓存时直接返回页面，否则调用build_context()获取模板变量并渲染"""
+        if cache_key is not None:
+            page = self.get(cache_key)
+            if page is not None:
+                return page
+        page = self.template.render(**build_context())
+        if cache_key is not None:
+            with self._lock:
+                self.misses += 1
+                self._pages[cache_key] = page
+                while len(self._pages) > self.max_entries:
+                    self._pages.popitem(last=False)
+        return page
@@ -0,0 +1,211 @@
+"""基于任务队列的执行注册表：执行交给工作进程（worker.py）运行，Web应用转发工作进程写回的事件
+
+与ExecutionRegistry提供相同的接口，Web应用设置EXECUTION_BACKEND=queue时使用。每个在本进程登记的执行
+在内存中保留一份镜像：后台线程按顺序读取工作进程写回队列的事件，应用到镜像的状态上再发布给SSE订阅者，
+因此执行数据接口的版本号、增量和ETag与本地执行相同。其他Web进程登记的执行或重启前的执行没有镜像，
+从执行存储读取。
+"""
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+
+from execution_registry import Execution, ExecutionQueueFull
+
+logger = logging.getLogger(__name__)
+
+
+def parse_log_line(line):
+    """把 "时间 - 级别 - 内容" 形式的日志行拆分为(时间, 级别, 内容)"""
+    timestamp, level, message = line.split(" - ", 2)
+    return timestamp, level.lower(), message
+
+
+class QueuedExecutionRegistry:
+    """执行注册表：登记的执行写入任务队列，排队数和运行数按整个队列统计，max_workers为在线工作进程的槽位总数"""
+
+    # 执行不在本进程中运行，Web服务重启时不取消
+    remote = True
+
+    def __init__(self, job_queue, max_queued=20, max_retained=100, model=None, history_size=1000,
+                 buffer_size=500, firehose=None, store=None, log_capacity=1000, poll_interval=0.2,
+                 event_retention=3600):
+        self.job_queue = job_queue
+        self.max_queued = max_queued
+        self.max_retained = max_retained
+        self.model = model
+        self.history_size = history_size
+        self.buffer_size = buffer_size
+        self.log_capacity = log_capacity
+        self.firehose = firehose
+        self.store = store
+        self.poll_interval = poll_interval
+        self.event_retention = event_retention
+        self._executions = OrderedDict()
+        self._lock = threading.Lock()
+        self._relay = None
+        self._stopped = threading.Event()
+
+    # ---- 队列统计 ----
+
+    @property
+    def running_count(self):
+        return self.job_queue.counts().get("running", 0)
+
+    @property
+    def queued_count(self):
+        return self.job_queue.counts().get("queued", 0)
+
+    @property
+    def max_workers(self):
+        return sum(worker["slots"] for worker in self.job_queue.workers())
+
+    def workers(self):
+        return self.job_queue.workers()
+
+    # ---- 登记和取消 ----
+
+    def submit(self):
+        """登记一次新执行并写入任务队列；排队数已满时抛出ExecutionQueueFull"""
+        self._ensure_relay()
+        if self.queued_count >= self.max_queued:
+            raise ExecutionQueueFull(f"排队等待的执行已达上限({self.max_queued})")
+        execution_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        execution = Execution(execution_id, self.model, self.history_size, self.buffer_size,
+                              self.firehose, self.log_capacity)
+        with self._lock:
+            self._executions[execution_id] = execution
+            self._prune()
+        self._save(execution)
+        state = execution.state.current
+        self.job_queue.enqueue(execution_id, {"model": self.model, "queued_time": state.queued_time})
+        logger.info(f"已登记执行（任务队列）: {execution_id}")
+        return execution
+
+    def cancel(self, execution_id):
+        """取消执行，返回是否已取消或已发出取消；执行不存在时返回None
+
+        排队中的执行立即标记为已取消；运行中的执行由工作进程在下次续约时取消，状态随事件更新。
+        """
+        outcome = self.job_queue.cancel(execution_id)
+        if outcome is None or outcome is False:
+            return outcome
+        if outcome == "cancelled":
+            execution = self.get(execution_id)
+            if execution is not None:
+                self._mark_finished(execution, "cancelled", "已取消")
+            elif self.store is not None:
+                stored = self.store.get_execution(execution_id, log_limit=0, interaction_limit=0)
+                if stored is not None:
+                    stored.update(status="cancelled", current_task="已取消")
+                    self.store.save_execution(stored)
+        return True
+
+    def _mark_finished(self, execution, status, current_task):
+        state = execution.state.update_status(status=status, current_task=current_task)
+        execution.publish("status_update", {"current_task": current_task, "status": status, "progress": state.progress})
+        self._save(execution)
+
+    def _save(self, execution):
+        if self.store is not None:
+            self.store.save_execution(execution.state.current.header())
+
+    def _prune(self):
+        """保留的镜像数超过上限时，按登记顺序移除最早的已结束执行"""
+        overflow = len(self._executions) - self.max_retained
+        if overflow <= 0:
+            return
+        for execution_id in [eid for eid, e in self._executions.items() if e.finished][:overflow]:
+            del self._executions[execution_id]
+
+    # ---- 查询 ----
+
+    def get(self, execution_id):
+        with self._lock:
+            return self._executions.get(execution_id)
+
+    def latest(self):
+        """最近登记的执行，没有时返回None"""
+        with self._lock:
+            return next(reversed(self._executions.values()), None)
+
+    def list(self):
+        """按登记时间倒序返回所有执行"""
+        with self._lock:
+            return list(reversed(self._executions.values()))
+
+    def attach_loop(self, loop):
+        """执行在工作进程中运行，不需要事件循环"""
+
+    def shutdown(self, wait=True):
+        self._stopped.set()
+        if wait and self._relay is not None:
+            self._relay.join()
+
+    # ---- 事件转发 ----
+
+    def _ensure_relay(self):
+        # 第一次登记执行时才启动转发线程：工作进程导入Web应用模块时不会启动
+        with self._lock:
+            if self._relay is None:
+                self._relay = threading.Thread(target=self._relay_loop, name="job-event-relay", daemon=True)
+                self._relay.start()
+
+    def _apply(self, execution, event_type, data, created_at):
+        """把工作进程发布的事件应用到镜像的状态上，再发布给本进程的订阅者"""
+        state = execution.state
+        if event_type == "status_update":
+            fields = {"status": data["status"], "current_task": data.get("current_task")}
+            if data.get("progress") is not None:
+                fields["progress"] = data["progress"]
+            if data["status"] == "running" and state.current.start_time is None:
+                fields["start_time"] = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created_at))
+            state.update_status(**fields)
+        elif event_type == "agent_update":
+            if not data["tasks"]:
+                state.upsert_agent(data["name"], data["role"])
+            for task in data["tasks"]:
+                state.upsert_agent(data["name"], data["role"], task["description"], task["output"], task["task_id"])
+        elif event_type == "interaction":
+            state.add_interaction(data["from_agent"], data["to_agent"], data["content"], data["timestamp"])
+        elif event_type == "log":
+            timestamp, level, message = parse_log_line(data)
+            entry = execution.logs.append(level, message, timestamp)
+            state.mark_log(entry["seq"])
+        execution.publish(event_type, data)
+
+    def _sync_statuses(self):
+        """工作进程崩溃且尝试次数用尽、或租约过期时已请求取消的执行没有结束事件，按队列中的状态结束镜像"""
+        pending = {execution.execution_id: execution for execution in self.list() if not execution.finished}
+        for execution_id, (status, error) in self.job_queue.statuses(pending).items():
+            execution = pending[execution_id]
+            if status == "error":
+                logger.error(f"执行 {execution_id} 失败: {error}")
+                self._mark_finished(execution, "error", "系统错误")
+            elif status == "cancelled":
+                self._mark_finished(execution, "cancelled", "已取消")
+
+    def _relay_loop(self):
+        cursor = self.job_queue.last_event_id()
+        last_sync = last_purge = time.monotonic()
+        while not self._stopped.is_set():
+            try:
+                events = self.job_queue.events_after(cursor)
+                for event in events:
+                    cursor = event["id"]
+                    execution = self.get(event["job_id"])
+                    if execution is not None:
+                        self._apply(execution, event["event_type"], event["data"], event["created_at"])
+                now = time.monotonic()
+                if now - last_sync >= 5:
+                    self._sync_statuses()
+                    last_sync = now
+                if now - last_purge >= 600:
+                    self.job_queue.purge_events(self.event_retention)
+                    last_purge = now
+            except Exception as e:
+                logger.error(f"转发工作进程事件失败: {str(e)}")
+                events = None
+            if not events:
+                self._stopped.wait(self.poll_interval)
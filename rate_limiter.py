@@ -0,0 +1,185 @@
+import os
+import re
+import time
+import asyncio
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# 中日韩字符大约每个字符一个token，其余字符按4个字符一个token估算
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text):
+    """在本地粗略估算一段文本的token数"""
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+class _AsyncWaiter:
+    """协程在排队中的位置：轮到它或配额变化时由持有锁的线程通过事件循环唤醒"""
+
+    def __init__(self, loop):
+        self._loop = loop
+        self._ready = asyncio.Event()
+
+    def wake(self):
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            # 事件循环已关闭，等待的协程随之结束
+            pass
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(self._ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._ready.clear()
+
+
+class TokenBucketRateLimiter:
+    """同时限制每分钟请求数(RPM)和每分钟token数(TPM)的令牌桶，调用方按到达顺序排队
+
+    线程通过acquire、协程通过acquire_async在同一个队列中排队，共用同一份配额。
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute=0, burst=1):
+        if requests_per_minute <= 0:
+            raise ValueError("requests_per_minute必须大于0")
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        # 桶容量越小越平滑；容量为1时任意60秒窗口内的请求数不会超过配额
+        self.request_capacity = float(burst)
+        self.token_capacity = float(tokens_per_minute) / requests_per_minute * burst if tokens_per_minute else 0.0
+        self._request_balance = self.request_capacity
+        self._token_balance = self.token_capacity
+        self._updated_at = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiters = deque()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated_at
+        self._updated_at = now
+        self._request_balance = min(
+            self.request_capacity,
+            self._request_balance + elapsed * self.requests_per_minute / 60.0
+        )
+        if self.tokens_per_minute:
+            self._token_balance = min(
+                self.token_capacity,
+                self._token_balance + elapsed * self.tokens_per_minute / 60.0
+            )
+
+    def _wait_time(self, tokens):
+        """返回还需等待多少秒才能放行一个消耗tokens的请求"""
+        wait_time = 0.0
+        if self._request_balance < 1:
+            wait_time = (1 - self._request_balance) * 60.0 / self.requests_per_minute
+        if self.tokens_per_minute:
+            # 超过桶容量的大请求只需等到桶满即可放行，余额允许变为负数
+            needed = min(tokens, self.token_capacity)
+            if self._token_balance < needed:
+                wait_time = max(wait_time, (needed - self._token_balance) * 60.0 / self.tokens_per_minute)
+        return wait_time
+
+    def _take(self, tokens):
+        self._request_balance -= 1
+        if self.tokens_per_minute:
+            self._token_balance -= tokens
+
+    def _notify(self):
+        """唤醒等待的线程，以及排在队首的协程（持有self._cond时调用）"""
+        self._cond.notify_all()
+        if self._waiters and isinstance(self._waiters[0], _AsyncWaiter):
+            self._waiters[0].wake()
+
+    def _log_wait(self, started_at):
+        waited = time.monotonic() - started_at
+        if waited > 0.01:
+            logger.info(f"请求在限流队列中等待了 {waited:.2f} 秒")
+        return waited
+
+    def acquire(self, tokens=0):
+        """阻塞直到配额允许发送一个请求，返回排队等待的秒数"""
+        started_at = time.monotonic()
+        ticket = object()
+        with self._cond:
+            self._waiters.append(ticket)
+            try:
+                while True:
+                    if self._waiters[0] is ticket:
+                        self._refill()
+                        wait_time = self._wait_time(tokens)
+                        if wait_time <= 0:
+                            self._take(tokens)
+                            break
+                        self._cond.wait(wait_time)
+                    else:
+                        self._cond.wait()
+            finally:
+                self._waiters.remove(ticket)
+                self._notify()
+        return self._log_wait(started_at)
+
+    async def acquire_async(self, tokens=0):
+        """acquire的协程版本：排队时不占用线程，被取消时让出队列中的位置"""
+        started_at = time.monotonic()
+        waiter = _AsyncWaiter(asyncio.get_running_loop())
+        with self._cond:
+            self._waiters.append(waiter)
+        try:
+            while True:
+                with self._cond:
+                    wait_time = None
+                    if self._waiters[0] is waiter:
+                        self._refill()
+                        wait_time = self._wait_time(tokens)
+                        if wait_time <= 0:
+                            self._take(tokens)
+                            break
+                # 不在队首时等待前面的调用方离开队列后唤醒
+                await waiter.wait(wait_time)
+        finally:
+            with self._cond:
+                self._waiters.remove(waiter)
+                self._notify()
+        return self._log_wait(started_at)
+
+    def pause(self, seconds):
+        """接口返回429时调用：之后的请求至少等待seconds秒，再按配额逐个放行（已在等待的调用方同样顺延）"""
+        with self._cond:
+            self._refill()
+            self._request_balance = min(self._request_balance, 1 - seconds * self.requests_per_minute / 60.0)
+            self._notify()
+        logger.info(f"接口返回限流，{seconds:.1f}秒内暂停放行请求")
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """请求完成后用实际token用量修正预估值"""
+        if not self.tokens_per_minute or actual_tokens is None:
+            return
+        with self._cond:
+            self._refill()
+            self._token_balance -= actual_tokens - estimated_tokens
+            self._notify()
+
+
+_shared_limiter = None
+_shared_limiter_lock = threading.Lock()
+
+
+def get_shared_rate_limiter():
+    """获取进程内共享的限流器，所有智能体和Web执行共用同一份配额"""
+    global _shared_limiter
+    with _shared_limiter_lock:
+        if _shared_limiter is None:
+            rpm = int(os.getenv("MOONSHOT_RPM_LIMIT", "20"))
+            tpm = int(os.getenv("MOONSHOT_TPM_LIMIT", "0"))
+            _shared_limiter = TokenBucketRateLimiter(rpm, tpm)
+            logger.info(f"已启用Kimi API限流: RPM={rpm}, TPM={tpm or '不限'}")
+        return _shared_limiter
@@ -0,0 +1,47 @@
+import gzip
+import hashlib
+
+from flask import request
+
+# 小于该字节数的响应不压缩，压缩的收益抵不上CPU开销
+GZIP_MIN_SIZE = 1024
+
+
+def body_etag(body):
+    """根据响应内容计算弱ETag"""
+    return f'W/"{hashlib.sha1(body).hexdigest()[:20]}"'
+
+
+def etag_matches(if_none_match, etag):
+    """按弱比较判断If-None-Match是否命中当前ETag"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    normalize = lambda tag: tag.strip().removeprefix("W/")
+    return normalize(etag) in {normalize(tag) for tag in if_none_match.split(",")}
+
+
+def gzip_body(body, accept_encoding, min_size=GZIP_MIN_SIZE):
+    """客户端接受gzip且内容足够大时返回压缩后的内容，否则返回None"""
+    if len(body) < min_size or "gzip" not in (accept_encoding or "").lower():
+        return None
+    return gzip.compress(body, compresslevel=5)
+
+
+def enable_gzip(app, min_size=GZIP_MIN_SIZE):
+    """为Flask应用的非流式响应启用gzip压缩（SSE等流式响应不受影响）"""
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+                or "Content-Encoding" in response.headers):
+            return response
+        response.vary.add("Accept-Encoding")
+        compressed = gzip_body(response.get_data(), request.headers.get("Accept-Encoding"), min_size)
+        if compressed is not None:
+            response.set_data(compressed)
+            response.headers["Content-Encoding"] = "gzip"
+        return response
+
+    return app
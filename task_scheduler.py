@@ -0,0 +1,184 @@
+import logging
+import contextvars
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+logger = logging.getLogger(__name__)
+
+
+def add_delegation_tools(crew, task):
+    """与Process.sequential相同：允许委派的智能体执行任务时，可以把工作委派给团队中的其他智能体"""
+    from crewai.tools.agent_tools import AgentTools
+
+    if task.agent is not None and task.agent.allow_delegation:
+        task.tools += AgentTools(agents=[agent for agent in crew.agents if agent != task.agent]).tools()
+
+
+def parse_delegation(agent_tools, command):
+    """解析委派工具的输入（角色|任务|上下文），返回(智能体, 任务, 上下文)；输入有误时返回给智能体的提示文本"""
+    try:
+        role, task, context = command.split("|")
+    except ValueError:
+        return agent_tools.i18n.errors("agent_tool_missing_param")
+    if not role or not task or not context:
+        return agent_tools.i18n.errors("agent_tool_missing_param")
+    coworker = next((agent for agent in agent_tools.agents if agent.role == role), None)
+    if coworker is None:
+        return agent_tools.i18n.errors("agent_tool_unexsiting_coworker").format(
+            coworkers=", ".join(agent.role for agent in agent_tools.agents)
+        )
+    return coworker, task, context
+
+
+def execute_agent_task(agent, task, context=None):
+    """Agent.execute_task的线程安全版本：使用智能体执行器的副本，被委派的智能体正在执行自己的任务时互不干扰"""
+    from langchain.tools.render import render_text_description
+    from langchain_core.runnables.config import RunnableConfig
+
+    if context:
+        task = agent.i18n.slice("task_with_context").format(task=task, context=context)
+    tools = agent.tools
+    executor = agent.agent_executor
+    fields = {name: getattr(executor, name) for name in executor.__fields__}
+    fields["tools"] = tools
+    executor = type(executor).construct(**fields)
+    result = executor.invoke(
+        {"input": task, "tool_names": ", ".join(tool.name for tool in tools), "tools": render_text_description(tools)},
+        RunnableConfig(callbacks=[agent.tools_handler])
+    )["output"]
+    if agent.max_rpm:
+        agent._rpm_controller.stop_rpm_counter()
+    return result
+
+
+def _thread_safe_delegation(tools):
+    """把委派工具换成通过execute_agent_task执行的副本，任务自身的工具列表不变"""
+    from langchain.tools import Tool
+    from crewai.tools.agent_tools import AgentTools
+
+    def delegate(agent_tools):
+        def run(command):
+            parsed = parse_delegation(agent_tools, command)
+            return execute_agent_task(*parsed) if isinstance(parsed, tuple) else parsed
+        return run
+
+    result = []
+    for tool in tools:
+        owner = getattr(getattr(tool, "func", None), "__self__", None)
+        if isinstance(owner, AgentTools):
+            tool = Tool.from_function(func=delegate(owner), name=tool.name, description=tool.description)
+        result.append(tool)
+    return result
+
+
+class DagTaskScheduler:
+    """按任务的context依赖构建有向无环图，并发执行互不依赖的任务
+
+    执行前按crew.kickoff的方式准备智能体和任务（语言设置、委派工具），只有调度方式与Process.sequential不同。
+    """
+
+    def __init__(self, crew, max_workers=2):
+        if max_workers < 1:
+            raise ValueError("max_workers必须大于等于1")
+        self.crew = crew
+        self.tasks = list(crew.tasks)
+        self.max_workers = max_workers
+        self.dependencies = self._build_dependencies()
+        # 同一个智能体不能同时执行两个任务（Agent的执行器不是线程安全的）
+        self._agent_locks = {}
+        self._agent_locks_guard = threading.Lock()
+
+    def _build_dependencies(self):
+        """读取每个任务的context，生成 任务下标 -> 依赖任务下标集合 的映射"""
+        index_by_id = {id(task): i for i, task in enumerate(self.tasks)}
+        dependencies = {}
+        for i, task in enumerate(self.tasks):
+            context = getattr(task, "context", None)
+            if context:
+                deps = set()
+                for upstream in context:
+                    if id(upstream) not in index_by_id:
+                        if getattr(upstream, "output", None) is not None:
+                            # 列表外已有输出的上游任务（如从检查点恢复的任务）视为已完成
+                            continue
+                        raise ValueError(f"任务依赖了不在任务列表中的上游任务: {upstream.description}")
+                    deps.add(index_by_id[id(upstream)])
+            elif i > 0:
+                # 与Process.sequential保持一致：未声明context的任务接收上一个任务的输出
+                deps = {i - 1}
+            else:
+                deps = set()
+            dependencies[i] = deps
+        self._check_acyclic(dependencies)
+        return dependencies
+
+    def _check_acyclic(self, dependencies):
+        remaining = {i: set(deps) for i, deps in dependencies.items()}
+        while remaining:
+            ready = [i for i, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError("任务的context依赖存在循环，无法调度")
+            for i in ready:
+                del remaining[i]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+    def _agent_lock(self, task):
+        agent = getattr(task, "agent", None)
+        with self._agent_locks_guard:
+            return self._agent_locks.setdefault(id(agent), threading.Lock())
+
+    def _execute_task(self, index, context):
+        task = self.tasks[index]
+        role = task.agent.role if getattr(task, "agent", None) is not None else "None"
+        logger.info(f"开始执行任务 {index + 1}/{len(self.tasks)} (智能体: {role})")
+        with self._agent_lock(task):
+            # 声明了context的任务会在execute内部自行拼接上游任务的输出
+            return task.execute(context=context, tools=_thread_safe_delegation(task.tools))
+
+    def _prepare(self):
+        from crewai.utilities import I18N
+
+        for agent in self.crew.agents:
+            agent.i18n = I18N(language=self.crew.language)
+        for task in self.tasks:
+            add_delegation_tools(self.crew, task)
+
+    def run(self):
+        """执行全部任务，返回任务列表中最后一个任务的输出（与crew.kickoff()一致）"""
+        outputs = {}
+        done = set()
+        running = {}
+        pending = set(range(len(self.tasks)))
+        self._prepare()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                ready = sorted(i for i in pending if self.dependencies[i] <= done)
+                for i in ready:
+                    pending.discard(i)
+                    previous_output = outputs.get(i - 1) if i > 0 else None
+                    # 在提交时的上下文中执行，链路追踪的当前span等上下文变量随任务传入工作线程
+                    running[executor.submit(contextvars.copy_context().run, self._execute_task, i, previous_output)] = i
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    i = running.pop(future)
+                    try:
+                        outputs[i] = future.result()
+                    except Exception:
+                        # 一个任务失败后不再调度新的任务，等待已提交的任务结束后抛出
+                        for other in running:
+                            other.cancel()
+                        raise
+                    done.add(i)
+                    logger.info(f"任务 {i + 1}/{len(self.tasks)} 执行完成")
+
+        if self.crew.max_rpm:
+            self.crew._rpm_controller.stop_rpm_counter()
+        return outputs.get(len(self.tasks) - 1)
+
+
+def run_crew_in_parallel(crew, max_workers=2):
+    """以DAG并行模式执行crew中的任务"""
+    return DagTaskScheduler(crew, max_workers=max_workers).run()
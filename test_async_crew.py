@@ -0,0 +1,66 @@
+"""kickoff_async的并发执行：多个团队同时在一个事件循环中执行，请求发往本地替身服务并按低RPM限流
+
+运行方式：
+    python -m unittest test_async_crew
+"""
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+from crewai import Agent, Task, Crew, Process
+
+import rate_limiter
+from async_crew import kickoff_async
+from kimi_llm import KimiChatOpenAI
+from mock_moonshot_server import MockBehavior, create_server
+from rate_limiter import TokenBucketRateLimiter
+
+
+def create_crew(base_url, index):
+    llm = KimiChatOpenAI(model_name="moonshot-v1-8k", api_key="test", base_url=base_url)
+    # 保留CrewAI默认的记忆：每个任务结束后记忆通过同一个LLM生成对话摘要
+    analyst = Agent(role=f"分析师{index}", goal="分析需求", backstory="资深分析师", llm=llm,
+                    allow_delegation=False, memory=True)
+    writer = Agent(role=f"作者{index}", goal="撰写方案", backstory="资深作者", llm=llm,
+                   allow_delegation=False, memory=True)
+    analysis = Task(description=f"分析需求{index}", expected_output="分析结果", agent=analyst)
+    proposal = Task(description=f"撰写方案{index}", expected_output="方案", agent=writer)
+    return Crew(agents=[analyst, writer], tasks=[analysis, proposal], process=Process.sequential)
+
+
+class ConcurrentKickoffTest(unittest.TestCase):
+    def setUp(self):
+        server = create_server(MockBehavior(latency="fixed:0.01", tokens_per_second=0, seed=1), port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+        # 低RPM使请求在限流队列中排队，线程和协程同时等待配额
+        patcher = mock.patch.object(rate_limiter, "_shared_limiter", TokenBucketRateLimiter(600))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_concurrent_runs_with_memory_complete(self):
+        crews = [create_crew(self.base_url, index) for index in range(3)]
+        results = []
+
+        async def run_all():
+            results.extend(await asyncio.gather(*(kickoff_async(crew) for crew in crews)))
+
+        # 事件循环被阻塞时asyncio.wait_for的超时也不会触发，因此在线程中执行并限制等待时间
+        runner = threading.Thread(target=asyncio.run, args=(run_all(),), daemon=True)
+        runner.start()
+        runner.join(timeout=60)
+
+        self.assertFalse(runner.is_alive(), "并发执行没有在60秒内结束")
+        self.assertEqual(len(results), 3)
+        for crew, result in zip(crews, results):
+            self.assertTrue(result)
+            # 记忆仍然保存了每个任务的对话摘要
+            for agent in crew.agents:
+                self.assertTrue(agent.agent_executor.memory.buffer)
+
+
+if __name__ == "__main__":
+    unittest.main()
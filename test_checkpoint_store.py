@@ -0,0 +1,103 @@
+"""任务检查点的保存与恢复：使用crewai 0.5.0的Task/TaskOutput和按脚本返回回答的模型
+
+运行方式：
+    python -m unittest test_checkpoint_store
+"""
+import os
+import json
+import tempfile
+import unittest
+from typing import Any, List
+
+from langchain_core.language_models.llms import LLM
+from crewai import Agent, Task, Crew, Process
+from crewai.tasks.task_output import TaskOutput
+
+from checkpoint_store import TaskCheckpointer
+
+
+class ScriptedLLM(LLM):
+    """按顺序返回预设的回答，预设项为异常时抛出该异常"""
+
+    responses: List[Any]
+    calls: int = 0
+
+    @property
+    def _llm_type(self):
+        return "scripted"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        response = self.responses[self.calls]
+        self.calls += 1
+        if isinstance(response, Exception):
+            raise response
+        return f"Thought: Do I need to use a tool? No\nFinal Answer: {response}"
+
+
+def create_crew(llm):
+    # 关闭记忆，避免任务结束后额外的摘要调用
+    writer = Agent(role="写作者", goal="写大纲", backstory="资深作者", llm=llm, allow_delegation=False,
+                   memory=False)
+    editor = Agent(role="编辑", goal="润色大纲", backstory="资深编辑", llm=llm, allow_delegation=False,
+                   memory=False)
+    outline = Task(description="写一份大纲", expected_output="大纲", agent=writer)
+    review = Task(description="润色大纲", expected_output="润色后的大纲", agent=editor)
+    return Crew(agents=[writer, editor], tasks=[outline, review], process=Process.sequential)
+
+
+class TaskCheckpointerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def checkpointer(self):
+        return TaskCheckpointer("test", directory=self.directory.name)
+
+    def test_failed_run_resumes_from_saved_task_output(self):
+        failing = ScriptedLLM(responses=["大纲v1", RuntimeError("接口不可用")])
+        crew = create_crew(failing)
+        with self.assertRaises(RuntimeError):
+            self.checkpointer().kickoff(crew, list(crew.tasks))
+
+        with open(self.checkpointer().path, encoding="utf-8") as f:
+            saved = json.load(f)
+        self.assertEqual([entry["output"] for entry in saved.values()], ["大纲v1"])
+
+        # 重新运行时创建新的团队，只执行未完成的任务，上游输出从检查点恢复
+        llm = ScriptedLLM(responses=["润色后的大纲"])
+        crew = create_crew(llm)
+        tasks = list(crew.tasks)
+        result = self.checkpointer().kickoff(crew, tasks)
+
+        self.assertEqual(result, "润色后的大纲")
+        self.assertEqual(llm.calls, 1)
+        self.assertIsInstance(tasks[0].output, TaskOutput)
+        self.assertEqual(tasks[0].output.result, "大纲v1")
+        self.assertEqual(tasks[1].output.result, "润色后的大纲")
+        self.assertFalse(os.path.exists(self.checkpointer().path))
+
+    def test_restore_fills_outputs_and_chains_first_remaining_task(self):
+        crew = create_crew(ScriptedLLM(responses=[]))
+        tasks = list(crew.tasks)
+        checkpointer = self.checkpointer()
+        checkpointer.save(TaskCheckpointer.task_key(0, tasks[0]), tasks[0], "大纲v1")
+
+        remaining = checkpointer.restore(tasks)
+
+        self.assertEqual(remaining, [tasks[1]])
+        self.assertEqual(tasks[0].output, TaskOutput(description=tasks[0].description, result="大纲v1"))
+        self.assertEqual(tasks[1].context, [tasks[0]])
+
+    def test_all_tasks_restored_returns_last_output(self):
+        crew = create_crew(ScriptedLLM(responses=[]))
+        tasks = list(crew.tasks)
+        checkpointer = self.checkpointer()
+        for index, task in enumerate(tasks):
+            checkpointer.save(TaskCheckpointer.task_key(index, task), task, f"输出{index}")
+
+        self.assertEqual(checkpointer.kickoff(crew, tasks), "输出1")
+        self.assertFalse(os.path.exists(checkpointer.path))
+
+
+if __name__ == "__main__":
+    unittest.main()
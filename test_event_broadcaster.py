@@ -0,0 +1,120 @@
+"""事件广播器：每个订阅者独立的有界缓冲区、同类事件合并和按Last-Event-ID补发
+
+运行方式：
+    python -m unittest test_event_broadcaster
+"""
+import json
+import asyncio
+import unittest
+
+from event_broadcaster import EventBroadcaster
+
+RESYNC = 'data: {"type": "resync", "data": null}\n\n'
+
+
+def drain(subscription):
+    """取出缓冲区中的所有事件，返回(事件ID, 类型, 数据)列表，resync记为(None, "resync", None)"""
+    events = []
+    while True:
+        payload = subscription.get(timeout=0)
+        if payload is None:
+            return events
+        if payload == RESYNC:
+            events.append((None, "resync", None))
+            continue
+        header, body = payload.strip().split("\n")
+        document = json.loads(body[len("data: "):])
+        events.append((int(header[len("id: "):]), document["type"], document["data"]))
+
+
+class EventBroadcasterTest(unittest.TestCase):
+    def test_overflow_drops_oldest_for_that_subscriber_only(self):
+        broadcaster = EventBroadcaster(buffer_size=3)
+        slow = broadcaster.subscribe()
+        fast = broadcaster.subscribe()
+        for index in range(5):
+            broadcaster.publish("log", {"message": f"日志{index}"})
+            # fast及时消费，不受slow的缓冲区影响
+            self.assertEqual(drain(fast)[0][2]["message"], f"日志{index}")
+
+        events = drain(slow)
+        self.assertEqual(slow.dropped, 2)
+        # 丢弃过事件时先发送resync，提示客户端重新拉取完整状态
+        self.assertEqual(events[0][1], "resync")
+        self.assertEqual([data["message"] for _, _, data in events[1:]], ["日志2", "日志3", "日志4"])
+        self.assertEqual(fast.dropped, 0)
+
+    def test_full_buffer_coalesces_status_and_agent_updates(self):
+        broadcaster = EventBroadcaster(buffer_size=3)
+        subscription = broadcaster.subscribe()
+        broadcaster.publish("status_update", {"progress": 10})
+        broadcaster.publish("agent_update", {"name": "产品经理", "tasks": []})
+        broadcaster.publish("agent_update", {"name": "测试工程师", "tasks": []})
+        # 缓冲区已满：同类事件只保留最新的一条，不丢弃其他事件
+        broadcaster.publish("status_update", {"progress": 20})
+        broadcaster.publish("agent_update", {"name": "产品经理", "tasks": [{"task_id": "t1"}]})
+
+        events = drain(subscription)
+        self.assertEqual(subscription.dropped, 0)
+        self.assertEqual([(kind, data.get("name")) for _, kind, data in events],
+                         [("agent_update", "测试工程师"), ("status_update", None), ("agent_update", "产品经理")])
+        self.assertEqual(events[1][2]["progress"], 20)
+        self.assertEqual(events[2][2]["tasks"], [{"task_id": "t1"}])
+
+    def test_full_buffer_drops_oldest_when_nothing_to_coalesce(self):
+        broadcaster = EventBroadcaster(buffer_size=2)
+        subscription = broadcaster.subscribe()
+        broadcaster.publish("agent_update", {"name": "产品经理"})
+        broadcaster.publish("log", {"message": "日志"})
+        broadcaster.publish("agent_update", {"name": "测试工程师"})
+
+        events = drain(subscription)
+        self.assertEqual(subscription.dropped, 1)
+        self.assertEqual([kind for _, kind, _ in events], ["resync", "log", "agent_update"])
+
+    def test_last_event_id_replays_missed_events(self):
+        broadcaster = EventBroadcaster(history_size=10)
+        ids = [broadcaster.publish("log", {"message": f"日志{index}"}) for index in range(4)]
+
+        replayed = drain(broadcaster.subscribe(last_event_id=ids[1]))
+        self.assertEqual([event_id for event_id, _, _ in replayed], ids[2:])
+
+    def test_replay_respects_filters_and_history_limit(self):
+        broadcaster = EventBroadcaster(history_size=3)
+        broadcaster.publish("log", {"message": "已移出历史"})
+        broadcaster.publish("agent_update", {"name": "产品经理"})
+        broadcaster.publish("agent_update", {"name": "测试工程师"})
+        broadcaster.publish("interaction", {"from_agent": "产品经理", "to_agent": "测试工程师"})
+
+        replayed = drain(broadcaster.subscribe(agent="产品经理", last_event_id=0))
+        self.assertEqual([kind for _, kind, _ in replayed], ["agent_update", "interaction"])
+        replayed = drain(broadcaster.subscribe(event_types=["agent_update"], last_event_id=0))
+        self.assertEqual([data["name"] for _, _, data in replayed], ["产品经理", "测试工程师"])
+
+    def test_last_event_id_from_before_restart_replays_everything(self):
+        broadcaster = EventBroadcaster()
+        broadcaster.publish("log", {"message": "重启后的第一条"})
+
+        # 客户端的ID比服务端的最新ID还大，说明服务端已重启
+        replayed = drain(broadcaster.subscribe(last_event_id=100))
+        self.assertEqual([data["message"] for _, _, data in replayed], ["重启后的第一条"])
+
+    def test_async_subscription_is_woken_by_publish(self):
+        broadcaster = EventBroadcaster()
+
+        async def receive():
+            subscription = broadcaster.subscribe_async()
+            asyncio.get_running_loop().call_later(0.05, broadcaster.publish, "log", {"message": "异步"})
+            payload = await subscription.aget(timeout=5)
+            timeout_payload = await subscription.aget(timeout=0.05)
+            subscription.close()
+            return payload, timeout_payload
+
+        payload, timeout_payload = asyncio.run(receive())
+        self.assertIn('"message": "异步"', payload)
+        self.assertIsNone(timeout_payload)
+        self.assertEqual(broadcaster.subscriber_count, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+"""/api/execution-data的条件请求和增量响应：版本号ETag、304、since增量和历史执行的内容ETag
+
+运行方式：
+    python -m unittest test_execution_data
+"""
+import os
+import json
+import gzip
+import tempfile
+import unittest
+from unittest import mock
+
+# crewai_web_app在导入时读取配置，先让它使用临时的存储
+_directory = tempfile.TemporaryDirectory()
+os.environ.update({
+    "MOONSHOT_API_KEY": "test",
+    "EXECUTION_STORE_PATH": os.path.join(_directory.name, "executions.sqlite3"),
+    "TRACE_EXPORT_PATH": "",
+})
+
+import crewai_web_app
+from execution_registry import Execution
+from response_utils import body_etag, etag_matches, gzip_body
+
+
+def tearDownModule():
+    _directory.cleanup()
+
+
+class ResponseUtilsTest(unittest.TestCase):
+    def test_body_etag_is_weak_and_content_based(self):
+        etag = body_etag(b"{}")
+        self.assertTrue(etag.startswith('W/"') and etag.endswith('"'))
+        self.assertEqual(etag, body_etag(b"{}"))
+        self.assertNotEqual(etag, body_etag(b"[]"))
+
+    def test_etag_matches_uses_weak_comparison(self):
+        etag = 'W/"exec-3"'
+        self.assertTrue(etag_matches('W/"exec-3"', etag))
+        self.assertTrue(etag_matches('"exec-3"', etag))
+        self.assertTrue(etag_matches('"exec-1", W/"exec-3"', etag))
+        self.assertTrue(etag_matches("*", etag))
+        self.assertFalse(etag_matches('W/"exec-2"', etag))
+        self.assertFalse(etag_matches(None, etag))
+        self.assertFalse(etag_matches("*", None))
+
+    def test_gzip_body_only_for_large_accepted_bodies(self):
+        body = b"x" * 2000
+        self.assertEqual(gzip.decompress(gzip_body(body, "gzip, deflate")), body)
+        self.assertIsNone(gzip_body(body, "deflate"))
+        self.assertIsNone(gzip_body(body, None))
+        self.assertIsNone(gzip_body(b"x" * 100, "gzip"))
+
+
+class ExecutionDataResponseTest(unittest.TestCase):
+    def setUp(self):
+        self.client = crewai_web_app.app.test_client()
+        self.execution = Execution("test_execution_data", "moonshot-v1-8k")
+        patcher = mock.patch.dict(crewai_web_app.execution_registry._executions,
+                                  {self.execution.execution_id: self.execution})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.execution.state.update_status(status="running", progress=10)
+        self.execution.state.upsert_agent("产品经理", "需求分析", "编写需求文档")
+        self.execution.state.upsert_agent("测试工程师", "测试", "编写测试用例")
+
+    def get(self, headers=None, **args):
+        args.setdefault("execution_id", self.execution.execution_id)
+        return self.client.get("/api/execution-data", query_string=args, headers=headers or {})
+
+    def test_version_etag_and_not_modified(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["ETag"]
+        self.assertEqual(etag, f'W/"test_execution_data-{self.execution.version}"')
+        self.assertTrue(response.get_json()["full"])
+
+        # 版本未变化时返回304且不带内容
+        response = self.get({"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+        self.assertEqual(response.headers["ETag"], etag)
+
+        # 任何修改都会递增版本号，旧ETag不再命中
+        self.execution.state.update_status(progress=20)
+        response = self.get({"If-None-Match": etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers["ETag"], etag)
+        self.assertEqual(response.get_json()["progress"], 20)
+
+    def test_since_returns_only_changes_after_that_version(self):
+        since = self.execution.version
+        self.execution.state.upsert_agent("产品经理", "需求分析", "编写需求文档", "需求文档已完成")
+        self.execution.state.add_interaction("产品经理", "测试工程师", "请评审需求", "2026-01-01 00:00:00")
+        entry = self.execution.logs.append("info", "需求完成", "2026-01-01 00:00:01")
+        self.execution.state.mark_log(entry["seq"])
+
+        response = self.get(since=since)
+        document = response.get_json()
+        self.assertEqual(response.headers["ETag"], f'W/"test_execution_data-{document["version"]}"')
+        self.assertEqual((document["full"], document["since"], document["version"]),
+                         (False, since, self.execution.version))
+        self.assertEqual([agent["name"] for agent in document["agents"]], ["产品经理"])
+        self.assertEqual(document["agents"][0]["tasks"][0]["output"], "需求文档已完成")
+        self.assertEqual(len(document["agent_interactions"]), 1)
+        self.assertEqual(document["system_logs"], ["2026-01-01 00:00:01 - INFO - 需求完成"])
+
+        # 没有新变更时增量为空
+        document = self.get(since=self.execution.version).get_json()
+        self.assertEqual((document["agents"], document["agent_interactions"], document["system_logs"]), ([], [], []))
+
+    def test_since_falls_back_to_full_document(self):
+        # since超过当前版本（例如服务端重启后）时返回完整数据
+        document = self.get(since=self.execution.version + 5).get_json()
+        self.assertTrue(document["full"])
+        self.assertEqual(len(document["agents"]), 2)
+
+    def test_since_falls_back_when_journal_was_evicted(self):
+        execution = Execution("test_execution_data_journal", "moonshot-v1-8k", journal_size=2)
+        for progress in range(5):
+            execution.state.update_status(progress=progress)
+        with mock.patch.dict(crewai_web_app.execution_registry._executions, {execution.execution_id: execution}):
+            document = self.get(execution_id=execution.execution_id, since=1).get_json()
+        self.assertTrue(document["full"])
+        self.assertEqual(document["version"], 5)
+
+
+class StoredExecutionDataTest(unittest.TestCase):
+    def setUp(self):
+        self.client = crewai_web_app.app.test_client()
+        store = crewai_web_app.execution_store
+        store.save_execution({"execution_id": "test_execution_data_stored", "model": "moonshot-v1-8k",
+                              "status": "completed", "progress": 100})
+        store.save_agent("test_execution_data_stored", {"name": "产品经理", "role": "需求分析", "tasks": [
+            {"task_id": "requirements", "description": "编写需求文档", "output": "需求文档已完成"}
+        ]})
+        self.assertTrue(store.flush(timeout=5))
+
+    def test_stored_execution_uses_content_etag(self):
+        url = "/api/execution-data?execution_id=test_execution_data_stored"
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["ETag"], body_etag(response.data))
+        self.assertEqual(json.loads(response.data)["status"], "completed")
+
+        response = self.client.get(url, headers={"If-None-Match": response.headers["ETag"]})
+        self.assertEqual(response.status_code, 304)
+
+    def test_stored_snapshot_page_renders_task_ids(self):
+        # 页面按data-task-id定位任务，合并之后推送的task_delta事件
+        response = self.client.get("/snapshot?execution_id=test_execution_data_stored")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('data-task-id="requirements"', response.get_data(as_text=True))
+        document = self.client.get("/api/execution-data?execution_id=test_execution_data_stored").get_json()
+        self.assertEqual(document["agents"][0]["tasks"][0]["task_id"], "requirements")
+
+    def test_unknown_execution_is_not_found(self):
+        response = self.client.get("/api/execution-data?execution_id=不存在")
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn("ETag", response.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
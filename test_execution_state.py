@@ -0,0 +1,135 @@
+"""执行状态的写时复制快照：版本号递增、旧快照不受后续修改影响、变更记录与增量
+
+运行方式：
+    python -m unittest test_execution_state
+"""
+import threading
+import unittest
+
+from execution_registry import Execution
+from execution_state import VersionedExecutionState, make_task_id
+
+
+class VersionedExecutionStateTest(unittest.TestCase):
+    def setUp(self):
+        self.state = VersionedExecutionState("exec", "moonshot-v1-8k", "2026-01-01 00:00:00")
+
+    def test_every_change_increments_version(self):
+        self.assertEqual(self.state.current.version, 0)
+        self.state.update_status(status="running")
+        self.state.upsert_agent("产品经理", "需求分析")
+        self.state.add_interaction("产品经理", "测试工程师", "请评审", "2026-01-01 00:00:01")
+        self.state.mark_log(1)
+
+        current = self.state.current
+        self.assertEqual(current.version, 4)
+        self.assertEqual((current.status, current.interaction_count, current.log_last_seq), ("running", 1, 1))
+
+    def test_old_snapshots_are_not_modified(self):
+        self.state.upsert_agent("产品经理", "需求分析", "编写需求文档")
+        before = self.state.current
+        before_dict = before.to_dict()
+
+        self.state.upsert_agent("产品经理", "需求分析", "编写需求文档", "需求文档已完成")
+        self.state.upsert_agent("测试工程师", "测试", "编写测试用例")
+        self.state.add_interaction("产品经理", "测试工程师", "请评审", "2026-01-01 00:00:01")
+        self.state.update_status(progress=50)
+
+        # 交互列表在快照之间共享，旧快照只读取自己登记时的条数
+        self.assertEqual(before.to_dict(), before_dict)
+        self.assertEqual(before_dict["agents"][0]["tasks"][0]["output"], "正在处理...")
+        self.assertEqual(len(self.state.current.to_dict()["agent_interactions"]), 1)
+
+    def test_tasks_are_keyed_by_task_id(self):
+        self.state.upsert_agent("产品经理", "需求分析", "编写需求文档")
+        self.state.upsert_agent("产品经理", "需求分析", "编写需求文档", "第一版")
+        self.state.upsert_agent("产品经理", "需求分析", "编写需求文档", task_id="review")
+
+        current = self.state.current
+        task_id = make_task_id("编写需求文档")
+        self.assertEqual(list(current.agent("产品经理").tasks), [task_id, "review"])
+        self.assertEqual(current.task(task_id)[0], "产品经理")
+        self.assertEqual(current.task(task_id)[1].output, "第一版")
+        self.assertIsNone(current.task("不存在"))
+        # 不带输出的更新保留已有输出
+        self.state.upsert_agent("产品经理", "需求分析", "编写需求文档")
+        self.assertEqual(self.state.current.task(task_id)[1].output, "第一版")
+
+    def test_changes_since_lists_changes_after_version(self):
+        self.state.update_status(status="running")
+        since = self.state.current.version
+        self.state.upsert_agent("产品经理", "需求分析")
+        self.state.add_interaction("产品经理", "测试工程师", "请评审", "2026-01-01 00:00:01")
+        self.state.mark_log(7)
+
+        state, changes = self.state.changes_since(since)
+        self.assertIs(state, self.state.current)
+        self.assertEqual(changes, [("agent", "产品经理"), ("interaction", 0), ("log", 7)])
+        self.assertEqual(self.state.changes_since(state.version)[1], [])
+
+    def test_changes_since_is_none_for_unknown_or_evicted_versions(self):
+        state = VersionedExecutionState("exec", "moonshot-v1-8k", journal_size=3)
+        for progress in range(6):
+            state.update_status(progress=progress)
+
+        # 变更记录只保留版本4..6：since为3时仍能算出增量，更早的版本无法计算
+        self.assertEqual(len(state.changes_since(3)[1]), 3)
+        self.assertIsNone(state.changes_since(2)[1])
+        # 比当前版本还新的since来自其他执行或重启前的服务端
+        self.assertIsNone(state.changes_since(7)[1])
+
+    def test_concurrent_writers_get_distinct_versions(self):
+        def write(index):
+            for count in range(100):
+                self.state.upsert_agent(f"智能体{index}", "角色", f"任务{index}-{count}")
+
+        threads = [threading.Thread(target=write, args=(index,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        current = self.state.current
+        self.assertEqual(current.version, 400)
+        self.assertEqual(len(current.task_index), 400)
+        self.assertEqual(len(self.state.changes_since(0)[1]), 400)
+
+
+class ExecutionDeltaTest(unittest.TestCase):
+    def setUp(self):
+        self.execution = Execution("exec", "moonshot-v1-8k", log_capacity=3)
+
+    def add_log(self, message):
+        entry = self.execution.logs.append("info", message, "2026-01-01 00:00:00")
+        self.execution.state.mark_log(entry["seq"])
+
+    def test_delta_contains_changed_agents_interactions_and_logs(self):
+        self.execution.state.upsert_agent("产品经理", "需求分析", "编写需求文档")
+        self.execution.state.upsert_agent("测试工程师", "测试", "编写测试用例")
+        self.add_log("日志1")
+        since = self.execution.version
+        self.execution.state.upsert_agent("测试工程师", "测试", "编写测试用例", "用例已完成")
+        self.execution.state.add_interaction("测试工程师", "产品经理", "用例已完成", "2026-01-01 00:00:01")
+        self.add_log("日志2")
+
+        delta = self.execution.delta(since)
+        self.assertEqual((delta["full"], delta["since"], delta["version"]), (False, since, self.execution.version))
+        self.assertEqual([agent["name"] for agent in delta["agents"]], ["测试工程师"])
+        self.assertEqual([i["content"] for i in delta["agent_interactions"]], ["用例已完成"])
+        self.assertEqual(delta["system_logs"], ["2026-01-01 00:00:00 - INFO - 日志2"])
+        self.assertEqual(delta["log_last_seq"], 2)
+
+    def test_delta_is_none_when_logs_left_the_buffer(self):
+        since = self.execution.version
+        for index in range(5):
+            self.add_log(f"日志{index}")
+
+        # 缓冲区只保留3条，since之后的前两条日志已被淘汰，调用方应返回完整数据
+        self.assertIsNone(self.execution.delta(since))
+        snapshot = self.execution.snapshot()
+        self.assertTrue(snapshot["full"])
+        self.assertEqual((snapshot["log_first_seq"], snapshot["log_last_seq"]), (3, 5))
+
+
+if __name__ == "__main__":
+    unittest.main()
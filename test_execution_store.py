@@ -0,0 +1,108 @@
+"""执行记录存储：任务输出按任务ID保存，历史执行与内存中的执行数据结构一致，旧版本数据库迁移，结果页面的任务ID
+
+运行方式：
+    python -m unittest test_execution_store
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+from unittest import mock
+
+import crewai_ui
+from execution_state import VersionedExecutionState, make_task_id
+from execution_store import ExecutionStore
+
+
+class ExecutionStoreTaskOutputsTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "executions.sqlite3")
+
+    def save(self, store, state):
+        store.save_execution(state.current.header())
+        for agent in state.current.agents.values():
+            store.save_agent("exec", agent.to_dict())
+        self.assertTrue(store.flush(timeout=5))
+
+    def test_tasks_are_stored_by_task_id(self):
+        store = ExecutionStore(self.path)
+        state = VersionedExecutionState("exec", "moonshot-v1-8k")
+        state.upsert_agent("产品经理", "需求分析", "编写需求文档", task_id="requirements")
+        # 同一个智能体的两个任务描述相同，只能靠任务ID区分
+        state.upsert_agent("测试工程师", "测试", "评审", task_id="review-1")
+        state.upsert_agent("测试工程师", "测试", "评审", task_id="review-2")
+        self.save(store, state)
+        state.upsert_agent("测试工程师", "测试", "评审", "第一轮评审通过", task_id="review-1")
+        self.save(store, state)
+
+        data = store.get_execution("exec")
+        self.assertEqual(data["agents"], [agent.to_dict() for agent in state.current.agents.values()])
+        tasks = data["agents"][1]["tasks"]
+        self.assertEqual([(task["task_id"], task["output"]) for task in tasks],
+                         [("review-1", "第一轮评审通过"), ("review-2", "正在处理...")])
+
+    def test_legacy_task_outputs_are_migrated(self):
+        with sqlite3.connect(self.path) as conn:
+            conn.execute(
+                "CREATE TABLE task_outputs (execution_id TEXT NOT NULL, agent TEXT NOT NULL, description TEXT NOT NULL,"
+                " output TEXT, PRIMARY KEY (execution_id, agent, description))"
+            )
+            conn.execute("CREATE INDEX idx_task_outputs_agent ON task_outputs (agent)")
+            conn.executemany("INSERT INTO task_outputs VALUES (?, ?, ?, ?)", [
+                ("exec", "产品经理", "编写需求文档", "需求文档"),
+                ("exec", "产品经理", "规划路线图", "路线图"),
+            ])
+        conn.close()
+
+        store = ExecutionStore(self.path)
+        store.save_execution({"execution_id": "exec", "model": "moonshot-v1-8k", "status": "completed", "progress": 100})
+        store.save_agent("exec", {"name": "产品经理", "role": "需求分析", "tasks": []})
+        self.assertTrue(store.flush(timeout=5))
+
+        tasks = store.get_execution("exec")["agents"][0]["tasks"]
+        self.assertEqual(tasks, [
+            {"task_id": make_task_id("编写需求文档"), "description": "编写需求文档", "output": "需求文档"},
+            {"task_id": make_task_id("规划路线图"), "description": "规划路线图", "output": "路线图"},
+        ])
+        # 再次打开时不重复迁移
+        ExecutionStore(self.path)
+        conn = sqlite3.connect(self.path)
+        self.addCleanup(conn.close)
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+        self.assertIn("idx_task_outputs_agent", tables)
+        self.assertNotIn("task_outputs_legacy", tables)
+
+
+class ResultPageTaskIdTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = ExecutionStore(os.path.join(directory.name, "executions.sqlite3"))
+        patcher = mock.patch.object(crewai_ui, "get_shared_execution_store", return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = crewai_ui.app.test_client()
+
+    def test_stored_execution_page_renders_task_ids(self):
+        state = VersionedExecutionState("stored", "moonshot-v1-8k")
+        state.upsert_agent("产品经理", "需求分析", "编写需求文档", "需求文档已完成", task_id="requirements")
+        self.store.save_execution(dict(state.current.header(), status="completed", progress=100))
+        self.store.save_agent("stored", state.current.agent("产品经理").to_dict())
+        self.assertTrue(self.store.flush(timeout=5))
+
+        page = self.client.get("/?execution_id=stored").get_data(as_text=True)
+        self.assertIn('data-task-id="requirements"', page)
+        self.assertNotIn('data-task-id=""', page)
+
+    def test_demo_data_has_task_ids(self):
+        task = crewai_ui.execution_data["agents"][0]["tasks"][0]
+        self.assertEqual(task["task_id"], make_task_id(task["description"]))
+        page = self.client.get("/").get_data(as_text=True)
+        self.assertIn(f'data-task-id="{task["task_id"]}"', page)
+        self.assertNotIn('data-task-id=""', page)
+
+
+if __name__ == "__main__":
+    unittest.main()
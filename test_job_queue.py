@@ -0,0 +1,147 @@
+"""执行任务队列：租用顺序、并发租用互斥、租约过期后重新租用、放回队列与取消
+
+运行方式：
+    python -m unittest test_job_queue
+"""
+import os
+import time
+import tempfile
+import threading
+import unittest
+
+from job_queue import JobQueue
+
+
+class JobQueueTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "jobs.sqlite3")
+        self.queue = JobQueue(self.path, max_attempts=2)
+
+    def enqueue(self, *job_ids):
+        for job_id in job_ids:
+            self.queue.enqueue(job_id, {"job": job_id})
+            # created_at相同时按job_id排序，间隔一点让登记顺序明确
+            time.sleep(0.002)
+
+    def test_lease_returns_oldest_queued_job(self):
+        self.enqueue("b", "a", "c")
+
+        job = self.queue.lease("worker-1", 30)
+        self.assertEqual((job.job_id, job.attempt, job.max_attempts, job.payload), ("b", 1, 2, {"job": "b"}))
+        self.assertEqual(self.queue.lease("worker-1", 30).job_id, "a")
+        self.assertEqual(self.queue.lease("worker-2", 30).job_id, "c")
+        self.assertIsNone(self.queue.lease("worker-2", 30))
+
+        record = self.queue.get("b")
+        self.assertEqual((record["status"], record["lease_owner"], record["attempts"]), ("running", "worker-1", 1))
+
+    def test_concurrent_workers_never_share_a_job(self):
+        job_ids = [f"job-{index:02d}" for index in range(40)]
+        for job_id in job_ids:
+            self.queue.enqueue(job_id)
+        leased = []
+        leased_lock = threading.Lock()
+
+        def work(worker_id):
+            # 每个线程各自持有连接，与多个工作进程共用数据库文件的情况相同
+            queue = JobQueue(self.path)
+            while (job := queue.lease(worker_id, 30)) is not None:
+                finished = queue.finish(job, "completed", {"worker": worker_id})
+                with leased_lock:
+                    leased.append((job.job_id, finished))
+
+        threads = [threading.Thread(target=work, args=(f"worker-{index}",)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=30)
+
+        self.assertEqual(sorted(leased), [(job_id, True) for job_id in job_ids])
+        self.assertEqual(self.queue.counts(), {"completed": 40})
+
+    def test_expired_lease_is_taken_over_and_old_lease_is_lost(self):
+        self.enqueue("a")
+        crashed = self.queue.lease("worker-1", 0.05)
+        self.assertEqual(self.queue.heartbeat(crashed, 0.05), "ok")
+        self.assertIsNone(self.queue.lease("worker-2", 30))
+        time.sleep(0.1)
+
+        # 工作进程失联后租约过期，任务由其他工作进程接手
+        job = self.queue.lease("worker-2", 30)
+        self.assertEqual((job.job_id, job.attempt), ("a", 2))
+        # 旧租约的续约、写回和放弃都不再生效
+        self.assertEqual(self.queue.heartbeat(crashed, 30), "lost")
+        self.assertFalse(self.queue.finish(crashed, "completed", {"from": "worker-1"}))
+        self.assertIsNone(self.queue.release(crashed, "失联"))
+
+        self.assertTrue(self.queue.finish(job, "completed", {"from": "worker-2"}))
+        record = self.queue.get("a")
+        self.assertEqual((record["status"], record["result"], record["lease_owner"]),
+                         ("completed", {"from": "worker-2"}, None))
+
+    def test_expired_lease_after_max_attempts_becomes_error(self):
+        self.enqueue("a")
+        self.queue.lease("worker-1", 0.01)
+        time.sleep(0.05)
+        self.queue.lease("worker-2", 0.01)
+        time.sleep(0.05)
+
+        self.assertIsNone(self.queue.lease("worker-3", 30))
+        record = self.queue.get("a")
+        self.assertEqual((record["status"], record["attempts"]), ("error", 2))
+        self.assertEqual(record["error"], "租约过期，已达到最大尝试次数")
+
+    def test_release_requeues_until_attempts_run_out(self):
+        self.enqueue("a")
+        job = self.queue.lease("worker-1", 30)
+        self.assertEqual(self.queue.release(job, "临时错误"), "queued")
+        self.assertEqual(self.queue.get("a")["lease_expires"], None)
+
+        job = self.queue.lease("worker-2", 30)
+        self.assertEqual(job.attempt, 2)
+        self.assertEqual(self.queue.release(job, "仍然失败"), "error")
+        record = self.queue.get("a")
+        self.assertEqual((record["status"], record["error"]), ("error", "仍然失败"))
+
+    def test_release_without_counting_attempt(self):
+        self.enqueue("a")
+        job = self.queue.lease("worker-1", 30)
+        # 工作进程正常退出时放回队列，不消耗尝试次数
+        self.assertEqual(self.queue.release(job, count_attempt=False), "queued")
+        self.assertEqual(self.queue.get("a")["attempts"], 0)
+        self.assertEqual(self.queue.lease("worker-2", 30).attempt, 1)
+
+    def test_cancel_queued_and_running_jobs(self):
+        self.enqueue("queued", "running")
+        self.assertEqual(self.queue.cancel("queued"), "cancelled")
+        job = self.queue.lease("worker-1", 0.05)
+        self.assertEqual(job.job_id, "running")
+
+        # 运行中的任务由持有租约的工作进程在续约时得知取消
+        self.assertEqual(self.queue.cancel("running"), "requested")
+        self.assertEqual(self.queue.heartbeat(job, 0.05), "cancel")
+        self.assertIsNone(self.queue.cancel("不存在"))
+        self.assertFalse(self.queue.cancel("queued"))
+
+        # 工作进程没有处理取消就失联时，租约过期后直接标记为cancelled，不再重新租用
+        time.sleep(0.1)
+        self.assertIsNone(self.queue.lease("worker-2", 30))
+        self.assertEqual(self.queue.statuses(["queued", "running"]),
+                         {"queued": ("cancelled", None), "running": ("cancelled", None)})
+
+    def test_events_are_read_in_order(self):
+        self.enqueue("a")
+        for index in range(5):
+            self.queue.append_event("a", "log", {"index": index})
+        self.assertTrue(self.queue.flush(timeout=5))
+
+        events = self.queue.events_after(0)
+        self.assertEqual([event["data"]["index"] for event in events], list(range(5)))
+        self.assertEqual([event["data"]["index"] for event in self.queue.events_after(events[2]["id"])], [3, 4])
+        self.assertEqual(self.queue.last_event_id(), events[-1]["id"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -8,6 +8,8 @@ load_dotenv()
 # 获取Kimi模型配置
 moonshot_api_key = os.getenv("MOONSHOT_API_KEY")
 moonshot_model_name = os.getenv("MOONSHOT_MODEL_NAME", "moonshot-v1-8k")
+# OpenAI兼容接口地址，可指向本地的mock_moonshot_server.py做离线运行和压测
+moonshot_base_url = os.getenv("MOONSHOT_BASE_URL", "https://api.moonshot.cn/v1")
 
 # 打印配置信息（不打印API密钥）
 print(f"测试Kimi模型连接: {moonshot_model_name}")
@@ -15,13 +17,13 @@ print(f"API密钥已加载: {'是' if moonshot_api_key else '否'}")
 
 # 设置环境变量
 os.environ["OPENAI_API_KEY"] = moonshot_api_key
-os.environ["OPENAI_BASE_URL"] = "https://api.moonshot.cn/v1"
+os.environ["OPENAI_BASE_URL"] = moonshot_base_url
 
 # 初始化ChatOpenAI实例
 chat = ChatOpenAI(
     model_name=moonshot_model_name,
     api_key=moonshot_api_key,
-    base_url="https://api.moonshot.cn/v1",
+    base_url=moonshot_base_url,
     temperature=0.7
 )
 
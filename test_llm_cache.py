@@ -0,0 +1,110 @@
+"""LLM响应缓存：按总字节数的LRU淘汰、过期和总字节数的维护
+
+运行方式：
+    python -m unittest test_llm_cache
+"""
+import os
+import time
+import tempfile
+import unittest
+
+from langchain_core.outputs import Generation
+
+from llm_cache import SQLiteLRUCache
+
+
+def entry_size(cache, prompt):
+    key = cache._make_key(prompt, "llm")
+    return cache._connect().execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()[0]
+
+
+class SQLiteLRUCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, "cache.sqlite3")
+
+    def create_cache(self, **options):
+        cache = SQLiteLRUCache(self.path, **options)
+        self.addCleanup(cache._connect().close)
+        return cache
+
+    def put(self, cache, prompt, text="x" * 100):
+        cache.update(prompt, "llm", [Generation(text=text)])
+
+    def assert_total_consistent(self, cache):
+        actual = cache._connect().execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        self.assertEqual(cache.stats()["bytes"], actual)
+
+    def test_evicts_least_recently_used_entries_over_limit(self):
+        probe = self.create_cache()
+        self.put(probe, "探测")
+        size = entry_size(probe, "探测")
+        probe.clear()
+        # 上限只能容纳三条
+        cache = self.create_cache(max_bytes=size * 3)
+        for prompt in ("a", "b", "c"):
+            self.put(cache, prompt)
+            time.sleep(0.01)
+        # 读取a使它成为最近使用的条目，再写入d时淘汰最久未使用的b
+        self.assertIsNotNone(cache.lookup("a", "llm"))
+        time.sleep(0.01)
+        self.put(cache, "d")
+
+        self.assertIsNone(cache.lookup("b", "llm"))
+        for prompt in ("a", "c", "d"):
+            self.assertEqual(cache.lookup(prompt, "llm")[0].text, "x" * 100)
+        self.assertEqual(cache.stats()["entries"], 3)
+        self.assert_total_consistent(cache)
+
+    def test_replacing_an_entry_updates_total(self):
+        cache = self.create_cache()
+        self.put(cache, "a", "短")
+        self.put(cache, "a", "长" * 500)
+
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assertEqual(cache.stats()["bytes"], entry_size(cache, "a"))
+        self.assert_total_consistent(cache)
+
+    def test_expired_entries_are_removed_from_total(self):
+        cache = self.create_cache(ttl_seconds=1)
+        self.put(cache, "a")
+        self.put(cache, "b")
+        past = time.time() - 10
+        with cache._connect() as conn:
+            conn.execute("UPDATE llm_cache SET created_at = ?", (past,))
+
+        # 读取时删除过期的a，写入c时清理其余过期条目
+        self.assertIsNone(cache.lookup("a", "llm"))
+        self.assert_total_consistent(cache)
+        self.put(cache, "c")
+
+        self.assertEqual(cache.stats()["entries"], 1)
+        self.assert_total_consistent(cache)
+
+    def test_total_is_seeded_from_existing_file_and_reset_by_clear(self):
+        cache = self.create_cache()
+        self.put(cache, "a")
+        self.put(cache, "b")
+        # 旧版本的缓存文件没有总字节数记录
+        with cache._connect() as conn:
+            conn.execute("DROP TABLE llm_cache_meta")
+
+        reopened = SQLiteLRUCache(self.path)
+        self.assert_total_consistent(reopened)
+        self.assertGreater(reopened.stats()["bytes"], 0)
+        reopened.clear()
+        self.assertEqual(reopened.stats(), {"hits": 0, "misses": 0, "hit_rate": 0.0, "entries": 0, "bytes": 0})
+
+    def test_hit_and_miss_counts(self):
+        cache = self.create_cache()
+        self.put(cache, "a")
+        cache.lookup("a", "llm")
+        cache.lookup("不存在", "llm")
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_rate"]), (1, 1, 0.5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""KimiChatOpenAI自带的调用指标：按角色和路由选定的模型记录，请求发往本地替身服务
+
+运行方式：
+    python -m unittest test_llm_metrics
+"""
+import asyncio
+import threading
+import unittest
+from unittest import mock
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import rate_limiter
+from kimi_llm import KimiChatOpenAI
+from llm_metrics import LLMMetricsHandler
+from metrics import LLM_REQUESTS, LLM_TOKENS
+from mock_moonshot_server import MockBehavior, create_server
+from model_router import ModelRouter
+from rate_limiter import TokenBucketRateLimiter
+
+
+class LLMMetricsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = create_server(MockBehavior(latency="fixed:0.01", tokens_per_second=0, seed=1), port=0)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}/v1"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        patcher = mock.patch.object(rate_limiter, "_shared_limiter", TokenBucketRateLimiter(100000))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_llm(self, role, **options):
+        # 该角色从32k模型起步，指标应记录为32k而不是默认的8k
+        router = ModelRouter(role_overrides={role: "moonshot-v1-32k"})
+        return KimiChatOpenAI(model_name="moonshot-v1-8k", api_key="test", base_url=self.base_url,
+                              model_router=router, agent_role=role, **options)
+
+    def test_call_is_recorded_with_routed_model(self):
+        llm = self.create_llm("指标测试-同步")
+        llm.invoke("你好")
+
+        labels = {"role": "指标测试-同步", "model": "moonshot-v1-32k"}
+        self.assertEqual(LLM_REQUESTS.value(outcome="success", **labels), 1)
+        self.assertGreater(LLM_TOKENS.value(direction="out", **labels), 0)
+        self.assertEqual(LLM_REQUESTS.value(outcome="success", role="指标测试-同步", model="moonshot-v1-8k"), 0)
+
+    def test_streaming_async_call_is_recorded_with_routed_model(self):
+        llm = self.create_llm("指标测试-流式", streaming=True)
+        asyncio.run(llm.ainvoke("你好"))
+
+        labels = {"role": "指标测试-流式", "model": "moonshot-v1-32k"}
+        self.assertEqual(LLM_REQUESTS.value(outcome="success", **labels), 1)
+        self.assertGreater(LLM_TOKENS.value(direction="out", **labels), 0)
+
+    def test_llm_output_reports_routed_model(self):
+        # 回调收到的每次调用结果（bench_crews据此统计各模型的调用次数）记录路由选定的模型
+        class OutputRecorder(BaseCallbackHandler):
+            outputs = []
+
+            def on_llm_end(self, response, **kwargs):
+                self.outputs.append(response.llm_output)
+
+        for streaming in (False, True):
+            recorder = OutputRecorder()
+            llm = self.create_llm("指标测试-模型名", streaming=streaming, callbacks=[recorder])
+            llm.invoke("你好")
+            self.assertEqual(recorder.outputs[-1]["model_name"], "moonshot-v1-32k")
+
+    def test_handler_added_once_next_to_given_callbacks(self):
+        other = BaseCallbackHandler()
+        llm = self.create_llm("指标测试-回调", callbacks=[other])
+        self.assertIs(llm.callbacks[0], other)
+        self.assertEqual(sum(isinstance(c, LLMMetricsHandler) for c in llm.callbacks), 1)
+
+        handler = LLMMetricsHandler("指标测试-回调", "moonshot-v1-8k")
+        llm = self.create_llm("指标测试-回调", callbacks=[handler])
+        self.assertEqual(llm.callbacks, [handler])
+
+
+if __name__ == "__main__":
+    unittest.main()
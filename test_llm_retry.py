@@ -0,0 +1,180 @@
+"""LLM调用级重试：错误分类、Retry-After解析、单次调用的尝试次数和每次执行共用的重试预算
+
+运行方式：
+    python -m unittest test_llm_retry
+"""
+import time
+import random
+import threading
+import unittest
+from email.utils import formatdate
+from unittest import mock
+
+import httpx
+import openai
+
+import llm_retry
+import rate_limiter
+from kimi_llm import KimiChatOpenAI
+from llm_retry import RetryPolicy, classify_error, retry_after_seconds, retry_budget
+from mock_moonshot_server import MockBehavior, create_server
+from model_router import ContextWindowExceeded
+from rate_limiter import TokenBucketRateLimiter
+
+_REQUEST = httpx.Request("POST", "http://127.0.0.1/v1/chat/completions")
+
+
+def api_error(status, message="错误", error_type=None, headers=None):
+    """构造openai客户端抛出的状态码异常"""
+    response = httpx.Response(status, headers=headers or {}, request=_REQUEST)
+    body = {"message": message, "type": error_type}
+    error_class = {429: openai.RateLimitError, 401: openai.AuthenticationError,
+                   400: openai.BadRequestError}.get(status, openai.InternalServerError)
+    return error_class(message, response=response, body=body)
+
+
+class ClassifyErrorTest(unittest.TestCase):
+    def test_status_codes_and_error_types(self):
+        cases = [
+            (api_error(429, error_type="rate_limit_reached_error"), "rate_limit"),
+            (api_error(429, error_type="engine_overloaded_error"), "overloaded"),
+            (api_error(429, error_type="exceeded_current_quota_error"), "quota"),
+            (api_error(401), "auth"),
+            (api_error(400), "bad_request"),
+            (api_error(502), "server"),
+            (openai.APITimeoutError(_REQUEST), "timeout"),
+            (openai.APIConnectionError(request=_REQUEST), "connection"),
+            (ContextWindowExceeded(140000, "moonshot-v1-128k", 131072), "context_window"),
+            (RuntimeError("其他错误"), "unknown"),
+        ]
+        for error, kind in cases:
+            with self.subTest(kind=kind):
+                self.assertEqual(classify_error(error), kind)
+
+
+class RetryAfterTest(unittest.TestCase):
+    def test_headers(self):
+        self.assertEqual(retry_after_seconds(api_error(429, headers={"retry-after-ms": "1500"})), 1.5)
+        self.assertEqual(retry_after_seconds(api_error(429, headers={"Retry-After": "3"})), 3.0)
+        self.assertEqual(retry_after_seconds(api_error(429, headers={"Retry-After": "-3"})), 0.0)
+        # HTTP日期格式
+        date = formatdate(time.time() + 30, usegmt=True)
+        self.assertAlmostEqual(retry_after_seconds(api_error(429, headers={"Retry-After": date})), 30, delta=2)
+
+    def test_moonshot_error_message(self):
+        message = "rate limit reached for requests, please try again after 2 seconds"
+        self.assertEqual(retry_after_seconds(api_error(429, message)), 2.0)
+        self.assertEqual(retry_after_seconds(api_error(429, "please try again in 500ms")), 0.5)
+        # 只给出RPM上限时按一个请求的间隔估算
+        self.assertEqual(retry_after_seconds(api_error(429, "max RPM: 3, please slow down")), 20.0)
+
+    def test_header_takes_precedence_and_missing_values(self):
+        error = api_error(429, "please try again after 9 seconds", headers={"Retry-After": "1"})
+        self.assertEqual(retry_after_seconds(error), 1.0)
+        self.assertIsNone(retry_after_seconds(api_error(429, headers={"Retry-After": "soon"})))
+        self.assertIsNone(retry_after_seconds(RuntimeError("没有响应")))
+
+
+class CallRetryTest(unittest.TestCase):
+    def setUp(self):
+        self.policy = RetryPolicy(max_attempts=3, base_delay=1.0, max_delay=60.0, rng=random.Random(1))
+
+    def test_backoff_stays_within_bounds(self):
+        retry = self.policy.start()
+        previous = self.policy.base_delay
+        for _ in range(2):
+            delay = retry.next_delay(api_error(503))
+            self.assertGreaterEqual(delay, self.policy.base_delay)
+            self.assertLessEqual(delay, previous * 3)
+            previous = delay
+        # 已尝试3次
+        self.assertIsNone(retry.next_delay(api_error(503)))
+
+    def test_waits_at_least_retry_after(self):
+        retry = self.policy.start()
+        delay = retry.next_delay(api_error(429, headers={"Retry-After": "10"}))
+        self.assertGreaterEqual(delay, 10)
+        self.assertLessEqual(delay, 10 + self.policy.base_delay)
+
+    def test_does_not_retry_permanent_errors_or_too_long_waits(self):
+        self.assertIsNone(self.policy.start().next_delay(api_error(401)))
+        self.assertIsNone(self.policy.start().next_delay(api_error(429, error_type="insufficient_quota")))
+        self.assertIsNone(self.policy.start().next_delay(ContextWindowExceeded(140000, "moonshot-v1-128k", 131072)))
+        self.assertIsNone(self.policy.start().next_delay(api_error(429, headers={"Retry-After": "120"})))
+
+    def test_rate_limit_pauses_shared_limiter(self):
+        limiter = mock.Mock()
+        self.policy.start(limiter).next_delay(api_error(429, headers={"Retry-After": "2"}))
+        limiter.pause.assert_called_once_with(2.0)
+        # 5xx不影响其他调用
+        limiter.reset_mock()
+        self.policy.start(limiter).next_delay(api_error(503))
+        limiter.pause.assert_not_called()
+
+    def test_budget_is_shared_by_calls_in_scope(self):
+        with retry_budget(3) as budget:
+            first, second = self.policy.start(), self.policy.start()
+            self.assertIsNotNone(first.next_delay(api_error(503)))
+            self.assertIsNotNone(second.next_delay(api_error(503)))
+            self.assertIsNotNone(first.next_delay(api_error(503)))
+            # 预算用尽后即使second还有尝试次数也不再重试
+            self.assertIsNone(second.next_delay(api_error(503)))
+            self.assertEqual(budget.used, 3)
+        # 范围外的调用不受预算限制
+        self.assertIsNotNone(self.policy.start().next_delay(api_error(503)))
+
+
+class KimiRetryTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Retry-After为0秒，重试不需要等待接口要求的时间
+        cls.behavior = MockBehavior(latency="fixed:0.01", tokens_per_second=0, retry_after=0, seed=1)
+        cls.server = create_server(cls.behavior, port=0)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}/v1"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        patchers = [
+            mock.patch.object(rate_limiter, "_shared_limiter", TokenBucketRateLimiter(100000)),
+            mock.patch.object(llm_retry, "_shared_policy", RetryPolicy(max_attempts=4, base_delay=0.01, max_delay=1)),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(setattr, self.behavior, "fault_429", 0.0)
+
+    def create_llm(self, **options):
+        return KimiChatOpenAI(model_name="moonshot-v1-8k", api_key="test", base_url=self.base_url, **options)
+
+    def test_each_call_retries_until_attempts_run_out(self):
+        self.behavior.fault_429 = 1.0
+        requests = self.behavior.stats["requests"]
+        with self.assertRaises(openai.RateLimitError):
+            self.create_llm().invoke("你好")
+        self.assertEqual(self.behavior.stats["requests"] - requests, 4)
+
+    def test_budget_limits_retries_across_calls(self):
+        self.behavior.fault_429 = 1.0
+        requests = self.behavior.stats["requests"]
+        with retry_budget(2):
+            for streaming in (False, True):
+                with self.assertRaises(openai.RateLimitError):
+                    self.create_llm(streaming=streaming).invoke("你好")
+        # 第一次调用用掉全部2次重试，第二次调用失败后不再重试
+        self.assertEqual(self.behavior.stats["requests"] - requests, 4)
+
+    def test_call_succeeds_after_rate_limited_attempts(self):
+        self.behavior.fault_429 = 1.0
+        timer = threading.Timer(0.05, setattr, (self.behavior, "fault_429", 0.0))
+        timer.start()
+        self.addCleanup(timer.cancel)
+        self.assertTrue(self.create_llm().invoke("你好").content)
+
+
+if __name__ == "__main__":
+    unittest.main()
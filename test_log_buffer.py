@@ -0,0 +1,107 @@
+"""带序号的系统日志：内存环形缓冲区和持久化存储按序号分页读取
+
+运行方式：
+    python -m unittest test_log_buffer
+"""
+import os
+import tempfile
+import unittest
+
+from execution_store import ExecutionStore
+from log_buffer import LogRingBuffer, format_log_entry
+
+
+def fill(buffer, count, store=None):
+    for index in range(count):
+        level = "error" if index % 3 == 2 else "info"
+        entry = buffer.append(level, f"日志{index + 1}", f"2026-01-01 00:00:{index:02d}")
+        if store is not None:
+            store.append_log("exec", entry)
+
+
+def seqs(entries):
+    return [entry["seq"] for entry in entries]
+
+
+class LogRingBufferTest(unittest.TestCase):
+    def test_sequence_numbers_are_contiguous_across_eviction(self):
+        buffer = LogRingBuffer(capacity=5)
+        self.assertEqual((buffer.first_seq, buffer.last_seq), (1, 0))
+        fill(buffer, 8)
+
+        self.assertEqual(len(buffer), 5)
+        self.assertEqual((buffer.first_seq, buffer.last_seq), (4, 8))
+        self.assertEqual(seqs(buffer.tail(3)), [6, 7, 8])
+        self.assertEqual(buffer.tail(0), [])
+
+    def test_pages_forward_and_backward(self):
+        buffer = LogRingBuffer(capacity=20)
+        fill(buffer, 10)
+
+        self.assertEqual(seqs(buffer.query(limit=3)), [8, 9, 10])
+        self.assertEqual(seqs(buffer.query(before_seq=8, limit=3)), [5, 6, 7])
+        self.assertEqual(seqs(buffer.query(after_seq=2, limit=3)), [3, 4, 5])
+        self.assertEqual(seqs(buffer.query(after_seq=8, limit=3)), [9, 10])
+        self.assertEqual(seqs(buffer.query(after_seq=10)), [])
+        self.assertEqual(seqs(buffer.query(limit=None)), list(range(1, 11)))
+        self.assertEqual(seqs(buffer.query(level="error", limit=2)), [6, 9])
+
+    def test_returns_none_when_range_was_evicted(self):
+        buffer = LogRingBuffer(capacity=5)
+        fill(buffer, 8)
+
+        # 缓冲区中只有4..8，调用方应改为查询持久化存储
+        self.assertIsNone(buffer.query(after_seq=1, limit=3))
+        self.assertIsNone(buffer.query(before_seq=5, limit=3))
+        self.assertIsNone(buffer.query(limit=None))
+        self.assertEqual(seqs(buffer.query(after_seq=3, limit=3)), [4, 5, 6])
+        self.assertEqual(seqs(buffer.query(before_seq=8, limit=3)), [5, 6, 7])
+
+    def test_format_log_entry(self):
+        entry = LogRingBuffer().append("error", "出错了", "2026-01-01 00:00:00")
+        self.assertEqual(format_log_entry(entry), "2026-01-01 00:00:00 - ERROR - 出错了")
+
+    def test_capacity_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            LogRingBuffer(capacity=0)
+
+
+class ExecutionStoreLogsTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.store = ExecutionStore(os.path.join(directory.name, "executions.sqlite3"))
+        self.buffer = LogRingBuffer(capacity=100)
+        fill(self.buffer, 10, self.store)
+        self.assertTrue(self.store.flush(timeout=5))
+
+    def test_store_pages_like_ring_buffer(self):
+        queries = [
+            {"limit": 3},
+            {"before_seq": 8, "limit": 3},
+            {"after_seq": 2, "limit": 3},
+            {"after_seq": 8, "limit": 3},
+            {"limit": None},
+            {"level": "error", "limit": 2},
+            {"after_seq": 3, "before_seq": 7, "limit": None},
+        ]
+        for query in queries:
+            with self.subTest(**query):
+                self.assertEqual(self.store.get_logs("exec", **query), self.buffer.query(**query))
+
+    def test_store_filters_by_time_range(self):
+        logs = self.store.get_logs("exec", since="2026-01-01 00:00:03", until="2026-01-01 00:00:05", limit=None)
+        self.assertEqual(seqs(logs), [4, 5, 6])
+
+    def test_execution_reports_log_seq_range(self):
+        self.store.save_execution({"execution_id": "exec", "model": "moonshot-v1-8k", "status": "running", "progress": 0})
+        self.assertTrue(self.store.flush(timeout=5))
+
+        data = self.store.get_execution("exec", log_limit=4)
+        self.assertEqual(data["system_logs"][0], "2026-01-01 00:00:06 - INFO - 日志7")
+        self.assertEqual(len(data["system_logs"]), 4)
+        self.assertEqual((data["log_first_seq"], data["log_last_seq"]), (7, 10))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,123 @@
+"""按上下文大小选择模型：窗口选择、角色起步模型、关闭路由、自定义模型和超出窗口时的本地拒绝
+
+运行方式：
+    python -m unittest test_model_router
+"""
+import threading
+import unittest
+from unittest import mock
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import rate_limiter
+from kimi_llm import KimiChatOpenAI
+from metrics import LLM_PREFLIGHT_REJECTIONS, LLM_ROUTED_REQUESTS
+from mock_moonshot_server import MockBehavior, create_server
+from model_router import ContextWindowExceeded, ModelRouter, parse_overrides
+from rate_limiter import TokenBucketRateLimiter
+
+
+class ModelRouterTest(unittest.TestCase):
+    def test_picks_smallest_window_that_fits(self):
+        router = ModelRouter()
+        # 需要的token数 = 提示词 * 1.1 + 输出预留1024
+        self.assertEqual(router.required_tokens(6000), 7624)
+        self.assertEqual(router.route(6000), "moonshot-v1-8k")
+        self.assertEqual(router.route(7000), "moonshot-v1-32k")
+        self.assertEqual(router.route(100000), "moonshot-v1-128k")
+        # max_tokens代替默认的输出预留
+        self.assertEqual(router.route(6000, max_tokens=2000), "moonshot-v1-32k")
+
+    def test_role_override_sets_the_smallest_model(self):
+        router = ModelRouter(role_overrides={"AI研究员": "moonshot-v1-32k"})
+        self.assertEqual(router.route(100, role="AI研究员"), "moonshot-v1-32k")
+        self.assertEqual(router.route(100000, role="AI研究员"), "moonshot-v1-128k")
+        self.assertEqual(router.route(100, role="技术作家"), "moonshot-v1-8k")
+
+    def test_unknown_override_model_is_rejected(self):
+        with self.assertRaises(ValueError):
+            ModelRouter(role_overrides={"AI研究员": "moonshot-v1-1m"})
+
+    def test_raises_when_no_model_fits(self):
+        router = ModelRouter()
+        rejected = LLM_PREFLIGHT_REJECTIONS.value(role="路由测试-超出")
+        with self.assertRaises(ContextWindowExceeded) as context:
+            router.route(120000, role="路由测试-超出")
+
+        error = context.exception
+        self.assertIsInstance(error, ValueError)
+        self.assertEqual((error.model, error.window, error.required_tokens), ("moonshot-v1-128k", 131072, 133024))
+        self.assertEqual(LLM_PREFLIGHT_REJECTIONS.value(role="路由测试-超出"), rejected + 1)
+
+    def test_disabled_router_keeps_default_model_and_still_checks_window(self):
+        router = ModelRouter(enabled=False)
+        self.assertEqual(router.route(100, default_model="moonshot-v1-32k"), "moonshot-v1-32k")
+        with self.assertRaises(ContextWindowExceeded) as context:
+            router.route(7000, default_model="moonshot-v1-8k")
+        self.assertEqual(context.exception.model, "moonshot-v1-8k")
+
+    def test_custom_model_is_not_routed(self):
+        router = ModelRouter()
+        self.assertEqual(router.route(1000000, default_model="my-local-model"), "my-local-model")
+
+    def test_limited_model_list(self):
+        router = ModelRouter(windows={"moonshot-v1-32k": 32768, "moonshot-v1-128k": 131072})
+        self.assertEqual(router.route(100), "moonshot-v1-32k")
+        # 默认模型不在参与路由的模型中，但仍是已知模型
+        self.assertEqual(router.route(100, default_model="moonshot-v1-8k"), "moonshot-v1-32k")
+
+    def test_routed_requests_are_counted_per_role_and_model(self):
+        router = ModelRouter()
+        labels = {"role": "路由测试-计数", "model": "moonshot-v1-32k"}
+        before = LLM_ROUTED_REQUESTS.value(**labels)
+        router.route(7000, role="路由测试-计数")
+        self.assertEqual(LLM_ROUTED_REQUESTS.value(**labels), before + 1)
+
+    def test_parse_overrides(self):
+        self.assertEqual(parse_overrides(" AI研究员 = moonshot-v1-32k ,manager=moonshot-v1-128k,无效"),
+                         {"AI研究员": "moonshot-v1-32k", "manager": "moonshot-v1-128k"})
+        self.assertEqual(parse_overrides(None), {})
+
+
+class KimiRoutingTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.behavior = MockBehavior(latency="fixed:0.01", tokens_per_second=0, seed=1)
+        cls.server = create_server(cls.behavior, port=0)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}/v1"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        patcher = mock.patch.object(rate_limiter, "_shared_limiter", TokenBucketRateLimiter(100000))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_llm(self, **options):
+        return KimiChatOpenAI(model_name="moonshot-v1-8k", api_key="test", base_url=self.base_url,
+                              model_router=ModelRouter(), agent_role="路由测试-请求", **options)
+
+    def test_large_prompt_is_sent_to_larger_model(self):
+        class OutputRecorder(BaseCallbackHandler):
+            outputs = []
+
+            def on_llm_end(self, response, **kwargs):
+                self.outputs.append(response.llm_output)
+
+        recorder = OutputRecorder()
+        self.create_llm(callbacks=[recorder]).invoke("字" * 7000)
+        self.assertEqual(recorder.outputs[-1]["model_name"], "moonshot-v1-32k")
+
+    def test_oversized_prompt_is_rejected_without_a_request(self):
+        requests = self.behavior.stats["requests"]
+        with self.assertRaises(ContextWindowExceeded):
+            self.create_llm().invoke("字" * 120000)
+        self.assertEqual(self.behavior.stats["requests"], requests)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,134 @@
+"""共享限流器：线程和协程按到达顺序排队，429后暂停放行
+
+运行方式：
+    python -m unittest test_rate_limiter
+"""
+import time
+import asyncio
+import threading
+import unittest
+
+from rate_limiter import TokenBucketRateLimiter
+
+
+class TokenBucketRateLimiterTest(unittest.TestCase):
+    def setUp(self):
+        # 每0.1秒放行一个请求
+        self.limiter = TokenBucketRateLimiter(600)
+        self.order = []
+        self.order_lock = threading.Lock()
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.loop_thread.start()
+        self.addCleanup(self.close_loop)
+
+    def close_loop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.loop_thread.join(timeout=5)
+        self.loop.close()
+
+    def record(self, name):
+        with self.order_lock:
+            self.order.append(name)
+
+    def wait_queued(self, count):
+        # 等到前一个调用方进入队列，保证到达顺序确定
+        deadline = time.monotonic() + 5
+        while len(self.limiter._waiters) < count:
+            self.assertLess(time.monotonic(), deadline, "调用方没有进入限流队列")
+            time.sleep(0.001)
+
+    def enqueue_thread(self, name):
+        def run():
+            self.limiter.acquire()
+            self.record(name)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return thread
+
+    def enqueue_coroutine(self, name):
+        async def run():
+            await self.limiter.acquire_async()
+            self.record(name)
+
+        return asyncio.run_coroutine_threadsafe(run(), self.loop)
+
+    def wait_all(self, waiters):
+        for waiter in waiters:
+            if isinstance(waiter, threading.Thread):
+                waiter.join(timeout=5)
+                self.assertFalse(waiter.is_alive())
+            else:
+                waiter.result(timeout=5)
+
+    def test_threads_acquire_in_arrival_order(self):
+        self.limiter.acquire()
+        waiters = []
+        for index in range(5):
+            waiters.append(self.enqueue_thread(f"线程{index}"))
+            self.wait_queued(index + 1)
+        self.wait_all(waiters)
+
+        self.assertEqual(self.order, [f"线程{index}" for index in range(5)])
+
+    def test_mixed_thread_and_async_waiters_share_one_queue(self):
+        self.limiter.acquire()
+        names = ["线程0", "协程1", "线程2", "协程3", "协程4", "线程5"]
+        waiters = []
+        for index, name in enumerate(names):
+            enqueue = self.enqueue_thread if name.startswith("线程") else self.enqueue_coroutine
+            waiters.append(enqueue(name))
+            self.wait_queued(index + 1)
+        started = time.monotonic()
+        self.wait_all(waiters)
+
+        self.assertEqual(self.order, names)
+        # 六个请求共用每0.1秒一个的配额
+        self.assertGreaterEqual(time.monotonic() - started, 0.45)
+
+    def test_cancelled_coroutine_gives_up_its_place(self):
+        self.limiter.acquire()
+        first = self.enqueue_coroutine("协程0")
+        self.wait_queued(1)
+        cancelled = self.enqueue_coroutine("已取消")
+        self.wait_queued(2)
+        last = self.enqueue_thread("线程2")
+        self.wait_queued(3)
+        cancelled.cancel()
+        self.wait_all([first, last])
+
+        self.assertEqual(self.order, ["协程0", "线程2"])
+        self.assertEqual(len(self.limiter._waiters), 0)
+
+    def test_pause_delays_following_requests(self):
+        limiter = TokenBucketRateLimiter(6000)
+        limiter.acquire()
+        limiter.pause(0.3)
+
+        self.assertGreaterEqual(limiter.acquire(), 0.28)
+        # 暂停结束后恢复按配额放行（每0.01秒一个）
+        self.assertLess(limiter.acquire(), 0.05)
+
+    def test_pause_also_delays_queued_waiters(self):
+        self.limiter.acquire()
+        waiter = self.enqueue_coroutine("协程0")
+        self.wait_queued(1)
+        started = time.monotonic()
+        self.limiter.pause(0.4)
+        self.wait_all([waiter])
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.38)
+
+    def test_token_limit_waits_for_refill(self):
+        # 请求数几乎不受限；token每0.1秒补充10个，超过桶容量的请求先放行，余额变为负数，下一个请求等到补足
+        limiter = TokenBucketRateLimiter(60000, tokens_per_minute=6000)
+        limiter.acquire(10)
+        started = time.monotonic()
+        limiter.acquire(10)
+
+        self.assertGreaterEqual(time.monotonic() - started, 0.09)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+"""Web应用的团队执行：真实的kickoff_async通过流式接口调用本地替身服务，输出按间隔推送为task_delta事件
+
+运行方式：
+    python -m unittest test_web_crew
+"""
+import os
+import time
+import asyncio
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from mock_moonshot_server import MockBehavior, create_server
+
+# crewai_web_app在导入时读取配置，先让它使用临时的存储和本地替身服务
+_directory = tempfile.TemporaryDirectory()
+_server = create_server(MockBehavior(latency="fixed:0.01", tokens_per_second=400, seed=1), port=0)
+threading.Thread(target=_server.serve_forever, daemon=True).start()
+os.environ.update({
+    "MOONSHOT_API_KEY": "test",
+    "MOONSHOT_BASE_URL": f"http://127.0.0.1:{_server.server_address[1]}/v1",
+    "EXECUTION_STORE_PATH": os.path.join(_directory.name, "executions.sqlite3"),
+    "TRACE_EXPORT_PATH": "",
+    "TASK_DELTA_INTERVAL_MS": "100",
+    "CREW_SIMULATE": "false",
+})
+
+import rate_limiter
+import crewai_web_app
+from execution_registry import Execution
+from metrics import CONTEXT_TOKENS_SAVED, CONTEXT_COMPRESSIONS
+from tracing import trace_id_for
+from rate_limiter import TokenBucketRateLimiter
+
+
+def tearDownModule():
+    _server.shutdown()
+    _server.server_close()
+    _directory.cleanup()
+
+
+class EventRecorder:
+    """记录执行发布的事件及发布时间"""
+
+    def __init__(self):
+        self.events = []
+
+    def publish(self, event_type, data):
+        self.events.append((time.monotonic(), event_type, data))
+
+    def of_type(self, event_type):
+        return [(at, data) for at, kind, data in self.events if kind == event_type]
+
+
+class WebCrewStreamingTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(rate_limiter, "_shared_limiter", TokenBucketRateLimiter(100000))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def run_execution(self, execution_id):
+        recorder = EventRecorder()
+        execution = Execution(execution_id, crewai_web_app.moonshot_model_name, firehose=recorder)
+        asyncio.run(crewai_web_app.run_multi_agent_system(execution))
+        self.assertEqual(execution.status, "completed")
+        return execution, recorder
+
+    def test_streamed_deltas_are_throttled_and_reconciled_by_final_update(self):
+        execution, recorder = self.run_execution("test_web_crew_stream")
+
+        deltas = recorder.of_type("task_delta")
+        updates = recorder.of_type("agent_update")
+        tasks = list(dict.fromkeys((data["agent"], data["task_id"]) for _, data in deltas))
+        self.assertEqual(len(tasks), 4)
+        expected = {}
+
+        for agent, task_id in tasks:
+            published = [(at, data) for at, data in deltas if data["task_id"] == task_id]
+            # 替身服务逐个token输出：每次调用的第一批立即发布，之后距上次发布至少100毫秒才再发布，
+            # 调用结束时发布剩余的token
+            calls = [index for index, (_, data) in enumerate(published) if data["reset"]]
+            self.assertTrue(calls)
+            for start, end in zip(calls, calls[1:] + [len(published)]):
+                times = [at for at, _ in published[start:end - 1]]
+                for earlier, later in zip(times, times[1:]):
+                    self.assertGreaterEqual(later - earlier, 0.09)
+            last_call = published[calls[-1]:]
+            streamed = "".join(data["delta"] for _, data in last_call)
+            # 约100个token在0.25秒内输出，合并为少数几条事件
+            self.assertGreaterEqual(len(last_call), 2)
+            self.assertLess(len(last_call), 10)
+            self.assertIn("Final Answer:", streamed)
+
+            # 任务结束后agent_update给出完整输出，晚于该任务的最后一个task_delta
+            final_at, final = [
+                (at, data) for at, data in updates
+                if data["name"] == agent and any(task["task_id"] == task_id and task["output"] != "正在处理..."
+                                                 for task in data["tasks"])
+            ][-1]
+            output = next(task["output"] for task in final["tasks"] if task["task_id"] == task_id)
+            self.assertGreater(final_at, published[-1][0])
+            self.assertEqual(output, streamed.split("Final Answer:", 1)[1].strip())
+
+            expected[task_id] = output
+
+        # 执行状态（首页快照和持久化记录的来源）中是完整输出
+        snapshot_tasks = {
+            task.task_id: task.output
+            for agent in execution.state.current.agents.values() for task in agent.tasks.values()
+        }
+        self.assertEqual(snapshot_tasks, expected)
+
+    def test_execution_trace_nests_tasks_agents_and_llm_calls(self):
+        execution, _ = self.run_execution("test_web_crew_trace")
+
+        spans = crewai_web_app.tracer.get_trace(trace_id_for(execution.execution_id))
+        by_id = {span.span_id: span for span in spans}
+
+        def parent(span):
+            return by_id[span.parent_id].name if span.parent_id else None
+
+        # 瀑布图：execution -> crew.kickoff -> 每个任务 -> 智能体执行 -> LLM调用 -> HTTP请求
+        self.assertEqual([span.name for span in spans if span.parent_id is None], ["execution"])
+        self.assertEqual([parent(span) for span in spans if span.name == "crew.kickoff"], ["execution"])
+        tasks = [span for span in spans if span.name == "task"]
+        self.assertEqual([span.attributes["agent"] for span in tasks],
+                         ["产品经理", "资深开发工程师", "UI/UX设计师", "测试工程师"])
+        self.assertEqual({parent(span) for span in tasks}, {"crew.kickoff"})
+        executions = [span for span in spans if span.name == "agent.execute"]
+        self.assertEqual([by_id[span.parent_id] for span in executions], tasks)
+        llm_calls = [span for span in spans if span.name == "llm.call"]
+        self.assertTrue(llm_calls)
+        self.assertTrue(all(parent(span) in ("agent.execute", "task") for span in llm_calls))
+        self.assertTrue(all(span.attributes["llm.model"] == "moonshot-v1-8k" for span in llm_calls))
+        requests = [span for span in spans if span.name == "http.request"]
+        self.assertEqual(len(requests), len(llm_calls))
+        self.assertEqual({parent(span) for span in requests}, {"llm.call"})
+        # 执行结束时所有span都已结束
+        self.assertTrue(all(span.end_ns is not None and span.status == "ok" for span in spans))
+
+    def test_context_budget_compresses_upstream_outputs_without_streaming_summaries(self):
+        saved_before = CONTEXT_TOKENS_SAVED.value(role="测试工程师")
+        summaries_before = CONTEXT_COMPRESSIONS.value(method="summary")
+        # 预算小于上游输出，引用上游任务的三个任务都要压缩
+        with mock.patch.dict(os.environ, {"CONTEXT_BUDGET_TOKENS": "60", "CONTEXT_COMPRESSION": "summary"}):
+            execution, recorder = self.run_execution("test_web_crew_budget")
+
+        self.assertGreater(CONTEXT_TOKENS_SAVED.value(role="测试工程师"), saved_before)
+        self.assertGreater(CONTEXT_COMPRESSIONS.value(method="summary"), summaries_before)
+        # 摘要调用记录在任务span下（在智能体执行之前），不属于智能体的推理步骤
+        spans = crewai_web_app.tracer.get_trace(trace_id_for(execution.execution_id))
+        by_id = {span.span_id: span for span in spans}
+        summaries = [span for span in spans
+                     if span.name == "llm.call" and by_id[span.parent_id].name == "task"]
+        self.assertTrue(summaries)
+        # 摘要的输出不推送到任务卡片：每个任务只有智能体自己的一次调用开始推送
+        resets = [data["agent"] for _, data in recorder.of_type("task_delta") if data["reset"]]
+        self.assertEqual(resets, ["产品经理", "资深开发工程师", "UI/UX设计师", "测试工程师"])
+
+
+if __name__ == "__main__":
+    unittest.main()
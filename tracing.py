@@ -0,0 +1,245 @@
+"""轻量的链路追踪：嵌套的span记录耗时和属性，结束后写入OTLP JSON文件，并按trace保留在内存中供控制台展示
+
+span之间的父子关系通过contextvars传递：在某个span内开始的span自动成为它的子span。
+导出文件每行是一个OTLP/JSON的ExportTraceServiceRequest，可以直接交给OpenTelemetry Collector的
+otlpjsonfile接收器或其他兼容工具读取。
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+import contextlib
+from collections import OrderedDict
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+_current_span = ContextVar("current_span", default=None)
+
+
+def trace_id_for(key):
+    """由业务ID（例如execution_id）得到固定的trace ID，重启后仍能按执行ID找到对应的trace"""
+    return hashlib.sha256(str(key).encode("utf-8")).hexdigest()[:32]
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "status", "_token")
+
+    def __init__(self, trace_id, parent_id, name, attributes):
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.attributes = dict(attributes)
+        self.status = None
+        self._token = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    @property
+    def duration_ms(self):
+        end_ns = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time_ns": self.start_ns,
+            "end_time_ns": self.end_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status or ("running" if self.end_ns is None else "ok"),
+            "attributes": self.attributes
+        }
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": 2, "message": self.attributes.get("error", "")} if self.status == "error" else {"code": 1}
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class OtlpJsonFileExporter:
+    """把结束的span追加写入OTLP/JSON文件，每行一个请求"""
+
+    def __init__(self, path, service_name="crewai-multi-agent"):
+        self.path = path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    def export(self, span):
+        line = json.dumps({"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": [span.to_otlp()]}]
+        }]}, ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+class Tracer:
+    """创建span并在结束时交给导出器；最近max_traces个trace的span保留在内存中（包括未结束的）"""
+
+    def __init__(self, exporters=(), max_traces=50, enabled=True):
+        self.exporters = list(exporters)
+        self.max_traces = max_traces
+        self.enabled = enabled
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def current_span(self):
+        return _current_span.get()
+
+    def start_span(self, name, trace_id=None, parent=None, **attributes):
+        """开始一个span但不设为当前span；未指定parent时以当前span为父，没有当前span时开始新的trace"""
+        if not self.enabled:
+            return None
+        parent = parent or _current_span.get()
+        if trace_id is None:
+            trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        parent_id = parent.span_id if parent is not None and parent.trace_id == trace_id else None
+        span = Span(trace_id, parent_id, name, attributes)
+        with self._lock:
+            spans = self._traces.get(trace_id)
+            if spans is None:
+                spans = self._traces[trace_id] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            spans.append(span)
+        return span
+
+    def end_span(self, span, error=None):
+        if span is None or span.end_ns is not None:
+            return
+        span.end_ns = time.time_ns()
+        if error is not None:
+            span.status = "error"
+            span.attributes["error"] = f"{type(error).__name__}: {error}" if isinstance(error, BaseException) else str(error)
+        else:
+            span.status = "ok"
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.warning(f"导出span失败: {str(e)}")
+
+    def activate(self, span):
+        """把span设为当前span；返回的令牌交给deactivate恢复"""
+        if span is not None:
+            span._token = _current_span.set(span)
+        return span
+
+    def deactivate(self, span):
+        if span is None or span._token is None:
+            return
+        try:
+            _current_span.reset(span._token)
+        except ValueError:
+            # 在其他上下文中结束（例如回调线程），当前上下文不受影响
+            pass
+        span._token = None
+
+    @contextlib.contextmanager
+    def use_span(self, span):
+        """在with块内把已开始的span设为当前span，不改变它的激活状态，也不结束它"""
+        token = _current_span.set(span) if span is not None else None
+        try:
+            yield span
+        finally:
+            if token is not None:
+                try:
+                    _current_span.reset(token)
+                except ValueError:
+                    pass
+
+    @contextlib.contextmanager
+    def span(self, name, trace_id=None, **attributes):
+        """在with块内开始一个span并设为当前span，块内抛出的异常会记录到span上"""
+        span = self.activate(self.start_span(name, trace_id=trace_id, **attributes))
+        try:
+            yield span
+        except BaseException as e:
+            self.deactivate(span)
+            self.end_span(span, error=e)
+            raise
+        self.deactivate(span)
+        self.end_span(span)
+
+    def get_trace(self, trace_id):
+        """返回内存中该trace的所有span，按开始时间排序；不存在时返回None"""
+        with self._lock:
+            spans = self._traces.get(trace_id)
+            spans = list(spans) if spans is not None else None
+        if spans is None:
+            return None
+        return sorted(spans, key=lambda span: span.start_ns)
+
+
+_shared_tracer = None
+_shared_tracer_lock = threading.Lock()
+
+
+def get_shared_tracer():
+    """获取进程内共享的Tracer，按环境变量配置（TRACE_ENABLED、TRACE_EXPORT_PATH、TRACE_MAX_TRACES）"""
+    global _shared_tracer
+    with _shared_tracer_lock:
+        if _shared_tracer is None:
+            enabled = os.getenv("TRACE_ENABLED", "true").lower() == "true"
+            export_path = os.getenv("TRACE_EXPORT_PATH", ".traces.jsonl")
+            exporters = [OtlpJsonFileExporter(export_path)] if enabled and export_path else []
+            _shared_tracer = Tracer(exporters, int(os.getenv("TRACE_MAX_TRACES", "50")), enabled)
+            if enabled:
+                logger.info(f"已启用链路追踪，导出文件: {export_path or '无'}")
+        return _shared_tracer
+
+
+def http_request_hook(request):
+    """httpx请求钩子：在当前span（通常是LLM调用）下记录一次HTTP请求，并累计重试次数"""
+    tracer = get_shared_tracer()
+    parent = tracer.current_span()
+    if parent is None:
+        return
+    attempt = parent.attributes.get("http.attempts", 0) + 1
+    parent.set_attribute("http.attempts", attempt)
+    parent.set_attribute("retries", attempt - 1)
+    request.extensions["trace_span"] = tracer.start_span(
+        "http.request", parent=parent, **{"http.method": request.method, "http.url": str(request.url), "http.attempt": attempt}
+    )
+
+
+def http_response_hook(response):
+    """httpx响应钩子：收到响应头时结束HTTP请求的span（流式响应的正文传输计入LLM调用的span）"""
+    span = response.request.extensions.get("trace_span")
+    if span is None:
+        return
+    span.set_attribute("http.status_code", response.status_code)
+    retry_after = response.headers.get("retry-after")
+    if retry_after:
+        span.set_attribute("http.retry_after", retry_after)
+    get_shared_tracer().end_span(span, error=f"HTTP {response.status_code}" if response.status_code >= 400 else None)
@@ -0,0 +1,248 @@
+"""执行工作进程：从任务队列（job_queue.py）租用执行并运行，状态写入执行存储，事件写回队列
+
+Web应用设置EXECUTION_BACKEND=queue后只登记执行，由一个或多个主机上的工作进程运行。每个进程在自己的
+事件循环中同时运行最多--slots个执行，多个进程（--processes）不受单个进程GIL的限制；吞吐量随工作进程
+数增加，直到API的速率限制成为瓶颈（每个进程各自按MOONSHOT_RPM_LIMIT/MOONSHOT_TPM_LIMIT限流，
+多个进程共用同一个API密钥时需按进程数分摊配额）。
+
+运行期间每隔可见性超时的三分之一续约一次；续约时发现已请求取消则取消执行，发现租约已被其他工作进程
+接手则放弃执行。收到Ctrl+C或SIGTERM时取消进行中的执行并放回队列（不计入尝试次数）。
+
+运行方式（JOB_QUEUE_PATH、EXECUTION_STORE_PATH需与Web应用指向同一组数据库文件）：
+    python worker.py --processes 4 --slots 2
+    python worker.py --target crewai_web_app:run_multi_agent_system --visibility-timeout 120
+"""
+import os
+import sys
+import time
+import uuid
+import signal
+import socket
+import asyncio
+import logging
+import argparse
+import importlib
+import multiprocessing
+
+from execution_registry import Execution
+from execution_store import get_shared_execution_store
+from job_queue import get_shared_job_queue
+
+logger = logging.getLogger(__name__)
+
+
+class JobEventSink:
+    """执行的汇总事件流：把发布的事件写入任务队列，由Web应用转发给SSE订阅者"""
+
+    def __init__(self, job_queue, job_id):
+        self.job_queue = job_queue
+        self.job_id = job_id
+
+    def publish(self, event_type, data):
+        self.job_queue.append_event(self.job_id, event_type, data)
+
+
+def load_target(spec):
+    """按 模块:函数 加载执行函数"""
+    module_name, _, function_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), function_name or "run_multi_agent_system")
+
+
+class Worker:
+    """单个工作进程：租用任务、续约并运行执行"""
+
+    def __init__(self, job_queue, store, target, worker_id=None, slots=2, visibility_timeout=60,
+                 poll_interval=1.0, log_capacity=1000):
+        if slots < 1:
+            raise ValueError("slots必须大于等于1")
+        self.job_queue = job_queue
+        self.store = store
+        self.target = target
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:4]}"
+        self.slots = slots
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.log_capacity = log_capacity
+        # 任务ID -> (Job, Execution, asyncio任务)
+        self._running = {}
+        # 任务ID -> 取消原因（cancel、lost、shutdown）
+        self._cancel_reasons = {}
+        self._stopping = None
+
+    def stop(self):
+        """停止租用新任务，取消进行中的执行并放回队列"""
+        if self._stopping is not None:
+            self._stopping.set()
+
+    def _publish_status(self, execution, **fields):
+        state = execution.state.update_status(**fields)
+        execution.publish("status_update", {
+            "current_task": state.current_task, "status": state.status, "progress": state.progress
+        })
+        self.store.save_execution(state.header())
+
+    async def _run_job(self, job, execution):
+        payload = job.payload
+        self._publish_status(
+            execution, status="running", queued_time=payload.get("queued_time"),
+            start_time=time.strftime("%Y-%m-%d %H:%M:%S")
+        )
+        if job.attempt > 1:
+            logger.info(f"执行 {job.job_id} 第{job.attempt}次尝试")
+        try:
+            if asyncio.iscoroutinefunction(self.target):
+                await self.target(execution)
+            else:
+                await asyncio.to_thread(self.target, execution)
+        except asyncio.CancelledError:
+            reason = self._cancel_reasons.pop(job.job_id, "shutdown")
+            if reason == "lost":
+                # 租约已被其他工作进程接手，由对方写入状态
+                logger.warning(f"执行 {job.job_id} 的租约已失效，放弃运行")
+                return
+            if reason == "cancel":
+                self._publish_status(execution, status="cancelled", current_task="已取消")
+                await self._finish(job, execution, "cancelled")
+                logger.info(f"执行已取消: {job.job_id}")
+                return
+            self._publish_status(execution, status="queued", current_task="等待重新运行")
+            await self._flush()
+            await asyncio.to_thread(self.job_queue.release, job, "工作进程退出", False)
+            logger.info(f"工作进程退出，执行 {job.job_id} 已放回队列")
+            return
+        except Exception as e:
+            logger.error(f"执行 {job.job_id} 异常退出: {str(e)}")
+            self._publish_status(execution, status="error", current_task="系统错误", progress=0)
+            await self._flush()
+            status = await asyncio.to_thread(self.job_queue.release, job, f"{type(e).__name__}: {e}")
+            if status == "queued":
+                logger.info(f"执行 {job.job_id} 已放回队列，剩余 {job.max_attempts - job.attempt} 次尝试")
+            return
+        await self._finish(job, execution, execution.status if execution.finished else "completed")
+
+    async def _flush(self):
+        # 先提交状态和事件再结束任务，Web应用读取到结束状态时数据已经完整
+        await asyncio.to_thread(self.store.flush, 30)
+        await asyncio.to_thread(self.job_queue.flush, 30)
+
+    async def _finish(self, job, execution, status):
+        self.store.save_execution(execution.state.current.header())
+        await self._flush()
+        result = execution.state.current.to_dict()
+        if not await asyncio.to_thread(self.job_queue.finish, job, status, result):
+            logger.warning(f"执行 {job.job_id} 结束时租约已失效，结果未写回")
+
+    def _start(self, job):
+        execution = Execution(
+            job.job_id, job.payload.get("model"), firehose=JobEventSink(self.job_queue, job.job_id),
+            log_capacity=self.log_capacity
+        )
+        task = asyncio.ensure_future(self._run_job(job, execution))
+        execution.task = task
+        self._running[job.job_id] = (job, execution, task)
+        task.add_done_callback(lambda _: self._running.pop(job.job_id, None))
+
+    async def _heartbeat(self):
+        """为进行中的执行续约；已请求取消或租约失效时取消对应的执行"""
+        for job_id, (job, execution, task) in list(self._running.items()):
+            state = await asyncio.to_thread(self.job_queue.heartbeat, job, self.visibility_timeout)
+            if state != "ok" and job_id not in self._cancel_reasons:
+                self._cancel_reasons[job_id] = state
+                task.cancel()
+        await asyncio.to_thread(self.job_queue.worker_heartbeat, self.worker_id, len(self._running))
+
+    async def run(self):
+        """运行直到stop()被调用：空闲槽位有任务时立即租用，否则按poll_interval轮询"""
+        self._stopping = asyncio.Event()
+        await asyncio.to_thread(self.job_queue.register_worker, self.worker_id, self.slots)
+        logger.info(f"工作进程已启动: {self.worker_id}（{self.slots}个槽位）")
+        heartbeat_interval = self.visibility_timeout / 3
+        next_heartbeat = time.monotonic() + heartbeat_interval
+        try:
+            while not self._stopping.is_set():
+                while len(self._running) < self.slots:
+                    job = await asyncio.to_thread(self.job_queue.lease, self.worker_id, self.visibility_timeout)
+                    if job is None:
+                        break
+                    logger.info(f"已租用执行: {job.job_id}（第{job.attempt}次尝试）")
+                    self._start(job)
+                if time.monotonic() >= next_heartbeat:
+                    await self._heartbeat()
+                    next_heartbeat = time.monotonic() + heartbeat_interval
+                # 有执行结束（槽位空出）、到达轮询间隔或收到停止信号时继续
+                waiters = [task for _, _, task in self._running.values()]
+                stopping = asyncio.ensure_future(self._stopping.wait())
+                timeout = min(self.poll_interval, max(next_heartbeat - time.monotonic(), 0))
+                await asyncio.wait(waiters + [stopping], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                stopping.cancel()
+        finally:
+            tasks = [task for _, _, task in self._running.values()]
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.wait(tasks, timeout=self.visibility_timeout)
+            await asyncio.to_thread(self.job_queue.unregister_worker, self.worker_id)
+            logger.info(f"工作进程已退出: {self.worker_id}")
+
+
+def worker_main(target_spec, slots, visibility_timeout, poll_interval):
+    """单个工作进程的入口"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s')
+    worker = Worker(
+        get_shared_job_queue(), get_shared_execution_store(), load_target(target_spec),
+        slots=slots, visibility_timeout=visibility_timeout, poll_interval=poll_interval,
+        log_capacity=int(os.getenv("LOG_BUFFER_SIZE", "1000"))
+    )
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, worker.stop)
+        await worker.run()
+
+    asyncio.run(serve())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", type=int, default=int(os.getenv("WORKER_PROCESSES", "1")), help="工作进程数")
+    parser.add_argument("--slots", type=int, default=int(os.getenv("WORKER_SLOTS", "2")),
+                        help="每个进程同时运行的执行数")
+    parser.add_argument("--visibility-timeout", type=float, default=float(os.getenv("JOB_VISIBILITY_TIMEOUT", "60")),
+                        help="租约时长（秒），工作进程失联超过该时长后任务被重新租用")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="队列为空时的轮询间隔（秒）")
+    parser.add_argument("--target", default="crewai_web_app:run_multi_agent_system", help="执行函数（模块:函数）")
+    args = parser.parse_args()
+    if args.processes < 1 or args.slots < 1:
+        parser.error("--processes和--slots必须大于等于1")
+
+    worker_args = (args.target, args.slots, args.visibility_timeout, args.poll_interval)
+    if args.processes == 1:
+        worker_main(*worker_args)
+        return
+
+    # 子进程与父进程同属一个进程组，Ctrl+C会同时送达各子进程，由子进程各自退出
+    processes = [
+        multiprocessing.Process(target=worker_main, args=worker_args, name=f"worker-{index}")
+        for index in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    def terminate(signum, frame):
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.join()
+    sys.exit(max((process.exitcode or 0) for process in processes))
+
+
+if __name__ == "__main__":
+    main()